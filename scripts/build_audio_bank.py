@@ -0,0 +1,123 @@
+"""
+Compiles the alert profile's clips into one memory-mappable bank in the mixer's native
+format (44100 Hz, 16-bit, stereo by default): silence trimmed, loudness normalised,
+resampled once here instead of by SDL at every start. With --tts, the profile's fixed
+TTS prompts (the rest prompt) are rendered too, so they play without gTTS or MP3 decoding.
+--greet "Full Name" (repeatable) adds the startup greeting for that driver, which is what
+lets the cached greeting play at boot before the network is up.
+A clip with "normalize": false in the profile keeps its own level.
+
+AudioService picks the bank up automatically and falls back to the loose files when it
+is missing, stale or built for another format.
+
+Examples (from the project root):
+    python scripts/build_audio_bank.py
+    python scripts/build_audio_bank.py --tts --target-dbfs -18
+    python scripts/build_audio_bank.py --tts --greet "Nguyễn Văn A"
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.alert_profile import DEFAULT_PROFILE_PATH
+from services.audio_bank import (DEFAULT_BANK_PATH, convert_pcm, load_wav, normalize, trim_silence,
+                                 tts_key, write_bank)
+from services.firebase_service import build_greeting
+
+
+def render_tts(text, lang, rate, channels):
+    """gTTS MP3 -> native PCM, decoded once by pygame with the mixer opened in the target format."""
+    import tempfile
+    from gtts import gTTS
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=rate, size=-16, channels=channels)
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+        path = f.name
+    try:
+        gTTS(text=text, lang=lang).save(path)
+        return pygame.mixer.Sound(path).get_raw()
+    finally:
+        os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the audio bank")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE_PATH)
+    parser.add_argument("--out", default=DEFAULT_BANK_PATH)
+    parser.add_argument("--rate", type=int, default=44100, help="must match AudioService's mixer")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--target-dbfs", type=float, default=-12.0, help="target RMS level")
+    parser.add_argument("--peak-dbfs", type=float, default=-1.0, help="peak ceiling")
+    parser.add_argument("--silence-dbfs", type=float, default=-45.0, help="trim threshold")
+    parser.add_argument("--no-trim", action="store_true")
+    parser.add_argument("--no-normalize", action="store_true")
+    parser.add_argument("--tts", action="store_true", help="also render fixed TTS prompts (needs gTTS, pygame, network)")
+    parser.add_argument("--lang", default="vi")
+    parser.add_argument("--greet", action="append", default=[], metavar="FULL_NAME",
+                        help="with --tts, also render this driver's startup greeting (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.profile, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    assets_path = raw.get("assets_path", "assets/audios")
+
+    entries = {}
+    total_in = 0
+    for name, clip in raw.get("clips", {}).items():
+        path = os.path.join(assets_path, clip.get("file"))
+        source = os.path.basename(path)  # Bank key: AudioService looks clips up by file name
+        if source in entries:
+            continue
+        try:
+            data, width, channels, rate = load_wav(path)
+        except Exception as e:
+            print(f"[AudioBank] Skipping clip '{name}' ({path}): {e}")
+            continue
+        total_in += len(data)
+        pcm = convert_pcm(data, width, channels, rate, args.rate, args.channels)
+        trimmed = 0.0
+        if not args.no_trim:
+            pcm, trimmed = trim_silence(pcm, 2, args.channels, args.rate, args.silence_dbfs)
+        gain_db = 0.0
+        if not args.no_normalize and clip.get("normalize", True):
+            pcm, gain_db = normalize(pcm, 2, args.target_dbfs, args.peak_dbfs)
+        st = os.stat(path)
+        entries[source] = (pcm, {"source": source, "source_size": st.st_size, "source_mtime": int(st.st_mtime),
+                                 "gain_db": round(gain_db, 2), "trimmed_s": round(trimmed, 3)})
+        print(f"[AudioBank] {source:<36} {rate} Hz/{channels} ch/{width * 8} bit -> "
+              f"{len(pcm) / float(args.rate * args.channels * 2):5.2f} s, gain {gain_db:+5.1f} dB, "
+              f"trimmed {trimmed * 1000:4.0f} ms")
+
+    if args.tts:
+        prompt = (raw.get("escalation") or {}).get("rest_prompt")
+        texts = [prompt["text"]] if prompt and prompt.get("text") else []
+        texts += [build_greeting(name, is_startup=True) for name in args.greet]
+        for text in texts:
+            try:
+                pcm = render_tts(text, args.lang, args.rate, args.channels)
+            except Exception as e:
+                print(f"[AudioBank] Could not render TTS '{text}': {e}")
+                continue
+            if not args.no_trim:
+                pcm, _ = trim_silence(pcm, 2, args.channels, args.rate, args.silence_dbfs)
+            if not args.no_normalize:
+                pcm, _ = normalize(pcm, 2, args.target_dbfs, args.peak_dbfs)
+            entries[tts_key(text, args.lang)] = (pcm, {"text": text, "lang": args.lang})
+            print(f"[AudioBank] TTS '{text[:40]}...' -> {len(pcm) / float(args.rate * args.channels * 2):5.2f} s")
+
+    if not entries:
+        print("[AudioBank] Nothing to build.")
+        sys.exit(1)
+    write_bank(args.out, entries, args.rate, args.channels, 2)
+    print(f"[AudioBank] Wrote {args.out}: {len(entries)} entries, {os.path.getsize(args.out) / 1024:.0f} KB "
+          f"(sources {total_in / 1024:.0f} KB).")
+
+
+if __name__ == "__main__":
+    main()
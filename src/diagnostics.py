@@ -0,0 +1,373 @@
+"""
+Field diagnostics for the device, built on the services main.py runs (SosService,
+LedService, AudioService) instead of re-implementing them.
+
+    gps    time to first NMEA sentence and first fix through SosService's GPS reader,
+           optionally after a hot/warm/cold receiver restart
+    api    DNS, TCP connect, TLS handshake and time to first byte for the alert API and IP
+           geolocation, plus the full IP-geo lookup; --send-sos also posts a real SOS
+    audio  trigger -> mixer start latency per alert (in-process or the audio worker), and the
+           output estimate with the mixer buffer added
+    led    set_effect() -> frame written to GPIO, and the GPIO call cost
+    sos    waits for real button presses and times each one end to end (what the old
+           control_button*.py scripts were used for); Ctrl+C to finish
+    all    gps, api, audio and led
+
+Every run writes a JSON report (device, versions, per-check samples and p50/p95/max) to
+data/diagnostics/<device>-<time>.json, or --out.
+
+Examples (from the project root, on the device):
+    python3 src/diagnostics.py all
+    python3 src/diagnostics.py gps --restart cold --timeout 300
+    python3 src/diagnostics.py api --count 10 --send-sos
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import socket
+import ssl
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+from services.sos_service import DEFAULT_DEVICE_ID
+
+# Config
+ASSETS_PATH = r"assets/audios"
+REPORT_DIR = r"data/diagnostics"
+LED_TEST_PIN = 32
+AUDIO_TEST_ALERTS = (("sleepy_eye", 1), ("phone", None), ("look_away", None), ("sleepy_eye", 3))
+
+
+def summarize(samples):
+    """p50/p95/max in ms of a list of seconds."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(statistics.median(ordered) * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def _read_first_line(path):
+    try:
+        with open(path, "rb") as f:
+            return f.readline().replace(b"\x00", b"").decode("utf-8", "replace").strip()
+    except OSError:
+        return None
+
+
+def device_info(device_id):
+    return {
+        "device_id": device_id,
+        "hostname": socket.gethostname(),
+        "model": _read_first_line("/proc/device-tree/model"),
+        "l4t": _read_first_line("/etc/nv_tegra_release"),
+        "kernel": platform.release(),
+        "python": platform.python_version(),
+    }
+
+
+# ---------- GPS ----------
+
+def check_gps(args):
+    import serial
+    from services.gps_config import cfg_rst
+    from services.sos_service import SosService
+
+    sos = SosService(device_id=args.device_id)
+    sos.GPS_CONFIGURE = not args.no_configure
+    if args.restart:
+        try:
+            with serial.Serial(sos.GPS_PORT, sos.GPS_BAUDRATE, timeout=sos.GPS_TIMEOUT) as ser:
+                ser.write(cfg_rst(args.restart))
+                ser.flush()
+            print(f"[Diagnostics] GPS {args.restart} restart sent.")
+            time.sleep(1.0)  # The receiver drops the port while it restarts (USB)
+        except Exception as e:
+            return {"error": f"restart failed: {e}"}
+
+    first_sentence = []
+    on_nmea = sos._on_nmea
+
+    def record(line, pynmea2):
+        if not first_sentence:
+            first_sentence.append(time.monotonic())
+        on_nmea(line, pynmea2)
+    sos._on_nmea = record
+
+    t0 = time.monotonic()
+    sos.running = True
+    threading.Thread(target=sos._gps_loop, name="GpsReader", daemon=True).start()
+    print(f"[Diagnostics] Waiting up to {args.timeout:.0f}s for a GPS fix on {sos.GPS_PORT}...")
+    fixed = sos.fix_event.wait(args.timeout)
+    ttff = time.monotonic() - t0
+    sos.running = False
+
+    result = {
+        "port": sos.GPS_PORT,
+        "restart": args.restart,
+        "configured": sos.GPS_CONFIGURE,
+        "first_sentence_s": round(first_sentence[0] - t0, 3) if first_sentence else None,
+        "ttff_s": round(ttff, 3) if fixed else None,
+        "fix": list(sos.last_fix) if fixed else None,
+    }
+    if not fixed:
+        result["error"] = "no fix" if first_sentence else "no NMEA data"
+    return result
+
+
+# ---------- API ----------
+
+def probe_endpoint(url, timeout):
+    """One fresh connection: DNS, TCP connect, TLS handshake, HEAD request -> first response byte."""
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    timings = {}
+
+    t0 = time.perf_counter()
+    infos = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    t1 = time.perf_counter()
+    timings["dns"] = t1 - t0
+    sock = socket.create_connection(infos[0][4][:2], timeout=timeout)
+    t2 = time.perf_counter()
+    timings["connect"] = t2 - t1
+    try:
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+            t3 = time.perf_counter()
+            timings["tls"] = t3 - t2
+            timings["tls_version"] = sock.version()
+            t2 = t3
+        request = (f"HEAD {parts.path or '/'} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+                   f"User-Agent: ck-diagnostics\r\nConnection: close\r\n\r\n")
+        sock.sendall(request.encode("ascii"))
+        first = sock.recv(64)
+        timings["ttfb"] = time.perf_counter() - t2
+        timings["status"] = first.split(b" ", 2)[1].decode("ascii", "replace") if first.count(b" ") >= 2 else None
+    finally:
+        sock.close()
+    return timings
+
+
+def check_api(args):
+    from services.sos_service import SosService
+
+    sos = SosService(device_id=args.device_id)
+    result = {}
+    for name, url in (("alert_api", sos.MAIN_API_URL), ("ip_geo", sos.IP_GEO_URL)):
+        samples = {"dns": [], "connect": [], "tls": [], "ttfb": []}
+        errors = []
+        extra = {}
+        for _ in range(args.count):
+            try:
+                timings = probe_endpoint(url, sos.API_TIMEOUT)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            for key in samples:
+                if key in timings:
+                    samples[key].append(timings[key])
+            extra = {"tls_version": timings.get("tls_version"), "status": timings.get("status")}
+            time.sleep(args.pause)
+        entry = dict(url=url, errors=errors, **extra)
+        entry.update({key: summarize(values) for key, values in samples.items() if values})
+        result[name] = entry
+        print(f"[Diagnostics] {name}: " + ", ".join(f"{key} {entry[key]['p50_ms']} ms" for key in samples
+                                                       if key in entry) + (f" ({len(errors)} errors)" if errors else ""))
+
+    lookups = []
+    for _ in range(args.count):
+        t0 = time.perf_counter()
+        lat, _, _ = sos._get_ip_coordinates()
+        if lat is not None:
+            lookups.append(time.perf_counter() - t0)
+    result["ip_geo_lookup"] = dict(summarize(lookups), failed=args.count - len(lookups))
+
+    if args.send_sos:
+        payload = sos.build_payload(None, None, "Diagnostics")
+        t0 = time.perf_counter()
+        delivered = sos._send(payload)
+        result["sos_post"] = {"delivered": delivered, "round_trip_ms": round((time.perf_counter() - t0) * 1000, 2)}
+        if sos.led_timer:
+            sos.led_timer.cancel()
+            sos._turn_off_led()
+    return result
+
+
+# ---------- Audio ----------
+
+def check_audio(args):
+    from services.audio_service import AudioService
+
+    audio = AudioService(assets_path=ASSETS_PATH, use_worker=args.worker, buffer=args.buffer,
+                         worker_buffer=args.worker_buffer)
+    if audio.worker is not None and not audio.worker.wait_ready():
+        audio.close()
+        return {"error": "audio worker did not start"}
+    trigger = []
+    skipped = 0
+    try:
+        for i in range(args.count):
+            behavior, level = AUDIO_TEST_ALERTS[i % len(AUDIO_TEST_ALERTS)]
+            audio.current_priority = float('inf')
+            audio.last_played.clear()  # No profile cooldowns between test alerts
+            before = audio.worker.status()["latency_count"] if audio.worker else None
+            t0 = time.monotonic()
+            outcome = audio.play_sound(behavior, level, 1)
+            sent = time.monotonic() - t0
+            if outcome != "played":
+                skipped += 1
+                continue
+            if audio.worker is not None:
+                deadline = time.monotonic() + 1.0
+                status = audio.worker.status()
+                while status["latency_count"] == before and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                    status = audio.worker.status()
+                trigger.append(sent + status["latency_last"])
+            else:
+                trigger.append(audio.playback_stats()["latency_last"])
+            time.sleep(args.pause)
+        stats = audio.playback_stats()
+    finally:
+        audio.close()
+
+    buffer = args.worker_buffer if args.worker else args.buffer
+    buffer_s = buffer / 44100.0
+    return {
+        "mode": "worker" if args.worker else "in_process",
+        "buffer_frames": buffer,
+        "trigger": summarize(trigger),
+        "output_estimate": summarize([t + buffer_s for t in trigger]),
+        "skipped": skipped,
+        "underruns": stats["underruns"],
+    }
+
+
+# ---------- LED ----------
+
+def check_led(args):
+    from services.led_service import LedService
+
+    leds = LedService()
+    switch = []
+    try:
+        for i in range(args.count * 2):
+            applied = leds.frames_applied
+            t0 = time.perf_counter()
+            if i % 2:
+                leds.turn_off_all()
+            else:
+                leds.show([LED_TEST_PIN])
+            deadline = t0 + 1.0
+            while leds.frames_applied == applied and time.perf_counter() < deadline:
+                time.sleep(0.0002)
+            if leds.frames_applied != applied:
+                switch.append(time.perf_counter() - t0)
+            time.sleep(args.pause)
+        stats = leds.stats()
+    finally:
+        leds.cleanup()
+    return {
+        "pin": LED_TEST_PIN,
+        "switch": summarize(switch),
+        "gpio_call_avg_us": round(stats["avg_frame_us"], 1),
+        "gpio_call_max_us": round(stats["max_frame_us"], 1),
+        "missed": args.count * 2 - len(switch),
+    }
+
+
+# ---------- SOS button ----------
+
+def check_sos(args):
+    from services.sos_service import SosService
+
+    sos = SosService(device_id=args.device_id)
+    presses = []
+    handle = sos._handle_button_press
+
+    def timed_press():
+        t0 = time.perf_counter()
+        sent = sos.sent_count
+        handle()
+        presses.append({"seconds": round(time.perf_counter() - t0, 3), "delivered": sos.sent_count > sent})
+        print(f"[Diagnostics] Press {len(presses)} handled in {presses[-1]['seconds']:.2f}s "
+              f"({'delivered' if presses[-1]['delivered'] else 'queued'}).")
+    sos._handle_button_press = timed_press
+
+    sos.start()
+    print("[Diagnostics] Press the SOS button (Ctrl+C to finish).")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    sos.stop()
+    return {
+        "presses": presses,
+        "handling": summarize([p["seconds"] for p in presses]),
+        "stats": sos.stats(),
+    }
+
+
+CHECKS = {"gps": check_gps, "api": check_api, "audio": check_audio, "led": check_led, "sos": check_sos}
+ALL_CHECKS = ("gps", "api", "audio", "led")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device field diagnostics")
+    parser.add_argument("check", choices=sorted(CHECKS) + ["all"])
+    parser.add_argument("--device-id", default=DEFAULT_DEVICE_ID, help="id sent in SOS payloads (default: %(default)s)")
+    parser.add_argument("--out", help=f"report path (default: {REPORT_DIR}/<device>-<time>.json)")
+    parser.add_argument("--count", type=int, default=5, help="samples per measurement")
+    parser.add_argument("--pause", type=float, default=0.5, help="seconds between samples")
+    parser.add_argument("--timeout", type=float, default=120.0, help="gps: seconds to wait for a fix")
+    parser.add_argument("--restart", choices=("hot", "warm", "cold"), help="gps: restart the receiver first")
+    parser.add_argument("--no-configure", action="store_true", help="gps: skip the UBX setup / hot start injection")
+    parser.add_argument("--send-sos", action="store_true", help="api: also POST a real SOS (source Diagnostics)")
+    parser.add_argument("--worker", action="store_true", help="audio: use the audio worker process")
+    parser.add_argument("--buffer", type=int, default=4096, help="audio: in-process mixer buffer (frames)")
+    parser.add_argument("--worker-buffer", type=int, default=1024, help="audio: worker mixer buffer (frames)")
+    args = parser.parse_args()
+
+    names = ALL_CHECKS if args.check == "all" else (args.check,)
+    report = {
+        "device": device_info(args.device_id),
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "checks": {},
+    }
+    for name in names:
+        print(f"[Diagnostics] ---- {name} ----")
+        t0 = time.monotonic()
+        try:
+            result = CHECKS[name](args)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        result["duration_s"] = round(time.monotonic() - t0, 2)
+        report["checks"][name] = result
+        if "error" in result:
+            print(f"[Diagnostics] {name}: {result['error']}")
+
+    out = args.out
+    if not out:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(REPORT_DIR, f"{args.device_id}-{stamp}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["checks"], indent=2))
+    print(f"[Diagnostics] Report written to {out}")
+    sys.exit(1 if any("error" in r for r in report["checks"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
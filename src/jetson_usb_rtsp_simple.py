@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
+import json
 import os
+import socketserver
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
 import gi
 gi.require_version('Gst', '1.0')
 gi.require_version('GstRtspServer', '1.0')
 
-from gi.repository import Gst, GstRtspServer, GObject
+from gi.repository import Gst, GstRtspServer, GObject, GLib
 
 # ================== CẤU HÌNH ==================
 CAM_DEV = os.environ.get('CAM_DEV', '/dev/video0')
@@ -14,12 +19,286 @@ WIDTH = int(os.environ.get('WIDTH', '1920'))
 HEIGHT = int(os.environ.get('HEIGHT', '1080'))
 FPS = int(os.environ.get('FPS', '30'))          # phải khớp 30/1
 BITRATE = int(os.environ.get('BITRATE', '4000'))  # kbps
+KEY_INT_MAX = int(os.environ.get('KEY_INT_MAX', str(FPS)))  # GOP length in frames
 PORT = os.environ.get('PORT', '8554')
 MOUNT_POINT = os.environ.get('MOUNT_POINT', '/cam')
+# Encoder stats for the device client's SystemSampler (empty = disabled)
+STATS_PATH = os.environ.get('RTSP_STATS_PATH', '/tmp/ck_rtsp_stats.json')
+# Camera JPEGs served as-is (no decode): /snapshot.jpg and /mjpeg. MJPEG_PORT=0 disables it.
+MJPEG_HOST = os.environ.get('MJPEG_HOST', '127.0.0.1')
+MJPEG_PORT = int(os.environ.get('MJPEG_PORT', '8090'))
+MJPEG_MAX_FPS = float(os.environ.get('MJPEG_MAX_FPS', '5'))
+# BENCH=1: no camera; stamped test frames for tests/glass_to_glass.py
+BENCH = os.environ.get('BENCH', '0') == '1'
+# Frames allowed to wait in the encoder's appsrc; newer frames are dropped while it is this far behind
+APPSRC_MAX_FRAMES = int(os.environ.get('APPSRC_MAX_FRAMES', '2'))
 # ==============================================
 
+STAMP_BITS = 64
+# Narrowest frame that fits the stamp (64 blocks of at least 8 px)
+STAMP_MIN_WIDTH = STAMP_BITS * 8
+
+
+def stamp_block_size(width):
+    return max(8, width // STAMP_BITS)
+
+
+def write_stamp(y_plane, width, frame_no, ms):
+    """Draws frame_no (low 32 bits) and wall clock ms (low 32 bits) as white/black blocks across the top of a luma plane."""
+    block = stamp_block_size(width)
+    value = ((ms & 0xFFFFFFFF) << 32) | (frame_no & 0xFFFFFFFF)
+    row = b''.join((b'\xeb' if value >> bit & 1 else b'\x10') * block for bit in range(STAMP_BITS))
+    for y in range(block):
+        y_plane[y * width:y * width + len(row)] = row
+
+
+def read_stamp(gray, width):
+    """Inverse of write_stamp on a decoded GRAY8/luma frame. Returns (frame_no, ms)."""
+    block = stamp_block_size(width)
+    offset = (block // 2) * width + block // 2
+    value = 0
+    for bit in range(STAMP_BITS):
+        if gray[offset + bit * block] > 128:
+            value |= 1 << bit
+    return value & 0xFFFFFFFF, value >> 32
+
+
+def push_frame(appsrc, buf):
+    """
+    Pushes buf into the encoder's appsrc unless APPSRC_MAX_FRAMES frames are already queued
+    (appsrc itself queues without limit). Returns False when the frame was dropped.
+    """
+    if appsrc.get_property('current-level-bytes') >= APPSRC_MAX_FRAMES * buf.get_size():
+        return False
+    appsrc.emit('push-buffer', buf)
+    return True
+
+
+class EncoderStats:
+    """Counts x264enc output (fps, kbps) and input->output latency via pad probes, written to STATS_PATH every second."""
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self.bytes = 0
+        self.frames_total = 0
+        self.keyframes_total = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.pending = {}  # buffer pts -> monotonic time it entered the encoder
+        self.last_write = time.monotonic()
+
+    def attach(self, factory, media):
+        enc = media.get_element().get_by_name('enc')
+        if enc is None:
+            return
+        enc.get_static_pad('sink').add_probe(Gst.PadProbeType.BUFFER, self._on_input)
+        enc.get_static_pad('src').add_probe(Gst.PadProbeType.BUFFER, self._on_output)
+
+    def _on_input(self, pad, info):
+        if len(self.pending) > 300:
+            self.pending.clear()  # Encoder dropped frames; don't grow without bound
+        self.pending[info.get_buffer().pts] = time.monotonic()
+        return Gst.PadProbeReturn.OK
+
+    def _on_output(self, pad, info):
+        buf = info.get_buffer()
+        self.frames += 1
+        self.frames_total += 1
+        self.bytes += buf.get_size()
+        if not buf.has_flags(Gst.BufferFlags.DELTA_UNIT):
+            self.keyframes_total += 1
+        entered = self.pending.pop(buf.pts, None)
+        if entered is not None:
+            self.latency_sum += time.monotonic() - entered
+            self.latency_count += 1
+        return Gst.PadProbeReturn.OK
+
+    def write(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_write, 1e-3)
+        stats = {
+            'time': time.time(),
+            'fps': self.frames / elapsed,
+            'kbps': self.bytes * 8 / 1000 / elapsed,
+            'encode_latency_ms': (self.latency_sum / self.latency_count * 1000) if self.latency_count else None,
+            'frames_total': self.frames_total,
+            'keyframes_total': self.keyframes_total,
+        }
+        self.frames = self.bytes = self.latency_count = 0
+        self.latency_sum = 0.0
+        self.last_write = now
+        try:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f'[GST] stats write error: {e}')
+        return True  # keep the GLib timeout
+
+
+class FrameHub:
+    """
+    Owns the camera. A capture pipeline keeps the newest JPEG buffer (a reference, nothing is
+    copied or decoded per frame) and forwards every frame to the RTSP encoder's appsrc while
+    an RTSP client is connected.
+    """
+
+    def __init__(self):
+        self.latest = None          # Gst.Buffer holding one camera JPEG
+        self.latest_time = 0.0
+        self.frame_id = 0
+        self.condition = threading.Condition()
+        self.appsrc = None
+        self.pipeline = None
+        self.dropped = 0            # frames not pushed because the encoder was behind
+
+    def start(self):
+        self.pipeline = Gst.parse_launch(
+            f'v4l2src device={CAM_DEV} ! '
+            f'image/jpeg,width={WIDTH},height={HEIGHT},framerate={FPS}/1 ! '
+            'appsink name=jpeg_sink emit-signals=true max-buffers=1 drop=true sync=false'
+        )
+        self.pipeline.get_by_name('jpeg_sink').connect('new-sample', self._on_sample)
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message::error', self._on_error)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def _on_error(self, bus, message):
+        error, debug = message.parse_error()
+        print(f'[GST] capture error: {error.message} ({debug})')
+
+    def _on_sample(self, sink):
+        buf = sink.emit('pull-sample').get_buffer()
+        with self.condition:
+            self.latest = buf
+            self.latest_time = time.time()
+            self.frame_id += 1
+            self.condition.notify_all()
+        appsrc = self.appsrc
+        if appsrc is not None and not push_frame(appsrc, buf):
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                print(f'[GST] encoder behind, dropped {self.dropped} camera frames so far')
+        return Gst.FlowReturn.OK
+
+    def attach(self, factory, media):
+        """media-configure: route camera frames into this RTSP media's appsrc."""
+        self.appsrc = media.get_element().get_by_name('camsrc')
+        media.connect('unprepared', self._detach)
+
+    def _detach(self, media):
+        self.appsrc = None
+
+    def jpeg(self):
+        """(bytes, frame_id, capture time) of the newest frame, or (None, 0, 0)."""
+        with self.condition:
+            buf, frame_id, captured = self.latest, self.frame_id, self.latest_time
+        if buf is None:
+            return None, 0, 0.0
+        return buf.extract_dup(0, buf.get_size()), frame_id, captured
+
+    def wait_newer(self, frame_id, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.frame_id != frame_id, timeout)
+
+
+class BenchSource:
+    """BENCH=1 replacement for FrameHub: pushes stamped I420 frames at FPS (measures encode + network + decode)."""
+
+    def __init__(self):
+        self.appsrc = None
+        self.frame_no = 0
+        y_size = WIDTH * HEIGHT
+        self.frame = bytearray(b'\x10' * y_size + b'\x80' * (y_size // 2))
+
+    def attach(self, factory, media):
+        self.appsrc = media.get_element().get_by_name('camsrc')
+        media.connect('unprepared', self._detach)
+
+    def _detach(self, media):
+        self.appsrc = None
+
+    def start(self):
+        threading.Thread(target=self._loop, name='bench', daemon=True).start()
+
+    def _loop(self):
+        interval = 1.0 / FPS
+        next_tick = time.monotonic()
+        while True:
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+            appsrc = self.appsrc
+            if appsrc is None:
+                continue
+            self.frame_no += 1
+            write_stamp(self.frame, WIDTH, self.frame_no, int(time.time() * 1000))
+            push_frame(appsrc, Gst.Buffer.new_wrapped(bytes(self.frame)))
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """http.server.ThreadingHTTPServer is 3.7+; JetPack 4's python3 is 3.6."""
+    daemon_threads = True
+
+
+def serve_mjpeg(hub):
+    min_interval = 1.0 / MJPEG_MAX_FPS if MJPEG_MAX_FPS > 0 else 0.0
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/snapshot.jpg'):
+                data, frame_id, captured = hub.jpeg()
+                if data is None:
+                    self.send_error(503, 'no frame yet')
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(data)))
+                self.send_header('X-Frame-Age-Ms', f'{(time.time() - captured) * 1000:.0f}')
+                self.end_headers()
+                self.wfile.write(data)
+            elif self.path.startswith('/mjpeg'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                last_id = 0
+                try:
+                    while True:
+                        started = time.monotonic()
+                        hub.wait_newer(last_id, 2.0)
+                        data, last_id, captured = hub.jpeg()
+                        if data is None:
+                            continue
+                        # X-Capture-Time lets the on-device detector measure capture -> alert latency
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n'
+                                         + f'Content-Length: {len(data)}\r\nX-Capture-Time: {captured:.3f}\r\n\r\n'.encode()
+                                         + data + b'\r\n')
+                        delay = min_interval - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            else:
+                self.send_error(404)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((MJPEG_HOST, MJPEG_PORT), Handler)
+    threading.Thread(target=server.serve_forever, name='mjpeg', daemon=True).start()
+    return server
+
 
 def main():
+    if BENCH and WIDTH < STAMP_MIN_WIDTH:
+        print(f'[GST] BENCH needs WIDTH >= {STAMP_MIN_WIDTH} for the frame stamp (got {WIDTH})')
+        sys.exit(2)
     Gst.init(None)
 
     server = GstRtspServer.RTSPServer()
@@ -27,35 +306,60 @@ def main():
 
     factory = GstRtspServer.RTSPMediaFactory()
 
-    # MJPEG -> jpegdec -> raw -> x264enc -> RTP
-    pipeline_str = (
-        f'( v4l2src device={CAM_DEV} ! '
-        f'image/jpeg,width={WIDTH},height={HEIGHT},framerate={FPS}/1 ! '
-        'jpegdec ! '
-        'videoconvert ! '
-        'video/x-raw,format=I420 ! '
-        f'x264enc tune=zerolatency speed-preset=ultrafast bitrate={BITRATE} key-int-max={FPS} ! '
+    encoder = (
+        f'x264enc tune=zerolatency speed-preset=ultrafast bitrate={BITRATE} key-int-max={KEY_INT_MAX} name=enc ! '
         'rtph264pay name=pay0 pt=96 config-interval=1 )'
     )
+    if BENCH:
+        hub = BenchSource()
+        pipeline_str = (
+            '( appsrc name=camsrc is-live=true do-timestamp=true format=time '
+            f'caps=video/x-raw,format=I420,width={WIDTH},height={HEIGHT},framerate={FPS}/1 ! '
+            + encoder
+        )
+    else:
+        hub = FrameHub()
+        # Camera JPEG (from FrameHub) -> jpegdec -> raw -> x264enc -> RTP
+        pipeline_str = (
+            '( appsrc name=camsrc is-live=true do-timestamp=true format=time '
+            f'caps=image/jpeg,width={WIDTH},height={HEIGHT},framerate={FPS}/1 ! '
+            'jpegdec ! '
+            'videoconvert ! '
+            'video/x-raw,format=I420 ! '
+            + encoder
+        )
 
     print(f'[GST] launch: {pipeline_str}')
     factory.set_launch(pipeline_str)
     factory.set_shared(True)
+    factory.connect('media-configure', hub.attach)
+
+    if STATS_PATH:
+        encoder_stats = EncoderStats(STATS_PATH)
+        factory.connect('media-configure', encoder_stats.attach)
+        GLib.timeout_add_seconds(1, encoder_stats.write)
 
     mounts = server.get_mount_points()
     mounts.add_factory(MOUNT_POINT, factory)
 
     server.attach(None)
+    hub.start()
+    if MJPEG_PORT and not BENCH:
+        serve_mjpeg(hub)
 
     rtsp_url = f'rtsp://<IP_JETSON>:{PORT}{MOUNT_POINT}'
     print('==============================================')
     print('   JETSON USB CAMERA RTSP SERVER (MJPEG->H264)')
     print('==============================================')
-    print(f'- Device  : {CAM_DEV}')
+    print(f'- Device  : {"BENCH (stamped test frames)" if BENCH else CAM_DEV}')
     print(f'- Size    : {WIDTH}x{HEIGHT}')
     print(f'- FPS     : {FPS}')
     print(f'- Bitrate : {BITRATE} kbps')
+    print(f'- Keyint  : {KEY_INT_MAX}')
     print(f'- RTSP URL: {rtsp_url}')
+    if MJPEG_PORT and not BENCH:
+        print(f'- Snapshot: http://{MJPEG_HOST}:{MJPEG_PORT}/snapshot.jpg')
+        print(f'- MJPEG   : http://{MJPEG_HOST}:{MJPEG_PORT}/mjpeg (max {MJPEG_MAX_FPS} fps)')
     print('==============================================')
     print('Nhấn Ctrl+C để dừng.')
 
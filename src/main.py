@@ -3,48 +3,389 @@ import time
 import signal
 import sys
 import subprocess
-from services.firebase_service import FirebaseService
-from services.audio_service import AudioService
-from services.led_service import LedService
-from services.sos_service import SosService
+from concurrent.futures import ThreadPoolExecutor
+from services.boot_timeline import BootTimeline
+from services.doc_cache import DocCache
+from services import profiler
+
+# Heavy modules (pygame, firebase_admin/grpc, requests, serial, pynmea2) are imported
+# inside the boot phases below so independent services can load concurrently.
 
 # Config
 CRED_PATH = r"src/configs/lucky-union-472503-c7-firebase-adminsdk-fbsvc-708fc927d9.json"
 ASSETS_PATH = r"assets/audios"
+# Play audio from a separate real-time child process (smaller mixer buffer, no GIL contention)
+AUDIO_WORKER = False
+AUDIO_BUFFER = 4096
+AUDIO_WORKER_BUFFER = 1024
+RTSP_SCRIPT = r"src/jetson_usb_rtsp_simple.py"
+# Local alert ingest (use "0.0.0.0" to accept alerts from a detector on the LAN)
+INGEST_UDP_HOST = "127.0.0.1"
+INGEST_UDP_PORT = 5055
+INGEST_UNIX_PATH = "/tmp/ck_alerts.sock"
+# Prometheus /metrics and JSON /status (use "0.0.0.0" to let a LAN Prometheus scrape it)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+# On-demand profiler: kill -USR1 <pid> samples for PROFILE_SECONDS, kill -USR2 toggles hot-path timing
+PROFILE_SECONDS = 30
+# CPU/memory/thermal/clock sampler (ring of SYSTEM_SAMPLE_CAPACITY samples)
+SYSTEM_SAMPLE_INTERVAL = 1.0
+SYSTEM_SAMPLE_CAPACITY = 600
+# Playback outcomes written back to users/{uid}/histories in batches
+ACK_FLUSH_INTERVAL = 10.0
+ACK_MAX_BATCH = 50
+# presence/{deviceId} heartbeat: fast after a change, backing off to the max when idle
+PRESENCE_MIN_INTERVAL = 30.0
+PRESENCE_MAX_INTERVAL = 300.0
+# Local alert/SOS history (SQLite): a new trip after TRIP_GAP seconds without alerts
+TRIP_DB_PATH = r"data/trips.db"
+TRIP_GAP = 1800.0
+TRIP_RETENTION_DAYS = 30
+TRIP_MAX_BYTES = 50 * 1024 * 1024
+# CPU affinity / scheduling per role (RTSP child, audio, Firestore listener, SOS input).
+# None uses services.placement.DEFAULT_PLACEMENT (quad-core Nano layout).
+CPU_PLACEMENT_ENABLED = True
+CPU_PLACEMENT = None
+# On-device behavior detection from the RTSP process's MJPEG branch (services.detector).
+# DETECTOR_PLUGIN: "cpu_reference", "stub" or "package.module:ClassName".
+DETECTOR_ENABLED = False
+DETECTOR_PLUGIN = "cpu_reference"
+DETECTOR_OPTIONS = {}
+DETECTOR_URL = "http://127.0.0.1:8090/mjpeg"
+DETECTOR_MAX_FPS = 5.0
+DETECTOR_QUEUE_SIZE = 1
+DETECTOR_MAX_AGE = 0.5
 
-def main():
-    print("Starting Device Client...")
-    
-    display_led_service = LedService()
-    sos_service = SosService()
-    rtsp_process = None
-    
-    # Initialize Audio Service
-    audio_service = AudioService(assets_path=ASSETS_PATH, led_service=display_led_service)
-    
-    # Initialize Firebase Service
+
+def _init_alert_path(boot):
+    """GPIO LEDs + audio mixer + alert profile: everything needed to play the first alert."""
+    with boot.phase("import_audio"):
+        from services.led_service import LedService
+        from services.audio_service import AudioService
+
+    with boot.phase("gpio_leds"):
+        display_led_service = LedService()
+
+    with boot.phase("audio_mixer_profile"):
+        audio_service = AudioService(assets_path=ASSETS_PATH, led_service=display_led_service,
+                                     use_worker=AUDIO_WORKER, buffer=AUDIO_BUFFER, worker_buffer=AUDIO_WORKER_BUFFER)
+    boot.mark("alert path ready")
+
+    with boot.phase("clip_preload"):
+        audio_service.preload()
+    return display_led_service, audio_service
+
+
+def _start_local_ingest(boot, audio_service):
+    """Local alert socket: works as soon as the alert path is ready, even with no network."""
+    with boot.phase("local_ingest"):
+        from services.alert_dispatcher import AlertDispatcher
+        from services.escalation import EscalationEngine
+        from services.ingest_service import IngestService
+        dispatcher = AlertDispatcher(audio_service)
+        dispatcher.trip_store = _start_trip_store(audio_service)
+        dispatcher.escalation = EscalationEngine(audio_service.profile, audio_service, dispatcher.trip_store)
+        ingest_service = IngestService(dispatcher, udp_host=INGEST_UDP_HOST, udp_port=INGEST_UDP_PORT,
+                                       unix_path=INGEST_UNIX_PATH)
+        try:
+            ingest_service.start()
+        except OSError as e:
+            print(f"[Main] Local ingest unavailable: {e}")
+    return dispatcher, ingest_service
+
+
+def _start_trip_store(audio_service):
+    from services.trip_store import TripStore
+    try:
+        trip_store = TripStore(TRIP_DB_PATH, trip_gap=TRIP_GAP, retention_days=TRIP_RETENTION_DAYS,
+                               max_bytes=TRIP_MAX_BYTES)
+    except Exception as e:
+        print(f"[Main] Trip history unavailable: {e}")
+        return None
+    audio_service.on_preempted = trip_store.record_preempted
+    trip_store.start()
+    return trip_store
+
+
+def _register_trip_commands(ingest_service, metrics_service, trip_store):
+    if trip_store is None:
+        return
+    # {"cmd": "trip", "trip_id": 3}: per-behavior counts for a trip (default: the current one)
+    ingest_service.register_command("trip", lambda message: {
+        "ok": True,
+        "summary": trip_store.trip_summary(message.get("trip_id")),
+        "recent": trip_store.recent_trips(message.get("limit", 10)),
+    })
+    metrics_service.register_gauge("ck_trip_store", "Local trip history (rows written, queued, db bytes...)",
+                                   trip_store.stats, label="kind")
+
+
+def _start_system_sampler(dispatcher, ingest_service):
+    from services.system_sampler import SystemSampler
+    system_sampler = SystemSampler(interval=SYSTEM_SAMPLE_INTERVAL, capacity=SYSTEM_SAMPLE_CAPACITY)
+    system_sampler.start()
+    # {"cmd": "system", "seconds": 60}: latest samples + alert latency by system state
+    ingest_service.register_command("system", lambda message: {
+        "ok": True,
+        "correlation": system_sampler.correlate(dispatcher.traces),
+        "history": system_sampler.history(float(message.get("seconds", 10))),
+    })
+    return system_sampler
+
+
+def _start_placement(ingest_service, rtsp_process, audio_service):
+    from services.placement import PlacementManager
+    placement = PlacementManager(CPU_PLACEMENT)
+    if rtsp_process:
+        placement.register_process("rtsp", rtsp_process.pid)
+    if audio_service.worker is not None and audio_service.worker.process is not None:
+        placement.register_process("audio", audio_service.worker.process.pid)
+        # A restarted worker is a new pid
+        audio_service.on_worker_restarted = lambda pid: placement.register_process("audio", pid)
+    placement.start()
+    # {"cmd": "placement"} shows where every thread runs; {"cmd": "placement", "apply": true} re-applies first
+    def placement_command(message):
+        if message.get("apply"):
+            placement.apply()
+        return dict(placement.report(), ok=True)
+    ingest_service.register_command("placement", placement_command)
+    return placement
+
+
+def _start_detector(dispatcher, ingest_service, metrics_service):
+    from services.detector import DetectorService, load_plugin
     try:
-        firebase_service = FirebaseService(cred_path=CRED_PATH, audio_service=audio_service)
+        plugin = load_plugin(DETECTOR_PLUGIN, DETECTOR_OPTIONS)
+    except Exception as e:
+        print(f"[Main] Detector plugin unavailable: {e}")
+        return None
+    detector = DetectorService(plugin, dispatcher.dispatch, url=DETECTOR_URL, max_fps=DETECTOR_MAX_FPS,
+                               queue_size=DETECTOR_QUEUE_SIZE, max_age=DETECTOR_MAX_AGE)
+    detector.start()
+    # {"cmd": "detector"}: frame cost, skipped/dropped frames and capture -> dispatch latency
+    ingest_service.register_command("detector", lambda message: dict(detector.stats(), ok=True))
+    metrics_service.register_gauge("ck_detector", "On-device detector frames, events and latency (ms)",
+                                   detector.stats, label="kind")
+    return detector
+
+
+def _start_metrics(display_led_service, audio_service, dispatcher, firebase_service, sos_service, rtsp_process,
+                   system_sampler):
+    from services.metrics_service import MetricsService
+    metrics_service = MetricsService(host=METRICS_HOST, port=METRICS_PORT)
+    metrics_service.led_service = display_led_service
+    metrics_service.audio_service = audio_service
+    metrics_service.dispatcher = dispatcher
+    metrics_service.connectivity = firebase_service.connectivity if firebase_service else None
+    metrics_service.sos_service = sos_service
+    metrics_service.rtsp_process = rtsp_process
+    metrics_service.register_gauge("ck_hot_path_avg_seconds", "Average hot-path call time (while timing is enabled)",
+                                   lambda: {name: s["avg_ms"] / 1000 for name, s in profiler.timing_stats().items()},
+                                   label="path")
+    metrics_service.register_gauge("ck_hot_path_max_seconds", "Slowest hot-path call (while timing is enabled)",
+                                   lambda: {name: s["max_ms"] / 1000 for name, s in profiler.timing_stats().items()},
+                                   label="path")
+
+    def system_value(*fields):
+        latest = system_sampler.latest() or {}
+        return {field: latest[field] for field in fields if latest.get(field) is not None}
+
+    metrics_service.register_gauge("ck_system_cpu_percent", "CPU busy / iowait percent",
+                                   lambda: system_value("cpu_pct", "iowait_pct"), label="kind")
+    metrics_service.register_gauge("ck_system_memory_mb", "Memory used / available",
+                                   lambda: system_value("mem_used_mb", "mem_available_mb"), label="kind")
+    metrics_service.register_gauge("ck_system_clock_mhz", "CPU/GPU clocks (cpu_cap below max means throttling)",
+                                   lambda: system_value("cpu_freq_mhz", "cpu_cap_mhz", "gpu_freq_mhz"), label="clock")
+    metrics_service.register_gauge("ck_system_temperature_celsius", "Thermal zone temperatures",
+                                   lambda: {k[5:]: v for k, v in system_value(*system_sampler.fields).items()
+                                            if k.startswith("temp_")}, label="zone")
+    metrics_service.register_gauge("ck_rtsp_encoder", "RTSP encoder fps / kbps / latency_ms",
+                                   lambda: system_value("encoder_fps", "encoder_kbps", "encoder_latency_ms"),
+                                   label="stat")
+    try:
+        metrics_service.start()
+    except OSError as e:
+        print(f"[Main] Metrics endpoint unavailable: {e}")
+    return metrics_service
+
+
+def _start_ack_writer(firebase_service, dispatcher, audio_service):
+    from services.ack_writer import PlaybackAckWriter
+    ack_writer = PlaybackAckWriter(firebase_service.db, firebase_service.device_id,
+                                   flush_interval=ACK_FLUSH_INTERVAL, max_batch=ACK_MAX_BATCH,
+                                   connectivity=firebase_service.connectivity)
+    dispatcher.ack_writer = ack_writer
+    trip_store = dispatcher.trip_store
+    if trip_store is None:
+        audio_service.on_preempted = ack_writer.record_preempted
+    else:
+        def on_preempted(event_id):
+            trip_store.record_preempted(event_id)
+            ack_writer.record_preempted(event_id)
+        audio_service.on_preempted = on_preempted
+    ack_writer.start()
+    return ack_writer
+
+
+def _start_presence(firebase_service, dispatcher, sos_service, ack_writer, rtsp_process):
+    from services.presence_service import PresenceService, fix_state
+    started = time.monotonic()
+
+    def collect():
+        sos = sos_service.stats() if sos_service else {}
+        if rtsp_process is None:
+            rtsp = "not_started"
+        else:
+            rtsp = "running" if rtsp_process.poll() is None else "exited"
+        return {
+            "online": True,
+            "linkedUserId": firebase_service.linked_user_id,
+            "rtsp": rtsp,
+            "gps": fix_state(sos.get("last_fix_age")),
+            "sosOutbox": sos.get("outbox_depth", 0),
+            # Volatile: sent along with a heartbeat, never a reason for one
+            "acksPending": ack_writer.stats()["pending"],
+            "uptimeSeconds": int(time.monotonic() - started),
+            "alertsPlayed": sum(v for (_, kind), v in list(dispatcher.counts.items()) if kind == "dispatched"),
+        }
+
+    presence_service = PresenceService(
+        firebase_service.db.collection("presence").document(firebase_service.device_id), collect,
+        min_interval=PRESENCE_MIN_INTERVAL, max_interval=PRESENCE_MAX_INTERVAL,
+        volatile=("uptimeSeconds", "alertsPlayed", "acksPending"), connectivity=firebase_service.connectivity)
+    presence_service.start()
+    return presence_service
+
+
+def _greet_cached_user(boot, cache, audio_service):
+    """Greets the last linked user from the local document cache, before Firestore is reachable."""
+    with boot.phase("cached_greeting"):
+        from services.firebase_service import greet_from_cache
+        return greet_from_cache(cache, audio_service)
+
+
+def _init_firebase(boot, cache):
+    """Firestore client + device document (network bound, runs alongside the alert path)."""
+    with boot.phase("firebase_client"):
+        from services.firebase_service import FirebaseService
+        firebase_service = FirebaseService(cred_path=CRED_PATH, cache=cache)
+
+    with boot.phase("initialize_device"):
         firebase_service.initialize_device()
-        firebase_service.start_listening()
-        
-        # Start SOS Service (Button Monitor)
-        sos_service.start()
-        
-        # Start RTSP Camera Process
+    return firebase_service
+
+
+def _init_sos(boot, gpio_ready):
+    """SOS button monitor. Imports run in parallel; GPIO setup waits for the LED service to set the pin mode."""
+    with boot.phase("sos_imports"):
+        from services.sos_service import SosService
+        SosService.warm_imports()
+
+    gpio_ready.result()
+    with boot.phase("sos_gpio"):
+        sos_service = SosService()
+    return sos_service
+
+
+def _launch_rtsp(boot):
+    with boot.phase("rtsp_spawn"):
         print("[Main] Launching RTSP Server...")
         # CRITICAL: Use /usr/bin/python3 to access system GStreamer libraries (GI)
         # Virtualenvs often miss these bindings.
         python_exec = "/usr/bin/python3" if os.path.exists("/usr/bin/python3") else sys.executable
-        rtsp_process = subprocess.Popen([python_exec, "src/jetson_usb_rtsp_simple.py"])
+        rtsp_process = subprocess.Popen([python_exec, RTSP_SCRIPT])
         print(f"[Main] RTSP Server started with PID: {rtsp_process.pid} using {python_exec}")
-        
-    except Exception as e:
-        print(f"Failed to initialize Firebase Service: {e}")
-        return
+    return rtsp_process
+
+
+def _shutdown(display_led_service, sos_service, rtsp_process):
+    if display_led_service:
+        display_led_service.cleanup()
+    if sos_service:
+        sos_service.stop()
 
+    if rtsp_process:
+        print("[Main] Terminating RTSP Server...")
+        rtsp_process.terminate()
+        try:
+            rtsp_process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            rtsp_process.kill()
+
+
+def main():
+    print("Starting Device Client...")
+    boot = BootTimeline()
+
+    display_led_service = None
+    sos_service = None
+    rtsp_process = None
+
+    with boot.phase("doc_cache"):
+        cache = DocCache()
+
+    with ThreadPoolExecutor(max_workers=4, thread_name_prefix="boot") as pool:
+        alert_future = pool.submit(_init_alert_path, boot)
+        firebase_future = pool.submit(_init_firebase, boot, cache)
+        rtsp_future = pool.submit(_launch_rtsp, boot)
+        sos_future = pool.submit(_init_sos, boot, alert_future)
+
+        # Alert path first: nothing below is allowed to delay it
+        display_led_service, audio_service = alert_future.result()
+        # Pick up edits to src/configs/alert_profile.json without restarting
+        audio_service.profile.start_watching()
+        dispatcher, ingest_service = _start_local_ingest(boot, audio_service)
+        greeted_user_id = _greet_cached_user(boot, cache, audio_service)
+
+        try:
+            rtsp_process = rtsp_future.result()
+        except Exception as e:
+            print(f"[Main] Failed to launch RTSP Server: {e}")
+
+        # Initialize Firebase Service
+        try:
+            firebase_service = firebase_future.result()
+            firebase_service.audio_service = audio_service
+            firebase_service.dispatcher = dispatcher
+            firebase_service.greeted_user_id = greeted_user_id
+            ack_writer = _start_ack_writer(firebase_service, dispatcher, audio_service)
+            with boot.phase("start_listening"):
+                firebase_service.start_listening()
+
+            # Start SOS Service (Button Monitor)
+            sos_service = sos_future.result()
+            sos_service.trip_store = dispatcher.trip_store
+            sos_service.start()
+        except Exception as e:
+            print(f"Failed to initialize Firebase Service: {e}")
+            boot.report()
+            _shutdown(display_led_service, sos_service, rtsp_process)
+            return
+
+    sampling_profiler = profiler.SamplingProfiler()
+    profiler.install_signal_handlers(sampling_profiler, PROFILE_SECONDS)
+    profiler.register_commands(ingest_service, sampling_profiler)
+
+    system_sampler = _start_system_sampler(dispatcher, ingest_service)
+    presence_service = _start_presence(firebase_service, dispatcher, sos_service, ack_writer, rtsp_process)
+    metrics_service = _start_metrics(display_led_service, audio_service, dispatcher,
+                                     firebase_service, sos_service, rtsp_process, system_sampler)
+    metrics_service.register_gauge("ck_playback_acks", "Playback acknowledgements (recorded, written, pending...)",
+                                   ack_writer.stats, label="kind")
+    metrics_service.register_gauge("ck_presence", "Presence heartbeat (writes, checks, interval...)",
+                                   presence_service.stats, label="kind")
+    metrics_service.register_gauge("ck_audio_playback", "Mixer underruns and request to playback latency (s)",
+                                   audio_service.playback_stats, label="kind")
+    metrics_service.register_gauge("ck_alert_rate_window", "Alerts per behavior in its escalation window",
+                                   dispatcher.escalation.rates, label="behavior")
+    metrics_service.register_gauge("ck_escalation", "Escalated alerts per behavior and rest prompts",
+                                   dispatcher.escalation.stats, label="kind")
+    _register_trip_commands(ingest_service, metrics_service, dispatcher.trip_store)
+    detector = _start_detector(dispatcher, ingest_service, metrics_service) if DETECTOR_ENABLED else None
+    placement = _start_placement(ingest_service, rtsp_process, audio_service) if CPU_PLACEMENT_ENABLED else None
+    boot.report()
     print("Device Client Running. Press Ctrl+C to exit.")
-    
+
     # Keep main thread alive
     try:
         while True:
@@ -52,17 +393,21 @@ def main():
             audio_service.check_status()
     except KeyboardInterrupt:
         print("\nStopping Device Client...")
-        display_led_service.cleanup()
-        sos_service.stop()
-        
-        if rtsp_process:
-            print("[Main] Terminating RTSP Server...")
-            rtsp_process.terminate()
-            try:
-                rtsp_process.wait(timeout=2)
-            except subprocess.TimeoutExpired:
-                rtsp_process.kill()
-        
+        metrics_service.stop()
+        ingest_service.stop()
+        ack_writer.stop()
+        presence_service.stop()
+        dispatcher.print_report()
+        system_sampler.stop()
+        system_sampler.print_report(dispatcher.traces)
+        if dispatcher.trip_store:
+            dispatcher.trip_store.close()
+        audio_service.close()
+        if detector:
+            detector.stop()
+        if placement:
+            placement.stop()
+        _shutdown(display_led_service, sos_service, rtsp_process)
         sys.exit(0)
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+import collections
+import datetime
+import threading
+import time
+
+
+class PlaybackAckWriter:
+    """
+    Writes what happened to each alert ("played", "preempted", "ignored", "cooldown", ...) back
+    to its users/{uid}/histories document as a `playback` map.
+
+    Outcomes are keyed by event id, so an alert played from the local socket is acknowledged
+    once its Firestore copy (and so its document path) shows up. Pending acks are coalesced and
+    committed in WriteBatches every flush_interval seconds, or sooner when max_batch are waiting.
+    While Firestore is unreachable they stay buffered (bounded by max_pending) and are retried.
+    """
+
+    FIRESTORE_BATCH_LIMIT = 500
+    # Outcomes whose document path never appears (local-only events) are dropped after this
+    ORPHAN_TTL = 300.0
+
+    def __init__(self, db, device_id, flush_interval=10.0, max_batch=50, max_pending=2000, connectivity=None):
+        self.db = db
+        self.device_id = device_id
+        self.flush_interval = flush_interval
+        self.max_batch = min(max_batch, self.FIRESTORE_BATCH_LIMIT)
+        self.max_pending = max_pending
+        self.connectivity = connectivity
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+
+        self.paths = collections.OrderedDict()     # event_id -> document path
+        self.pending = collections.OrderedDict()   # event_id -> playback fields (not yet written)
+        self.recorded_at = {}                      # event_id -> monotonic time first recorded
+
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    # ---------- Recording (hot path: dict updates under a lock, no I/O) ----------
+
+    def attach_path(self, event_id, path):
+        """Called by the Firestore listener: event_id lives at document `path`."""
+        with self.lock:
+            self.paths[event_id] = path
+            self.paths.move_to_end(event_id)
+            while len(self.paths) > self.max_pending:
+                self.paths.popitem(last=False)
+
+    def record(self, event_id, outcome, source=None, created_at=None):
+        """Records the playback outcome of one event. A later outcome (e.g. preempted) overrides."""
+        if event_id is None:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self.lock:
+            entry = self.pending.get(event_id)
+            if entry is None:
+                if len(self.pending) >= self.max_pending:
+                    oldest, _ = self.pending.popitem(last=False)
+                    self.recorded_at.pop(oldest, None)
+                    self.dropped += 1
+                entry = self.pending[event_id] = {"deviceId": self.device_id}
+                self.recorded_at[event_id] = time.monotonic()
+                if source:
+                    # First sighting (from the dispatcher); a later preempted-only record may
+                    # follow an already written ack and must not move receivedAt
+                    entry["source"] = source
+                    entry["receivedAt"] = now
+                if created_at is not None:
+                    entry["latencyMs"] = round((now.timestamp() - created_at) * 1000, 1)
+            entry["outcome"] = outcome
+            entry["outcomeAt"] = now
+            if outcome == "played":
+                entry["playedAt"] = now
+            self.recorded += 1
+            ready = len(self.pending) >= self.max_batch
+        if ready:
+            self.wake.set()
+
+    def record_preempted(self, event_id):
+        self.record(event_id, "preempted")
+
+    # ---------- Flushing ----------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="AckWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stops the flush thread after one last flush attempt."""
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def _take_ready(self):
+        """Pops up to FIRESTORE_BATCH_LIMIT acks whose document path is known; expires orphans."""
+        ready = []
+        now = time.monotonic()
+        with self.lock:
+            for event_id in list(self.pending):
+                path = self.paths.get(event_id)
+                if path is not None:
+                    ready.append((event_id, path, self.pending.pop(event_id)))
+                    self.recorded_at.pop(event_id, None)
+                    if len(ready) >= self.FIRESTORE_BATCH_LIMIT:
+                        break
+                elif now - self.recorded_at.get(event_id, now) > self.ORPHAN_TTL:
+                    del self.pending[event_id]
+                    del self.recorded_at[event_id]
+        return ready
+
+    def _requeue(self, ready):
+        with self.lock:
+            for event_id, _, fields in ready:
+                newer = self.pending.get(event_id)
+                if newer:
+                    first = {key: fields[key] for key in ("source", "receivedAt", "latencyMs") if key in fields}
+                    fields.update(newer)  # Newest outcome, first sighting details
+                    fields.update(first)
+                self.pending[event_id] = fields
+                self.pending.move_to_end(event_id, last=False)
+                self.recorded_at.setdefault(event_id, time.monotonic())
+
+    def flush(self):
+        """Commits every ready ack. Returns the number written (0 while offline)."""
+        if self.connectivity is not None and not self.connectivity.connected:
+            return 0
+        written = 0
+        while True:
+            ready = self._take_ready()
+            if not ready:
+                return written
+            batch = self.db.batch()
+            for _, path, fields in ready:
+                batch.set(self.db.document(path), {"playback": fields}, merge=True)
+            try:
+                batch.commit()
+            except Exception as e:
+                self.failures += 1
+                self._requeue(ready)
+                print(f"[AckWriter] Batch of {len(ready)} failed, kept for retry: {e}")
+                return written
+            self.batches += 1
+            self.written += len(ready)
+            written += len(ready)
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,144 @@
+import collections
+import threading
+import time
+from services.metrics_service import Histogram
+
+
+def _normalize_level(level):
+    """Firestore delivers levels as "2", the local path as 2: one int for dedup keys and everything downstream."""
+    if level is None:
+        return None
+    try:
+        return int(level)
+    except (TypeError, ValueError):
+        return level  # The profile lookup falls back to the behavior default
+
+
+class AlertDispatcher:
+    """
+    Single entry point for alerts, whatever path they arrived on (Firestore listener, local
+    ingest socket, ...). Drops duplicates of the same event seen on another path and
+    records detection-to-audio latency per source.
+    """
+
+    # Events carrying an id are remembered this long (the Firestore copy can lag by seconds)
+    DEDUP_WINDOW = 120.0
+    # Unseen id (or none): same (behavior, level) on a *different* source within this window is a
+    # duplicate. Ids alone can't match across paths: Firestore falls back to the doc id when the
+    # sender wrote no eventId, and a local event may carry none or its own uuid.
+    FALLBACK_WINDOW = 3.0
+    LATENCY_SAMPLES = 512
+
+    def __init__(self, audio_service):
+        self.audio_service = audio_service
+        self.ack_writer = None  # PlaybackAckWriter: outcomes are written back to Firestore
+        self.trip_store = None  # TripStore: local alert history
+        self.escalation = None  # EscalationEngine: raises level/priority when a behavior repeats
+        self.lock = threading.Lock()
+        self.seen_ids = collections.OrderedDict()      # event_id -> monotonic time
+        self.last_by_key = {}                          # (behavior, level) -> (source, monotonic time)
+        self.counts = collections.Counter()            # (source, "received"/"duplicate"/"dispatched")
+        self.latencies = {}                            # source -> deque of seconds
+        self.histograms = {}                           # source -> Histogram (for /metrics)
+        self.traces = collections.deque(maxlen=self.LATENCY_SAMPLES)  # (epoch time, source, seconds)
+
+    def _is_duplicate(self, event_id, behavior, level, source, now):
+        with self.lock:
+            # Expire old ids (OrderedDict is in insertion order)
+            while self.seen_ids:
+                oldest_id, seen_at = next(iter(self.seen_ids.items()))
+                if now - seen_at < self.DEDUP_WINDOW:
+                    break
+                self.seen_ids.popitem(last=False)
+
+            if event_id is not None:
+                if event_id in self.seen_ids:
+                    return True
+                # Remembered even when the fallback below drops it, so later replays match on the id
+                self.seen_ids[event_id] = now
+            previous = self.last_by_key.get((behavior, level))
+            if previous and previous[0] != source and now - previous[1] < self.FALLBACK_WINDOW:
+                return True
+            self.last_by_key[(behavior, level)] = (source, now)
+            return False
+
+    def dispatch(self, behavior, level, priority=None, event_id=None, source="firestore", created_at=None):
+        """
+        Plays an alert unless it is a duplicate. created_at is the detection time as epoch seconds
+        (sender clock for local ingest, server create_time for Firestore).
+        Returns the playback outcome ("played", "ignored", ...) or "duplicate".
+        """
+        now = time.monotonic()
+        level = _normalize_level(level)
+        self.counts[(source, "received")] += 1
+        if self._is_duplicate(event_id, behavior, level, source, now):
+            self.counts[(source, "duplicate")] += 1
+            # How late this path delivered the copy: the latency it would have had on its own
+            self._record_latency(source + ":late_copy", created_at)
+            print(f"[AlertDispatcher] Duplicate {behavior} (id={event_id}) from {source}, skipped.")
+            return "duplicate"
+
+        detected_level = level
+        suggest_rest = False
+        if self.escalation:
+            level, priority, suggest_rest = self.escalation.evaluate(behavior, level, priority)
+
+        outcome = "played"
+        if self.audio_service:
+            outcome = self.audio_service.play_sound(behavior, level, priority, event_id=event_id)
+        if suggest_rest:
+            self.escalation.suggest_rest()
+        self.counts[(source, "dispatched")] += 1
+        latency = self._record_latency(source, created_at)
+        if self.ack_writer:
+            self.ack_writer.record(event_id, outcome, source, created_at)
+        if self.trip_store:
+            self.trip_store.record_alert(behavior, detected_level, source, outcome,
+                                         None if latency is None else round(latency * 1000, 1), event_id)
+        return outcome
+
+    def _record_latency(self, name, created_at):
+        """Returns the latency in seconds (None without created_at)."""
+        if created_at is None:
+            return None
+        samples = self.latencies.get(name)
+        if samples is None:
+            samples = self.latencies[name] = collections.deque(maxlen=self.LATENCY_SAMPLES)
+        received_at = time.time()
+        latency = received_at - created_at
+        samples.append(latency)
+        self.traces.append((received_at, name, latency))
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(latency)
+        return latency
+
+    def latency_report(self):
+        """Per-source counts and detection-to-audio latency percentiles (ms)."""
+        report = {}
+        sources = {source for source, _ in list(self.counts)} | set(self.latencies)
+        for source in sorted(sources):
+            samples = sorted(self.latencies.get(source, ()))
+            entry = {
+                "received": self.counts[(source, "received")],
+                "duplicates": self.counts[(source, "duplicate")],
+                "dispatched": self.counts[(source, "dispatched")],
+            }
+            if samples:
+                entry["latency_ms"] = {
+                    "p50": samples[len(samples) // 2] * 1000,
+                    "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+                    "max": samples[-1] * 1000,
+                    "n": len(samples),
+                }
+            report[source] = entry
+        return report
+
+    def print_report(self):
+        for source, entry in self.latency_report().items():
+            latency = entry.get("latency_ms")
+            latency_text = (f"p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms max={latency['max']:.1f}ms"
+                            if latency else "no latency samples")
+            print(f"[AlertDispatcher] {source}: received={entry['received']} dispatched={entry['dispatched']} "
+                  f"duplicates={entry['duplicates']} {latency_text}")
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+import time
+from services.escalation import compile_escalation
+
+DEFAULT_PROFILE_PATH = r"src/configs/alert_profile.json"
+
+# Levels every flat (level-less) behavior is also registered under,
+# so the common (behavior, level) lookup hits on the first try.
+COMMON_LEVELS = (None, 1, 2, 3)
+
+LED_PATTERNS = ("off", "solid", "blink", "fast_blink", "pulse", "chase")
+
+
+class AlertProfileError(ValueError):
+    pass
+
+
+class AlertAction:
+    """
+    Everything needed to play one (behavior, level) alert, resolved at compile time.
+    Nothing on the hot path needs string building or filesystem access.
+    """
+    __slots__ = ("key", "behavior", "level", "clip", "filename", "clip_path",
+                 "led_pins", "led_pattern", "led_effect", "priority",
+                 "follow_up_paths", "cooldown")
+
+    def __init__(self, key, behavior, level, clip, filename, clip_path, led_pins,
+                 led_pattern, led_effect, priority, follow_up_paths, cooldown):
+        self.key = key
+        self.behavior = behavior
+        self.level = level
+        self.clip = clip
+        self.filename = filename
+        self.clip_path = clip_path            # None if the file was missing at compile time
+        self.led_pins = led_pins
+        self.led_pattern = led_pattern
+        self.led_effect = led_effect          # Precomputed LedEffect, or None without LedService
+        self.priority = priority
+        self.follow_up_paths = follow_up_paths
+        self.cooldown = cooldown
+
+    def __repr__(self):
+        return f"AlertAction({self.behavior!r}, level={self.level!r}, clip={self.clip!r}, p={self.priority})"
+
+
+class CompiledProfile:
+    """Flat dispatch tables produced from one profile file."""
+
+    def __init__(self, actions, clip_paths, source_mtime=None, escalation=None, rest_prompt=None, assets_path=None):
+        # (behavior, level) -> AlertAction, level may be int, str or None
+        self.actions = actions
+        # clip name -> absolute-ish path (only clips that exist)
+        self.clip_paths = clip_paths
+        self.source_mtime = source_mtime
+        self.behaviors = frozenset(action.behavior for action in actions.values())
+        # behavior -> EscalationRule, and the RestPrompt they may trigger
+        self.escalation = escalation or {}
+        self.rest_prompt = rest_prompt
+        # Directory the clip paths were resolved against
+        self.assets_path = assets_path
+
+    def lookup(self, behavior, level):
+        action = self.actions.get((behavior, level))
+        if action is None:
+            # Uncommon level value (e.g. 4, "03"): fall back to the behavior default
+            action = self.actions.get((behavior, None))
+        return action
+
+
+def _level_keys(level):
+    """All spellings a level can arrive with from Firestore or the local ingest path."""
+    if level is None:
+        return (None,)
+    return (int(level), str(int(level)))
+
+
+def compile_profile(raw, led_service=None, base_dir=None, source_mtime=None, assets_path=None):
+    """
+    Validates a profile dict and compiles it into a CompiledProfile. assets_path, when given,
+    replaces the profile's own "assets_path".
+    """
+    errors = []
+
+    if not isinstance(raw, dict):
+        raise AlertProfileError("Profile root must be an object")
+
+    defaults = raw.get("defaults", {})
+    default_priority = defaults.get("priority", 5)
+    default_cooldown = defaults.get("cooldown", 0)
+    default_pattern = defaults.get("led_pattern", "solid")
+
+    assets_path = assets_path or raw.get("assets_path", "assets/audios")
+    if base_dir and not os.path.isabs(assets_path):
+        assets_path = os.path.join(base_dir, assets_path)
+
+    # --- Clips ---
+    clips = raw.get("clips")
+    if not isinstance(clips, dict) or not clips:
+        raise AlertProfileError("Profile must define a non-empty 'clips' object")
+
+    clip_paths = {}
+    clip_pins = {}
+    for name, clip in clips.items():
+        if not isinstance(clip, dict) or "file" not in clip:
+            errors.append(f"clip '{name}': missing 'file'")
+            continue
+        path = os.path.join(assets_path, clip["file"])
+        if os.path.exists(path):
+            clip_paths[name] = path
+        else:
+            print(f"[AlertProfile] Warning: clip '{name}' file not found at {path}")
+        pin = clip.get("led_pin")
+        if pin is not None:
+            if led_service and pin not in led_service.all_pins:
+                errors.append(f"clip '{name}': led_pin {pin} is not an LED pin {led_service.all_pins}")
+            clip_pins[name] = pin
+
+    # --- Behaviors ---
+    behaviors = raw.get("behaviors")
+    if not isinstance(behaviors, dict) or not behaviors:
+        raise AlertProfileError("Profile must define a non-empty 'behaviors' object")
+
+    effect_cache = {}
+    actions = {}
+
+    def build_action(behavior, level, spec, parent):
+        where = f"behavior '{behavior}'" + (f" level {level}" if level is not None else "")
+        clip = spec.get("clip", parent.get("clip"))
+        if clip not in clips or not isinstance(clips[clip], dict):
+            errors.append(f"{where}: unknown clip '{clip}'")
+            return None
+
+        priority = spec.get("priority", parent.get("priority", default_priority))
+        cooldown = spec.get("cooldown", parent.get("cooldown", default_cooldown))
+        pattern = spec.get("led_pattern", parent.get("led_pattern", default_pattern))
+        follow_ups = spec.get("follow_ups", parent.get("follow_ups", []))
+
+        if not isinstance(priority, int):
+            errors.append(f"{where}: priority must be an integer")
+        if not isinstance(cooldown, (int, float)) or cooldown < 0:
+            errors.append(f"{where}: cooldown must be a non-negative number")
+        if pattern not in LED_PATTERNS:
+            errors.append(f"{where}: unknown led_pattern '{pattern}' (expected one of {LED_PATTERNS})")
+        for follow_up in follow_ups:
+            if follow_up not in clips:
+                errors.append(f"{where}: unknown follow-up clip '{follow_up}'")
+
+        led_pins = (clip_pins[clip],) if clip in clip_pins else ()
+        led_effect = None
+        if led_service and pattern in LED_PATTERNS:
+            cache_key = (pattern, led_pins)
+            if cache_key not in effect_cache:
+                effect_cache[cache_key] = led_service.build_effect(pattern, led_pins)
+            led_effect = effect_cache[cache_key]
+
+        return AlertAction(
+            key=(behavior, level),
+            behavior=behavior,
+            level=level,
+            clip=clip,
+            filename=clips[clip].get("file"),
+            clip_path=clip_paths.get(clip),
+            led_pins=led_pins,
+            led_pattern=pattern,
+            led_effect=led_effect,
+            priority=priority,
+            follow_up_paths=tuple(clip_paths[f] for f in follow_ups if f in clip_paths),
+            cooldown=float(cooldown) if isinstance(cooldown, (int, float)) else 0.0,
+        )
+
+    for behavior, spec in behaviors.items():
+        if not isinstance(spec, dict):
+            errors.append(f"behavior '{behavior}': must be an object")
+            continue
+
+        levels = spec.get("levels")
+        if levels:
+            compiled_levels = {}
+            for level_name, level_spec in levels.items():
+                try:
+                    level = int(level_name)
+                except (TypeError, ValueError):
+                    errors.append(f"behavior '{behavior}': level '{level_name}' is not an integer")
+                    continue
+                action = build_action(behavior, level, level_spec or {}, spec)
+                if action:
+                    compiled_levels[level] = action
+                    for key in _level_keys(level):
+                        actions[(behavior, key)] = action
+            if compiled_levels:
+                # Missing/unknown level falls back to the lowest configured level
+                actions[(behavior, None)] = compiled_levels[min(compiled_levels)]
+        else:
+            action = build_action(behavior, None, spec, {})
+            if action:
+                for level in COMMON_LEVELS:
+                    for key in _level_keys(level):
+                        actions[(behavior, key)] = action
+
+    escalation, rest_prompt = compile_escalation(raw.get("escalation"), behaviors, errors)
+
+    if errors:
+        raise AlertProfileError("Invalid alert profile:\n  - " + "\n  - ".join(errors))
+
+    return CompiledProfile(actions, clip_paths, source_mtime, escalation, rest_prompt, assets_path)
+
+
+class AlertProfile:
+    """
+    Loads the alert profile file, compiles it, and optionally hot-reloads it when the file changes.
+    Readers grab `profile.current` once per alert; a reload swaps the reference,
+    so in-flight alerts keep using the tables they started with.
+    """
+
+    def __init__(self, path=DEFAULT_PROFILE_PATH, led_service=None, assets_path=None):
+        self.path = path
+        self.led_service = led_service
+        self.assets_path = assets_path  # Overrides the file's "assets_path" (kept across reloads)
+        self.current = None
+        self.reload_count = 0
+        self.watching = False
+        self.watch_thread = None
+        self.on_reload = None  # Optional callback(CompiledProfile)
+
+        self.current = self._load()
+        self._seen_mtime = self.current.source_mtime
+        print(f"[AlertProfile] Loaded {self.path}: {len(self.current.behaviors)} behaviors, "
+              f"{len(self.current.actions)} dispatch entries.")
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r", encoding="utf-8") as f:
+            try:
+                raw = json.load(f)
+            except json.JSONDecodeError as e:
+                raise AlertProfileError(f"Profile {self.path} is not valid JSON: {e}")
+        return compile_profile(raw, led_service=self.led_service, source_mtime=mtime, assets_path=self.assets_path)
+
+    def lookup(self, behavior, level):
+        return self.current.lookup(behavior, level)
+
+    def reload(self):
+        """Recompiles the profile. On error the previous tables stay active."""
+        try:
+            compiled = self._load()
+        except (OSError, AlertProfileError) as e:
+            print(f"[AlertProfile] Reload failed, keeping previous profile: {e}")
+            return False
+        self.current = compiled
+        self.reload_count += 1
+        print(f"[AlertProfile] Reloaded {self.path} ({len(compiled.actions)} dispatch entries).")
+        if self.on_reload:
+            self.on_reload(compiled)
+        return True
+
+    def start_watching(self, interval=2.0):
+        """Polls the file mtime and reloads on change."""
+        if self.watching:
+            return
+        self.watching = True
+        self.watch_thread = threading.Thread(target=self._watch_loop, args=(interval,), name="ProfileWatch")
+        self.watch_thread.daemon = True
+        self.watch_thread.start()
+
+    def stop_watching(self):
+        self.watching = False
+
+    def _watch_loop(self, interval):
+        while self.watching:
+            time.sleep(interval)
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                continue
+            if mtime != self._seen_mtime:
+                # Remember the mtime even if the reload fails, so a broken file is reported once
+                self._seen_mtime = mtime
+                self.reload()
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+
+DEFAULT_BANK_PATH = r"assets/audios.bank"
+
+MAGIC = b"CKAUDIO1"
+_HEADER = struct.Struct("<8sI")   # magic, index length
+PAGE = 4096
+
+
+def tts_key(text, lang="vi"):
+    """Bank entry name for a pre-rendered TTS prompt."""
+    return "tts:" + hashlib.sha1(f"{lang}:{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _align(n):
+    return (n + PAGE - 1) // PAGE * PAGE
+
+
+# ---------- Conversion (build time only) ----------
+
+def _audioop():
+    import audioop  # Standard library up to Python 3.12
+    return audioop
+
+
+def convert_pcm(data, width, channels, rate, target_rate, target_channels=2, target_width=2):
+    """Any PCM wav payload -> target_width/target_channels/target_rate."""
+    audioop = _audioop()
+    if width == 1:
+        data = audioop.bias(data, 1, -128)  # 8-bit wav is unsigned
+    if width != target_width:
+        data = audioop.lin2lin(data, width, target_width)
+    if rate != target_rate:
+        data, _ = audioop.ratecv(data, target_width, channels, rate, target_rate, None)
+    if channels == 1 and target_channels == 2:
+        data = audioop.tostereo(data, target_width, 1, 1)
+    elif channels == 2 and target_channels == 1:
+        data = audioop.tomono(data, target_width, 0.5, 0.5)
+    elif channels != target_channels:
+        raise ValueError(f"Cannot convert {channels} channels to {target_channels}")
+    return data
+
+
+def trim_silence(data, width, channels, rate, threshold_dbfs=-45.0, pad=0.03, window=0.01):
+    """Drops leading/trailing windows quieter than threshold, keeping `pad` seconds around the sound."""
+    audioop = _audioop()
+    frame = width * channels
+    step = max(1, int(rate * window)) * frame
+    limit = (1 << (8 * width - 1)) * 10 ** (threshold_dbfs / 20.0)
+    loud = [i for i in range(0, len(data), step) if audioop.max(data[i:i + step], width) > limit]
+    if not loud:
+        return data, 0.0
+    keep = int(rate * pad) * frame
+    start = max(0, loud[0] - keep)
+    end = min(len(data), loud[-1] + step + keep)
+    return data[start:end], (len(data) - (end - start)) / float(frame * rate)
+
+
+def normalize(data, width, target_rms_dbfs=-20.0, peak_dbfs=-1.0):
+    """Gain towards target RMS, limited so the peak stays under peak_dbfs. Returns (data, gain_db)."""
+    audioop = _audioop()
+    full_scale = float(1 << (8 * width - 1))
+    rms = audioop.rms(data, width)
+    peak = audioop.max(data, width)
+    if not rms or not peak:
+        return data, 0.0
+    gain = min(full_scale * 10 ** (target_rms_dbfs / 20.0) / rms,
+               full_scale * 10 ** (peak_dbfs / 20.0) / peak)
+    if abs(gain - 1.0) < 0.01:
+        return data, 0.0
+    return audioop.mul(data, width, gain), 20 * math.log10(gain)
+
+
+def load_wav(path):
+    import wave
+    with wave.open(path, "rb") as w:
+        return w.readframes(w.getnframes()), w.getsampwidth(), w.getnchannels(), w.getframerate()
+
+
+def write_bank(out_path, entries, rate, channels=2, width=2):
+    """
+    entries: {name: (pcm bytes, info dict)}. Layout: header, JSON index, then each clip's PCM
+    starting on a page boundary so it can be used straight from the mapping.
+    """
+    index = {"rate": rate, "channels": channels, "width": width, "clips": {}}
+    # Offsets depend on the index size, which depends on the offsets: size the index first
+    for name, (pcm, info) in entries.items():
+        index["clips"][name] = dict(info, offset=0, bytes=len(pcm))
+    for _ in range(2):
+        offset = _align(_HEADER.size + len(json.dumps(index).encode("utf-8")) + 64)
+        for name, (pcm, _) in entries.items():
+            index["clips"][name]["offset"] = offset
+            offset = _align(offset + len(pcm))
+    encoded = json.dumps(index).encode("utf-8")
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(encoded)))
+        f.write(encoded)
+        for name, (pcm, _) in entries.items():
+            f.seek(index["clips"][name]["offset"])
+            f.write(pcm)
+        f.truncate(_align(f.tell()))
+    os.replace(tmp_path, out_path)
+    return index
+
+
+# ---------- Runtime ----------
+
+class AudioBank:
+    """
+    Read-only mapping of a bank built by scripts/build_audio_bank.py. pcm(name) is a
+    memoryview into the mapping: no read(), decode or resample at startup, and the pages are
+    shared with the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = _HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not an audio bank")
+        index = json.loads(self.map[_HEADER.size:_HEADER.size + index_length].decode("utf-8"))
+        self.rate = index["rate"]
+        self.channels = index["channels"]
+        self.width = index["width"]
+        self.clips = index["clips"]
+        self.view = memoryview(self.map)
+
+    def __contains__(self, name):
+        return name in self.clips
+
+    def __len__(self):
+        return len(self.clips)
+
+    def pcm(self, name):
+        entry = self.clips[name]
+        return self.view[entry["offset"]:entry["offset"] + entry["bytes"]]
+
+    def matches(self, rate, channels, width):
+        return (self.rate, self.channels, self.width) == (rate, channels, width)
+
+    def stale(self, assets_path):
+        """Clips whose source wav changed since the bank was built."""
+        changed = []
+        for name, entry in self.clips.items():
+            source = entry.get("source")
+            if not source:
+                continue
+            try:
+                st = os.stat(os.path.join(assets_path, source))
+            except OSError:
+                continue  # Loose file removed: the bank copy is all there is
+            if st.st_size != entry.get("source_size") or int(st.st_mtime) != entry.get("source_mtime"):
+                changed.append(name)
+        return changed
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+
+def load_sounds(pygame, paths, bank):
+    """{path: Sound} for every clip path whose file is in the bank (one copy into SDL per clip)."""
+    sounds = {}
+    for path in paths:
+        name = os.path.basename(path)
+        if name in bank:
+            try:
+                sounds[path] = pygame.mixer.Sound(buffer=bank.pcm(name))
+            except Exception as e:
+                print(f"[AudioBank] Could not load {name} from the bank: {e}")
+    return sounds
+
+
+def open_bank(path, assets_path, rate, channels=2, width=2):
+    """The bank at path if it exists, matches the mixer format and is up to date; else None."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        bank = AudioBank(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[AudioBank] Ignoring {path}: {e}")
+        return None
+    if not bank.matches(rate, channels, width):
+        print(f"[AudioBank] Ignoring {path}: built for {bank.rate} Hz/{bank.channels} ch/{bank.width * 8} bit, "
+              f"mixer runs {rate} Hz/{channels} ch/{width * 8} bit. Rebuild it.")
+        bank.close()
+        return None
+    changed = bank.stale(assets_path)
+    if changed:
+        print(f"[AudioBank] Ignoring {path}: sources changed since build ({', '.join(changed)}). Rebuild it.")
+        bank.close()
+        return None
+    print(f"[AudioBank] Using {path} ({len(bank)} clips).")
+    return bank
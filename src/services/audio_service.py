@@ -1,89 +1,244 @@
 import pygame
+import collections
 import os
 import threading
+import time
+from services.alert_profile import AlertProfile, DEFAULT_PROFILE_PATH
+from services.audio_bank import DEFAULT_BANK_PATH, load_sounds, open_bank, tts_key
+from services.audio_worker import StallMonitor
+from services.profiler import timed
+
+MIXER_FREQUENCY = 44100
+
 
 class AudioService:
-    def __init__(self, assets_path="assets/audios", led_service=None):
-        self.assets_path = assets_path
+    """
+    Plays profile alerts and TTS with priorities. By default the pygame mixer runs in this
+    process with a large buffer; with use_worker=True playback moves to an AudioWorker child
+    process (elevated scheduling, small buffer) fed through a shared-memory command ring.
+
+    Clips are looked up under assets_path, or the profile's "assets_path" when it is None
+    (a profile passed in keeps its own). If an audio bank (scripts/build_audio_bank.py)
+    matching the mixer format is found, clips are played as Sounds built from its mapped PCM;
+    anything not in it (or a missing/stale bank) falls back to streaming the loose files.
+
+    A worker that never reports ready, or keeps dying soon after a restart, is dropped for
+    the in-process mixer.
+    """
+
+    # Worker must publish a heartbeat this soon after (re)start
+    WORKER_READY_TIMEOUT = 5.0
+    # A worker that dies within this long of starting counts as a failed start
+    WORKER_STABLE_UPTIME = 60.0
+    # Failed starts in a row before falling back to the in-process mixer
+    WORKER_MAX_FAILURES = 3
+
+    def __init__(self, assets_path=None, led_service=None, profile=None,
+                 profile_path=DEFAULT_PROFILE_PATH, use_worker=False, buffer=4096, worker_buffer=1024,
+                 bank_path=DEFAULT_BANK_PATH):
         self.led_service = led_service
         self.current_priority = float('inf')
         self.lock = threading.Lock()
+        # (behavior, level) -> monotonic time of the last accepted play, for profile cooldowns
+        self.last_played = {}
+        # Alert outcome counters (read lock-free by the metrics endpoint)
+        self.outcomes = collections.Counter()
+        self.current_event_id = None
+        self.on_preempted = None  # callable(event_id), e.g. PlaybackAckWriter.record_preempted
+        self.on_worker_restarted = None  # callable(pid) once a restarted worker is ready, e.g. CPU placement
         
+        # Request -> playback start latency (seconds) for the in-process mixer
+        self.latency = {"last": 0.0, "max": 0.0, "sum": 0.0, "count": 0}
+
+        # Behavior/level -> clip, LED pattern, default priority, follow-ups and cooldown
+        # all come from the alert profile (src/configs/alert_profile.json), compiled once.
+        self.profile = profile or AlertProfile(profile_path, led_service=led_service, assets_path=assets_path)
+        self.assets_path = self.profile.current.assets_path
+
+        self.worker = None
+        self.worker_started = None
+        self.worker_failures = 0
+        self.stall_monitor = None
+        self.bank = None
+        self.sounds = {}      # clip path (or TTS bank key) -> pygame Sound from the bank
+        self.channel = None
+        self.buffer = buffer
+        self.bank_path = bank_path
+        if use_worker:
+            try:
+                # Imported here: the worker needs multiprocessing.shared_memory (Python 3.8+)
+                from services.audio_worker import AudioWorker
+                bank = open_bank(bank_path, self.assets_path, MIXER_FREQUENCY)
+                if bank is not None:
+                    self.bank = bank
+                self.worker = AudioWorker(self.profile.current.clip_paths.values(), frequency=MIXER_FREQUENCY,
+                                          buffer=worker_buffer, bank_path=bank.path if bank else None)
+                self.worker.start()
+                if not self.worker.wait_ready(self.WORKER_READY_TIMEOUT):
+                    raise RuntimeError(f"no heartbeat within {self.WORKER_READY_TIMEOUT:g}s")
+                self.worker_started = time.monotonic()
+                return
+            except Exception as e:
+                print(f"[AudioService] Audio worker unavailable, playing in-process: {e}")
+                self._drop_worker()
+
+        self._init_mixer()
+
+    def _init_mixer(self):
+        """In-process pygame mixer (also the fallback when the worker fails)."""
         # Initialize pygame mixer with larger buffer to reduce ALSA underrun
         try:
-            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+            pygame.mixer.init(frequency=MIXER_FREQUENCY, size=-16, channels=2, buffer=self.buffer)
         except Exception as e:
             print(f"[AudioService] Warning: Custom mixer init failed, falling back to default. {e}")
             pygame.mixer.init()
-        
-        # Map behavior and level to filenames
-        # behavior: { level: filename } or just filename if no level
-        # Based on user description:
-        # behavior: sleepy_eye (has levels), yawn, phone, look_away
-        self.audio_map = {
-            "sleepy_eye": {
-                "1": "sleepy_eye_level_1_and_yawn.wav",
-                "2": "sleepy_eye_level_2.wav",
-                "3": "sleepy_eye_level_3.wav"
-            },
-            "yawn": "sleepy_eye_level_1_and_yawn.wav", # Assuming shared based on filename
-            "phone": "phone.wav",
-            "look_away": "look_away.wav"
-        }
+        frequency, size, channels = pygame.mixer.get_init()
+        if size == -16:
+            self.bank = open_bank(self.bank_path, self.assets_path, frequency, channels)
+        if self.bank is not None:
+            self.sounds = load_sounds(pygame, self.profile.current.clip_paths.values(), self.bank)
+            self.channel = pygame.mixer.Channel(0)
+        self.stall_monitor = StallMonitor(self.buffer / float(frequency), self.is_busy)
+        self.stall_monitor.start()
 
-    def _get_audio_path(self, behavior, level=None):
-        filename = None
-        if behavior == "sleepy_eye":
-            filename = self.audio_map.get(behavior, {}).get(str(level))
+    def _drop_worker(self):
+        if self.worker is not None:
+            try:
+                self.worker.stop()
+            except Exception as e:
+                print(f"[AudioService] Error stopping audio worker: {e}")
+            self.worker = None
+        if self.bank is not None:
+            self.bank.close()
+            self.bank = None
+
+    def _recover_worker(self):
+        """Caller holds self.lock. Restarts a dead worker, or falls back in-process after repeated failed starts."""
+        if self.worker_started is None or time.monotonic() - self.worker_started < self.WORKER_STABLE_UPTIME:
+            self.worker_failures += 1
         else:
-            filename = self.audio_map.get(behavior)
-            
-        if filename:
-            return os.path.join(self.assets_path, filename)
-        return None
+            self.worker_failures = 0
+        if self.worker_failures >= self.WORKER_MAX_FAILURES:
+            print(f"[AudioService] Audio worker failed {self.worker_failures} starts in a row, playing in-process.")
+            self._drop_worker()
+            self.current_priority = float('inf')
+            self._init_mixer()
+            return
+        print("[AudioService] Audio worker exited, restarting it.")
+        self.worker.restart()
+        if self.worker.wait_ready(self.WORKER_READY_TIMEOUT):
+            self.worker_started = time.monotonic()
+            if self.on_worker_restarted:
+                try:
+                    self.on_worker_restarted(self.worker.process.pid)
+                except Exception as e:
+                    print(f"[AudioService] Worker restart callback failed: {e}")
+        else:
+            # Counted as a failed start on the next check
+            print(f"[AudioService] Restarted audio worker not ready within {self.WORKER_READY_TIMEOUT:g}s.")
+            self.worker_started = None
+            self.worker.process.terminate()
 
-    def play_sound(self, behavior, level, priority):
+    def preload(self):
+        """
+        Reads every profile clip once so the first alert is served from the page cache
+        instead of the SD card. Returns the number of bytes read.
+        """
+        total = 0
+        for path in self.profile.current.clip_paths.values():
+            if path in self.sounds:
+                continue  # Already in memory from the bank
+            try:
+                with open(path, "rb") as f:
+                    while True:
+                        chunk = f.read(1 << 16)
+                        if not chunk:
+                            break
+                        total += len(chunk)
+            except OSError as e:
+                print(f"[AudioService] Preload failed for {path}: {e}")
+        return total
+
+    @timed("audio.play_sound")
+    def play_sound(self, behavior, level, priority=None, event_id=None):
         """
         Plays sound if priority is higher (lower value) than current playing sound.
+        If priority is None, the profile default for the behavior is used.
+        Returns the outcome: "played", "ignored", "cooldown", "unknown", "missing" or "error".
+        When a playing alert is cut off, on_preempted(its event_id) is called.
         """
+        # Single lookup into the precompiled table; a hot reload swaps the whole
+        # table, so this alert keeps the action it resolved here.
+        action = self.profile.current.lookup(behavior, level)
+        if action is None:
+            print(f"[AudioService] Error: No alert configured for {behavior} level {level}")
+            self.outcomes["unknown"] += 1
+            return "unknown"
+        if priority is None:
+            priority = action.priority
+
+        requested_at = time.monotonic()
         with self.lock:
             print(f"[AudioService] Request to play: {behavior}, level={level}, priority={priority}")
+
+            if action.cooldown:
+                now = time.monotonic()
+                last = self.last_played.get(action.key)
+                if last is not None and now - last < action.cooldown:
+                    print(f"[AudioService] Ignoring {behavior} level {level}: in cooldown ({action.cooldown}s)")
+                    self.outcomes["cooldown"] += 1
+                    return "cooldown"
             
             # Check if busy and priority comparison
-            if pygame.mixer.music.get_busy():
+            if self.is_busy():
                 if priority < self.current_priority:
                     print(f"[AudioService] Interrupting current sound (p={self.current_priority}) for new sound (p={priority})")
-                    pygame.mixer.music.stop()
+                    if self.worker is None:
+                        self._stop_playback()  # The worker cuts the old clip itself
+                    self._record_preempted()
                 else:
                     print(f"[AudioService] Ignoring new sound (p={priority}) as it is not higher priority than current (p={self.current_priority})")
-                    return
+                    self.outcomes["ignored"] += 1
+                    return "ignored"
 
-            audio_path = self._get_audio_path(behavior, level)
-            if not audio_path or not os.path.exists(audio_path):
-                print(f"[AudioService] Error: Audio file not found for {behavior} level {level} at {audio_path}")
+            if not action.clip_path:
+                print(f"[AudioService] Error: Audio file not found for {behavior} level {level} (clip {action.clip})")
                 self.current_priority = float('inf')
-                return
+                self.outcomes["missing"] += 1
+                return "missing"
 
             try:
-                pygame.mixer.music.load(audio_path)
-                pygame.mixer.music.play()
-                
-                # Turn on LED for this file
+                if self.worker is not None:
+                    if not self.worker.alive():
+                        raise RuntimeError("audio worker is not running")
+                    if not self.worker.play(action.clip_path, priority, action.follow_up_paths):
+                        raise RuntimeError("audio worker command ring is full")
+                elif action.clip_path in self.sounds and all(p in self.sounds for p in action.follow_up_paths[:1]):
+                    self.channel.play(self.sounds[action.clip_path])
+                    for follow_up_path in action.follow_up_paths[:1]:  # A channel holds one queued sound
+                        print(f"[AudioService] Queuing follow-up sound: {follow_up_path}")
+                        self.channel.queue(self.sounds[follow_up_path])
+                    self._record_latency(time.monotonic() - requested_at)
+                else:
+                    pygame.mixer.music.load(action.clip_path)
+                    pygame.mixer.music.play()
+                    for follow_up_path in action.follow_up_paths:
+                        print(f"[AudioService] Queuing follow-up sound: {follow_up_path}")
+                        pygame.mixer.music.queue(follow_up_path)
+                    self._record_latency(time.monotonic() - requested_at)
+
+                # Turn on LED for this alert (effect precomputed by the profile)
                 if self.led_service:
-                    filename = os.path.basename(audio_path)
-                    print(f"[AudioService] LED Request: Turn on for {filename}")
-                    self.led_service.turn_on_file(filename)
-                
-                # Check for special case: sleepy_eye level 3 -> queue stop_car_warning
-                if behavior == "sleepy_eye" and str(level) == "3":
-                    warning_path = os.path.join(self.assets_path, "stop_car_warning.wav")
-                    if os.path.exists(warning_path):
-                        print(f"[AudioService] Queuing warning sound: {warning_path}")
-                        pygame.mixer.music.queue(warning_path)
+                    if action.led_effect is not None:
+                        self.led_service.set_effect(action.led_effect)
                     else:
-                        print(f"[AudioService] Warning sound not found at {warning_path}")
+                        self.led_service.turn_on_file(action.filename, level)
 
                 self.current_priority = priority
+                self.current_event_id = event_id
+                if action.cooldown:
+                    self.last_played[action.key] = time.monotonic()
+                self.outcomes["played"] += 1
                 # Reset priority when done? 
                 # Ideally we'd want to know when it finishes to reset priority, 
                 # but for now, next play will check get_busy().
@@ -92,36 +247,130 @@ class AudioService:
             except Exception as e:
                 print(f"[AudioService] Error playing sound: {e}")
                 self.current_priority = float('inf')
+                self.outcomes["error"] += 1
+                return "error"
+            return "played"
+
+    def _record_preempted(self):
+        """Caller holds self.lock. The playing alert (if any) is being cut off."""
+        self.outcomes["preempted"] += 1
+        if self.on_preempted and self.current_event_id is not None:
+            self.on_preempted(self.current_event_id)
+        self.current_event_id = None
+
+    def _record_latency(self, seconds):
+        latency = self.latency
+        latency["last"] = seconds
+        latency["max"] = max(latency["max"], seconds)
+        latency["sum"] += seconds
+        latency["count"] += 1
+
+    def playback_stats(self):
+        """Underruns and request -> playback latency for whichever mixer is in use."""
+        if self.worker is not None:
+            status = self.worker.status()
+            return {
+                "worker": 1,
+                "underruns": status["underruns"],
+                "latency_last": status["latency_last"],
+                "latency_max": status["latency_max"],
+                "latency_avg": status["latency_avg"],
+                "dropped": status["dropped"],
+                "restarts": status["restarts"],
+                "scheduler": status["scheduler"],
+            }
+        latency = self.latency
+        return {
+            "worker": 0,
+            "underruns": self.stall_monitor.underruns if self.stall_monitor else 0,
+            "latency_last": latency["last"],
+            "latency_max": latency["max"],
+            "latency_avg": latency["sum"] / latency["count"] if latency["count"] else 0.0,
+        }
+
+    def is_busy(self):
+        if self.worker is not None:
+            return self.worker.busy()
+        if self.channel is not None and self.channel.get_busy():
+            return True
+        return pygame.mixer.music.get_busy()
+
+    def _stop_playback(self):
+        if self.channel is not None:
+            self.channel.stop()
+        pygame.mixer.music.stop()
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.stop()
+        if self.stall_monitor is not None:
+            self.stall_monitor.stop()
+        self.sounds = {}
+        if self.bank is not None:
+            self.bank.close()
+            self.bank = None
 
     def check_status(self):
         """Optional: Reset priority if music stopped playing naturally"""
         with self.lock:
-            if not pygame.mixer.music.get_busy():
+            if self.worker is not None and not self.worker.alive():
+                self._recover_worker()
+            if not self.is_busy():
                 self.current_priority = float('inf')
                 # Ensure LEDs are off if audio stopped
                 if self.led_service:
                     self.led_service.stop_effect()
                     self.led_service.turn_off_all()
 
-    def speak(self, text, priority=0, lang='vi'):
+    @timed("audio.speak")
+    def speak(self, text, priority=0, lang='vi', offline=False):
         """
-        Generates TTS audio and plays it.
+        Generates TTS audio and plays it. Prompts pre-rendered into the audio bank play
+        from memory without gTTS; offline=True plays only those and never reaches gTTS.
+        Returns True when playback started.
         """
-        from gtts import gTTS
         import tempfile
         
         with self.lock:
             print(f"[AudioService] Request to speak: '{text}' (p={priority})")
             
-            if pygame.mixer.music.get_busy():
+            if self.is_busy():
                 if priority < self.current_priority:
                      print(f"[AudioService] Interrupting current sound for TTS")
-                     pygame.mixer.music.stop()
+                     if self.worker is None:
+                         self._stop_playback()
+                     self._record_preempted()
                 else:
                      print(f"[AudioService] TTS ignored due to lower priority")
-                     return
+                     return False
+
+            key = tts_key(text, lang)
+            if self.bank is not None and key in self.bank:
+                try:
+                    if self.led_service:
+                        self.led_service.start_chasing()
+                    if self.worker is not None:
+                        if not self.worker.alive() or not self.worker.play_file("bank:" + key, priority):
+                            return False
+                    else:
+                        if key not in self.sounds:
+                            self.sounds[key] = pygame.mixer.Sound(buffer=self.bank.pcm(key))
+                        self.channel.play(self.sounds[key])
+                    self.current_priority = priority
+                    self.current_event_id = None  # TTS is not an alert; cutting it off reports nothing
+                    return True
+                except Exception as e:
+                    print(f"[AudioService] Error in speak: {e}")
+                    self.current_priority = float('inf')
+                    return False
+
+            if offline:
+                print(f"[AudioService] TTS not in the audio bank, skipped offline")
+                return False
 
             try:
+                from gtts import gTTS
+
                 # Generate TTS
                 tts = gTTS(text=text, lang=lang)
                 
@@ -142,15 +391,22 @@ class AudioService:
                 if self.led_service:
                     self.led_service.start_chasing()
                 
-                pygame.mixer.music.load(temp_path)
-                pygame.mixer.music.play()
+                if self.worker is not None:
+                    if not self.worker.alive() or not self.worker.play_file(temp_path, priority):
+                        return False
+                else:
+                    pygame.mixer.music.load(temp_path)
+                    pygame.mixer.music.play()
                 
                 self.current_priority = priority
+                self.current_event_id = None  # TTS is not an alert; cutting it off reports nothing
                 
                 # We can't easily delete the file while it's playing in pygame on Windows.
                 # It might remain until next restart or be overwritten. 
                 # For this simple project, letting OS clean temp or overwriting same path is acceptable.
+                return True
                 
             except Exception as e:
                 print(f"[AudioService] Error in speak: {e}")
                 self.current_priority = float('inf')
+                return False
@@ -0,0 +1,351 @@
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from services.audio_bank import AudioBank, load_sounds
+
+# Commands (parent -> worker)
+OP_PLAY = 1        # preloaded clip id (+ follow-up clip ids)
+OP_PLAY_FILE = 2   # any file by path (TTS, clips added by a profile reload)
+OP_STOP = 3
+OP_QUIT = 4
+
+NO_CLIP = -1
+MAX_FOLLOW_UPS = 3
+PATH_BYTES = 200
+
+# seq, op, priority, clip, 3 follow-ups, sent_at (monotonic, same clock in both processes), path
+_SLOT = struct.Struct(f"<IHhh{MAX_FOLLOW_UPS}hd{PATH_BYTES}s")
+_SLOT_SIZE = 256
+_SEQ = struct.Struct("<I")
+_INDEX = struct.Struct("<Q")
+_HEADER_SIZE = 64   # head at 0, tail at 8, capacity at 16 (one cache line)
+
+# Status block written only by the worker
+STATUS_FIELDS = ("heartbeat", "busy", "commands", "played", "underruns", "errors",
+                 "latency_last", "latency_max", "latency_sum", "latency_count", "scheduler")
+_STATUS = struct.Struct("<dqqqqqddddq")
+
+SCHED_NONE, SCHED_NICE, SCHED_REALTIME = 0, 1, 2
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8 (JetPack 4 ships 3.6): StallMonitor still works, AudioWorker does not
+    shared_memory = None
+
+
+def _open_shm(name, size):
+    """Creates a block (name None) or attaches to one; only the creator unlinks it."""
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+    return shared_memory.SharedMemory(name=name)
+
+
+class CommandRing:
+    """
+    Single-producer / single-consumer ring in shared memory. The producer owns `head`, the
+    consumer owns `tail`; neither takes a lock. A slot's sequence number is written after its
+    body, and the consumer only takes a slot whose sequence matches, so a half-written slot
+    is never read.
+    """
+
+    def __init__(self, capacity=64, name=None):
+        """Creates a ring, or attaches to the ring called `name` (capacity is read from its header)."""
+        self.owner = name is None
+        self.shm = _open_shm(name, _HEADER_SIZE + capacity * _SLOT_SIZE)
+        self.buf = self.shm.buf
+        if self.owner:
+            self.buf[:len(self.buf)] = bytes(len(self.buf))
+            _INDEX.pack_into(self.buf, 16, capacity)
+        self.capacity = self._get(16)
+        self.dropped = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _get(self, offset):
+        return _INDEX.unpack_from(self.buf, offset)[0]
+
+    def put(self, op, priority=0, clip=NO_CLIP, follow_ups=(), path=b""):
+        """Producer side. Returns False (and counts a drop) when the ring is full."""
+        head = self._get(0)
+        if head - self._get(8) >= self.capacity:
+            self.dropped += 1
+            return False
+        offset = _HEADER_SIZE + (head % self.capacity) * _SLOT_SIZE
+        ids = (tuple(follow_ups) + (NO_CLIP,) * MAX_FOLLOW_UPS)[:MAX_FOLLOW_UPS]
+        _SLOT.pack_into(self.buf, offset, 0, op, priority, clip, *ids, time.monotonic(), path)
+        _SEQ.pack_into(self.buf, offset, (head + 1) & 0xFFFFFFFF)
+        _INDEX.pack_into(self.buf, 0, head + 1)
+        return True
+
+    def get(self):
+        """Consumer side. Returns (op, priority, clip, follow_ups, sent_at, path) or None."""
+        tail = self._get(8)
+        if tail >= self._get(0):
+            return None
+        offset = _HEADER_SIZE + (tail % self.capacity) * _SLOT_SIZE
+        fields = _SLOT.unpack_from(self.buf, offset)
+        if fields[0] != (tail + 1) & 0xFFFFFFFF:
+            return None  # Published head seen before the slot body: take it next poll
+        _INDEX.pack_into(self.buf, 8, tail + 1)
+        follow_ups = tuple(i for i in fields[4:4 + MAX_FOLLOW_UPS] if i != NO_CLIP)
+        return fields[1], fields[2], fields[3], follow_ups, fields[-2], fields[-1].rstrip(b"\0")
+
+    def depth(self):
+        return self._get(0) - self._get(8)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class StallMonitor:
+    """
+    Underrun proxy: a thread that should wake every `period` seconds and counts the wakeups
+    that came later than one mixer buffer while audio was playing. SDL refills the ALSA buffer
+    from its own thread, but a process starved for that long has almost certainly underrun.
+    """
+
+    def __init__(self, buffer_seconds, busy, period=0.005):
+        self.buffer_seconds = buffer_seconds
+        self.busy = busy
+        self.period = period
+        self.underruns = 0
+        self.worst = 0.0
+        self.running = False
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self._loop, name="AudioStall")
+        thread.daemon = True
+        thread.start()
+
+    def _loop(self):
+        last = time.monotonic()
+        while self.running:
+            time.sleep(self.period)
+            now = time.monotonic()
+            self.check(now - last)
+            last = now
+
+    def check(self, gap):
+        late = gap - self.period
+        if late > self.worst:
+            self.worst = late
+        if late > self.buffer_seconds and self.busy():
+            self.underruns += 1
+            return True
+        return False
+
+    def stop(self):
+        self.running = False
+
+
+def _raise_priority(rt_priority):
+    """SCHED_FIFO if allowed (root or CAP_SYS_NICE), else the best nice value we may take."""
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(rt_priority))
+        return SCHED_REALTIME
+    except (AttributeError, PermissionError, OSError):
+        pass
+    try:
+        os.nice(-10)
+        return SCHED_NICE
+    except (PermissionError, OSError):
+        return SCHED_NONE
+
+
+def run_worker(ring_name, status_name, clip_paths, frequency, buffer, rt_priority, poll_interval, bank_path=None):
+    """Child process entry point: owns the mixer and plays what the ring says."""
+    scheduler = _raise_priority(rt_priority)
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+
+    ring = CommandRing(name=ring_name)
+    status_shm = _open_shm(status_name, _STATUS.size)
+    status = [time.monotonic(), 0, 0, 0, 0, 0, 0.0, 0.0, 0.0, 0.0, scheduler]
+
+    pygame.mixer.init(frequency=frequency, size=-16, channels=2, buffer=buffer)
+    channel = pygame.mixer.Channel(0)
+    bank = AudioBank(bank_path) if bank_path else None  # Already validated by the parent
+    banked = load_sounds(pygame, clip_paths, bank) if bank else {}
+    sounds = []
+    for path in clip_paths:
+        try:
+            # Decoded once (or mapped from the bank); play() starts from RAM
+            sounds.append(banked.get(path) or pygame.mixer.Sound(path))
+        except Exception as e:
+            print(f"[AudioWorker] Could not load {path}: {e}")
+            sounds.append(None)
+    bank_sounds = {}  # "bank:<key>" -> Sound, for pre-rendered TTS
+    print(f"[AudioWorker] Ready (pid {os.getpid()}, buffer {buffer}, scheduler {scheduler}, "
+          f"{len(sounds)} clips).")
+
+    monitor = StallMonitor(buffer / float(frequency), lambda: status[1], period=poll_interval)
+    last = time.monotonic()
+    while True:
+        command = ring.get()
+        while command is not None:
+            op, _, clip, follow_ups, sent_at, path = command
+            status[2] += 1
+            if op == OP_QUIT:
+                ring.close()
+                status_shm.close()
+                pygame.mixer.quit()
+                return
+            try:
+                started = False
+                if op == OP_STOP:
+                    channel.stop()
+                    pygame.mixer.music.stop()
+                elif op == OP_PLAY and 0 <= clip < len(sounds) and sounds[clip] is not None:
+                    pygame.mixer.music.stop()
+                    channel.play(sounds[clip])
+                    for follow_up in follow_ups[:1]:  # A channel holds one queued sound
+                        if 0 <= follow_up < len(sounds) and sounds[follow_up] is not None:
+                            channel.queue(sounds[follow_up])
+                    started = True
+                elif op == OP_PLAY_FILE and path.startswith(b"bank:") and bank is not None:
+                    key = path.decode("utf-8")
+                    if key not in bank_sounds:
+                        bank_sounds[key] = pygame.mixer.Sound(buffer=bank.pcm(key[5:]))
+                    pygame.mixer.music.stop()
+                    channel.play(bank_sounds[key])
+                    started = True
+                elif op == OP_PLAY_FILE:
+                    channel.stop()
+                    pygame.mixer.music.load(path.decode("utf-8"))
+                    pygame.mixer.music.play()
+                    started = True
+                else:
+                    status[5] += 1
+                if started:
+                    latency = time.monotonic() - sent_at
+                    status[3] += 1
+                    status[6] = latency
+                    status[7] = max(status[7], latency)
+                    status[8] += latency
+                    status[9] += 1
+            except Exception as e:
+                status[5] += 1
+                print(f"[AudioWorker] Error: {e}")
+            command = ring.get()
+
+        now = time.monotonic()
+        status[1] = 1 if (channel.get_busy() or pygame.mixer.music.get_busy()) else 0
+        if monitor.check(now - last):
+            status[4] += 1
+        last = now
+        status[0] = now
+        _STATUS.pack_into(status_shm.buf, 0, *status)
+        time.sleep(poll_interval)
+
+
+class AudioWorker:
+    """
+    Parent-side handle of the playback child process. Commands go through a CommandRing, and
+    the worker publishes heartbeat, busy flag, counters and play latency in a status block.
+    Keeping the mixer out of this process means gRPC callbacks, requests and snapshot parsing
+    can't starve it, so the mixer buffer can be much smaller.
+    """
+
+    # busy() reads the worker's flag, which lags a new command by up to one poll; treat the
+    # worker as busy for this long after sending a play so back-to-back alerts still compare priorities
+    BUSY_GRACE = 0.1
+
+    def __init__(self, clip_paths, frequency=44100, buffer=1024, rt_priority=50, poll_interval=0.002,
+                 capacity=64, bank_path=None):
+        self.clip_paths = list(clip_paths)
+        self.clip_ids = {path: i for i, path in enumerate(self.clip_paths)}
+        self.frequency = frequency
+        self.buffer = buffer
+        self.rt_priority = rt_priority
+        self.poll_interval = poll_interval
+        self.capacity = capacity
+        self.bank_path = bank_path
+        self.ring = None
+        self.status_shm = None
+        self.process = None
+        self.restarts = 0
+        self.last_play = 0.0
+
+    def start(self):
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory needs Python 3.8+")
+        self.ring = CommandRing(self.capacity)
+        self.status_shm = shared_memory.SharedMemory(create=True, size=_STATUS.size)
+        self.status_shm.buf[:_STATUS.size] = bytes(_STATUS.size)
+        # spawn: the child must not inherit this process's threads or an initialised SDL
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(
+            target=run_worker, name="AudioWorker",
+            args=(self.ring.name, self.status_shm.name, self.clip_paths, self.frequency, self.buffer,
+                  self.rt_priority, self.poll_interval, self.bank_path))
+        self.process.daemon = True
+        self.process.start()
+        print(f"[AudioWorker] Started pid {self.process.pid}.")
+
+    def wait_ready(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.status()["heartbeat"] > 0:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def restart(self):
+        self.stop()
+        self.restarts += 1
+        self.start()
+
+    def play(self, path, priority, follow_up_paths=()):
+        clip = self.clip_ids.get(path)
+        if clip is None or any(p not in self.clip_ids for p in follow_up_paths):
+            return self.play_file(path, priority)
+        self.last_play = time.monotonic()
+        return self.ring.put(OP_PLAY, priority, clip, [self.clip_ids[p] for p in follow_up_paths])
+
+    def play_file(self, path, priority):
+        encoded = path.encode("utf-8")
+        if len(encoded) > PATH_BYTES:
+            print(f"[AudioWorker] Path too long for the command ring: {path}")
+            return False
+        self.last_play = time.monotonic()
+        return self.ring.put(OP_PLAY_FILE, priority, path=encoded)
+
+    def stop_playback(self):
+        return self.ring.put(OP_STOP)
+
+    def busy(self):
+        if time.monotonic() - self.last_play < self.BUSY_GRACE:
+            return True
+        return bool(_STATUS.unpack_from(self.status_shm.buf, 0)[1])
+
+    def status(self):
+        values = dict(zip(STATUS_FIELDS, _STATUS.unpack_from(self.status_shm.buf, 0)))
+        values["latency_avg"] = values["latency_sum"] / values["latency_count"] if values["latency_count"] else 0.0
+        values["dropped"] = self.ring.dropped
+        values["restarts"] = self.restarts
+        return values
+
+    def stop(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.ring.put(OP_QUIT)
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.ring.close()
+        self.status_shm.close()
+        self.status_shm.unlink()
+        self.process = None
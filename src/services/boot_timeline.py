@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class BootTimeline:
+    """Records named boot phases (possibly on several threads) and prints them as a timeline."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases = []  # (name, thread_name, start, end, error)
+        self.marks = []   # (name, t)
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def mark(self, name):
+        """Records a point in time (e.g. 'alert path ready')."""
+        t = time.perf_counter() - self.t0
+        with self.lock:
+            self.marks.append((name, t))
+        print(f"[Boot] {name} at +{t * 1000:.1f} ms")
+
+    def _record(self, name, start, end, error):
+        with self.lock:
+            self.phases.append((name, threading.current_thread().name, start - self.t0, end - self.t0, error))
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.t0) * 1000
+
+    def report(self):
+        """Prints the per-phase timeline sorted by start time."""
+        with self.lock:
+            phases = sorted(self.phases, key=lambda p: p[2])
+            marks = list(self.marks)
+
+        print("[Boot] ------------- Boot timeline -------------")
+        for name, thread_name, start, end, error in phases:
+            status = f"  FAILED: {error}" if error else ""
+            print(f"[Boot] {start * 1000:8.1f} -> {end * 1000:8.1f} ms  ({(end - start) * 1000:7.1f} ms)  "
+                  f"{name:<22} [{thread_name}]{status}")
+        for name, t in marks:
+            print(f"[Boot] {t * 1000:8.1f} ms  * {name}")
+        print(f"[Boot] Total: {self.elapsed_ms():.1f} ms")
+        print("[Boot] ---------------------------------------------")
+
+
+class _Phase:
+    def __init__(self, timeline, name):
+        self.timeline = timeline
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timeline._record(self.name, self.start, time.perf_counter(), exc)
+        return False
@@ -0,0 +1,249 @@
+import threading
+import time
+
+
+class ListenerHandle:
+    """One Firestore listener kept alive by the ConnectivityManager."""
+
+    def __init__(self, name, subscribe):
+        self.name = name
+        self.subscribe = subscribe      # callable(callback) -> listener (Watch)
+        self.callback = None            # wrapped callback handed to subscribe
+        self.listener = None
+        self.snapshots = 0
+        self.restarts = 0
+        self.failures = 0
+        self.last_snapshot = None       # monotonic
+        self.subscribed_at = None       # monotonic
+        self.backoff = 0.0
+        self.next_retry = 0.0
+        self.needs_restart = False
+
+
+class ConnectivityManager:
+    """
+    Watches Firestore listener health and re-subscribes with exponential backoff.
+
+    A listener is considered broken when its Watch stream is no longer active, or when the
+    probe (a cheap point read supplied by FirebaseService) reports that the server has data the
+    listener never delivered, i.e. the stream is open but stalled.
+    Exposes time-disconnected and delivery-delay metrics via stats().
+    """
+
+    def __init__(self, probe=None, check_interval=5.0, probe_interval=60.0,
+                 backoff_initial=1.0, backoff_max=60.0, delay_threshold=5.0):
+        # probe() -> True (healthy) / False (stalled); raises if the backend is unreachable
+        self.probe = probe
+        self.check_interval = check_interval
+        self.probe_interval = probe_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.delay_threshold = delay_threshold
+
+        self.handles = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.last_probe = 0.0
+        self.last_probe_ok = True
+
+        # Connection state
+        self.connected = True
+        self.disconnected_since = None
+        self.disconnected_total = 0.0
+        self.disconnects = 0
+        self.probe_failures = 0
+        self.stalls_detected = 0
+
+        # Alert delivery
+        self.alerts_received = 0
+        self.alerts_delayed = 0
+        self.max_alert_delay = 0.0
+        self.last_backlog = 0
+
+    # ---------- Listener registration ----------
+
+    def register(self, name, subscribe, callback):
+        """Subscribes now and keeps the listener alive. Replaces any listener with the same name."""
+        self.unregister(name)
+        handle = ListenerHandle(name, subscribe)
+
+        def wrapped(*args):
+            handle.snapshots += 1
+            handle.last_snapshot = time.monotonic()
+            handle.backoff = 0.0
+            callback(*args)
+
+        handle.callback = wrapped
+        with self.lock:
+            self.handles[name] = handle
+        self._subscribe(handle)
+        return handle
+
+    def unregister(self, name):
+        with self.lock:
+            handle = self.handles.pop(name, None)
+        if handle:
+            self._close(handle)
+
+    def force_restart(self, name=None):
+        """Marks one (or every) listener for re-subscription on the next watchdog pass."""
+        with self.lock:
+            if name is None:
+                handles = list(self.handles.values())
+            else:
+                handles = [self.handles[name]] if name in self.handles else []
+        for handle in handles:
+            handle.needs_restart = True
+
+    def _close(self, handle):
+        listener, handle.listener = handle.listener, None
+        if listener is not None:
+            try:
+                listener.unsubscribe()
+            except Exception as e:
+                print(f"[Connectivity] Error closing listener {handle.name}: {e}")
+
+    def _subscribe(self, handle):
+        now = time.monotonic()
+        try:
+            handle.listener = handle.subscribe(handle.callback)
+            handle.subscribed_at = now
+            handle.needs_restart = False
+            return True
+        except Exception as e:
+            handle.failures += 1
+            handle.backoff = min(self.backoff_max, max(self.backoff_initial, handle.backoff * 2))
+            handle.next_retry = now + handle.backoff
+            print(f"[Connectivity] Subscribe {handle.name} failed ({e}), retry in {handle.backoff:.0f}s")
+            return False
+
+    # ---------- Delivery accounting ----------
+
+    def record_alert(self, delay_seconds):
+        """Called for every alert delivered by a listener, with server-create-to-receive delay."""
+        self.alerts_received += 1
+        if delay_seconds is None:
+            return
+        if delay_seconds > self.delay_threshold:
+            self.alerts_delayed += 1
+        if delay_seconds > self.max_alert_delay:
+            self.max_alert_delay = delay_seconds
+
+    def record_backlog(self, count):
+        """Number of missed alerts delivered by the first snapshot after a (re)subscribe."""
+        self.last_backlog = count
+
+    # ---------- Watchdog ----------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._watch_loop, name="Connectivity")
+        self.thread.daemon = True
+        self.thread.start()
+        print("[Connectivity] Watchdog started.")
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            handles = list(self.handles.values())
+            self.handles = {}
+        for handle in handles:
+            self._close(handle)
+
+    def _set_connected(self, connected):
+        now = time.monotonic()
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            if self.disconnected_since is not None:
+                outage = now - self.disconnected_since
+                self.disconnected_total += outage
+                print(f"[Connectivity] Reconnected after {outage:.1f}s offline.")
+            self.disconnected_since = None
+        else:
+            self.disconnects += 1
+            self.disconnected_since = now
+            print("[Connectivity] Connection lost.")
+
+    def _watch_loop(self):
+        while self.running:
+            time.sleep(self.check_interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[Connectivity] Watchdog error: {e}")
+
+    def check(self):
+        """One watchdog pass (public so it can be driven manually from a script)."""
+        now = time.monotonic()
+
+        if self.probe and now - self.last_probe >= self.probe_interval:
+            self.last_probe = now
+            try:
+                healthy = self.probe()
+                self.last_probe_ok = True
+                if not healthy:
+                    self.stalls_detected += 1
+                    print("[Connectivity] Listener stalled (server has newer data), forcing resubscribe.")
+                    self.force_restart()
+            except Exception as e:
+                self.probe_failures += 1
+                self.last_probe_ok = False
+                print(f"[Connectivity] Probe failed: {e}")
+
+        with self.lock:
+            handles = list(self.handles.values())
+
+        all_active = True
+        for handle in handles:
+            active = handle.listener is not None and getattr(handle.listener, "is_active", True)
+            if active and not handle.needs_restart:
+                continue
+            all_active = False
+            if now < handle.next_retry:
+                continue
+
+            print(f"[Connectivity] Resubscribing {handle.name} (restart #{handle.restarts + 1})")
+            self._close(handle)
+            if self._subscribe(handle):
+                handle.restarts += 1
+                # Next failure waits longer unless a snapshot arrives in between
+                handle.backoff = min(self.backoff_max, max(self.backoff_initial, handle.backoff * 2))
+                handle.next_retry = now + handle.backoff
+
+        # Connected = backend reachable and every stream open
+        self._set_connected(all_active and self.last_probe_ok)
+
+    # ---------- Metrics ----------
+
+    def stats(self):
+        now = time.monotonic()
+        current_outage = (now - self.disconnected_since) if self.disconnected_since is not None else 0.0
+        with self.lock:
+            handles = list(self.handles.values())
+        return {
+            "connected": self.connected,
+            "disconnects": self.disconnects,
+            "disconnected_seconds_total": self.disconnected_total + current_outage,
+            "current_outage_seconds": current_outage,
+            "probe_failures": self.probe_failures,
+            "stalls_detected": self.stalls_detected,
+            "alerts_received": self.alerts_received,
+            "alerts_delayed": self.alerts_delayed,
+            "max_alert_delay_seconds": self.max_alert_delay,
+            "last_backlog": self.last_backlog,
+            "listeners": {
+                h.name: {
+                    "active": h.listener is not None and getattr(h.listener, "is_active", True),
+                    "snapshots": h.snapshots,
+                    "restarts": h.restarts,
+                    "failures": h.failures,
+                    "last_snapshot_age": (now - h.last_snapshot) if h.last_snapshot else None,
+                }
+                for h in handles
+            },
+        }
@@ -0,0 +1,368 @@
+import collections
+import http.client
+import importlib
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+# MJPEG branch of the RTSP process (camera JPEGs as captured, no re-encode)
+DEFAULT_MJPEG_URL = "http://127.0.0.1:8090/mjpeg"
+
+
+class Frame:
+    """One camera JPEG. captured is the RTSP process's capture time (epoch seconds)."""
+    __slots__ = ("jpeg", "frame_id", "captured", "received")
+
+    def __init__(self, jpeg, frame_id, captured, received=None):
+        self.jpeg = jpeg
+        self.frame_id = frame_id
+        self.captured = captured
+        self.received = received if received is not None else time.monotonic()
+
+
+class DetectorPlugin:
+    """
+    Base class for on-device detectors. process() gets one Frame and returns an iterable of
+    (behavior, level, priority) events; level/priority may be None (profile defaults).
+    The plugin keeps its own state between frames and reports an episode once, not on every
+    frame it is visible in. setup() runs on the detector thread before the first frame, so
+    heavy imports (cv2, models) stay off the boot path.
+    """
+    name = "base"
+
+    def __init__(self, **options):
+        self.options = options
+
+    def setup(self):
+        pass
+
+    def process(self, frame):
+        return ()
+
+    def close(self):
+        pass
+
+
+class StubPlugin(DetectorPlugin):
+    """
+    For tests and benchmarks: burns cost_ms of CPU per frame and emits scripted events,
+    e.g. events=[{"every": 30, "behavior": "yawn", "level": 1}] (every 30th processed frame).
+    """
+    name = "stub"
+
+    def __init__(self, cost_ms=0.0, events=(), **options):
+        super().__init__(**options)
+        self.cost = cost_ms / 1000.0
+        self.events = list(events)
+        self.frames = 0
+
+    def process(self, frame):
+        self.frames += 1
+        if self.cost:
+            deadline = time.perf_counter() + self.cost
+            while time.perf_counter() < deadline:
+                pass
+        return [(event["behavior"], event.get("level"), event.get("priority"))
+                for event in self.events if self.frames % event["every"] == 0]
+
+
+class CpuReferencePlugin(DetectorPlugin):
+    """
+    OpenCV Haar cascades on a reduced grayscale decode (the JPEG decoder scales while
+    decoding, so a 1080p frame costs a 270p decode at scale 4):
+      sleepy_eye  a face with no open eye found for eyes_closed_levels seconds -> level 1/2/3
+      look_away   no frontal face for look_away_seconds after one was seen
+    Yawn and phone need a trained model; they are left to other plugins.
+    """
+    name = "cpu_reference"
+    REDUCED = {1: "IMREAD_GRAYSCALE", 2: "IMREAD_REDUCED_GRAYSCALE_2", 4: "IMREAD_REDUCED_GRAYSCALE_4",
+               8: "IMREAD_REDUCED_GRAYSCALE_8"}
+    CASCADE_DIRS = ("/usr/share/opencv4/haarcascades", "/usr/share/opencv/haarcascades")
+
+    def __init__(self, scale=4, eyes_closed_levels=((1.0, 1), (2.0, 2), (3.0, 3)), look_away_seconds=2.0,
+                 min_face=40, cascade_dir=None, **options):
+        super().__init__(**options)
+        self.scale = scale
+        self.eyes_closed_levels = sorted(tuple(step) for step in eyes_closed_levels)
+        self.look_away_seconds = look_away_seconds
+        self.min_face = min_face
+        self.cascade_dir = cascade_dir
+        self.cv2 = None
+        self.np = None
+        self.decode_flag = None
+        self.face = None
+        self.eye = None
+        self.face_seen_at = None
+        self.looking_away = False
+        self.closed_since = None
+        self.closed_level = 0
+
+    def _cascade(self, file_name):
+        dirs = [self.cascade_dir or "", getattr(getattr(self.cv2, "data", None), "haarcascades", "")]
+        dirs += list(self.CASCADE_DIRS)
+        for directory in dirs:
+            path = os.path.join(directory, file_name)
+            if directory and os.path.exists(path):
+                return self.cv2.CascadeClassifier(path)
+        raise RuntimeError(f"{file_name} not found (looked in {', '.join(d for d in dirs if d)})")
+
+    def setup(self):
+        import cv2
+        import numpy
+        self.cv2 = cv2
+        self.np = numpy
+        cv2.setNumThreads(1)  # One core; the encoder owns the others
+        self.decode_flag = getattr(cv2, self.REDUCED.get(self.scale, "IMREAD_GRAYSCALE"))
+        self.face = self._cascade("haarcascade_frontalface_default.xml")
+        self.eye = self._cascade("haarcascade_eye.xml")
+
+    def process(self, frame):
+        gray = self.cv2.imdecode(self.np.frombuffer(frame.jpeg, self.np.uint8), self.decode_flag)
+        if gray is None:
+            return ()
+        now = frame.captured
+        faces = self.face.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=4,
+                                           minSize=(self.min_face, self.min_face))
+        events = []
+        if len(faces) == 0:
+            self.closed_since = None
+            self.closed_level = 0
+            if self.face_seen_at is not None and not self.looking_away \
+                    and now - self.face_seen_at >= self.look_away_seconds:
+                self.looking_away = True
+                events.append(("look_away", 1, None))
+            return events
+
+        self.face_seen_at = now
+        self.looking_away = False
+        x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+        eyes = self.eye.detectMultiScale(gray[y:y + h // 2, x:x + w], scaleFactor=1.1, minNeighbors=3)
+        if len(eyes):
+            self.closed_since = None
+            self.closed_level = 0
+            return events
+
+        if self.closed_since is None:
+            self.closed_since = now
+        closed = now - self.closed_since
+        level = 0
+        for seconds, step_level in self.eyes_closed_levels:
+            if closed >= seconds:
+                level = step_level
+        if level > self.closed_level:
+            self.closed_level = level
+            events.append(("sleepy_eye", level, None))
+        return events
+
+
+PLUGINS = {plugin.name: plugin for plugin in (StubPlugin, CpuReferencePlugin)}
+
+
+def load_plugin(spec, options=None):
+    """A plugin by registered name, or "package.module:ClassName" for one outside this repo."""
+    options = options or {}
+    if spec in PLUGINS:
+        return PLUGINS[spec](**options)
+    module_name, _, class_name = spec.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown detector plugin '{spec}' (known: {', '.join(sorted(PLUGINS))})")
+    return getattr(importlib.import_module(module_name), class_name)(**options)
+
+
+class FrameScheduler:
+    """
+    Hand-off between the frame reader and the detector. offer() never blocks: frames arriving
+    faster than max_fps are skipped, and when the detector falls behind the queue keeps only
+    the newest queue_size frames. take() also drops frames older than max_age, so the detector
+    never works on a stale view of the driver.
+    """
+
+    def __init__(self, max_fps=5.0, queue_size=1, max_age=0.5):
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_age = max_age
+        self.queue = collections.deque(maxlen=max(1, queue_size))
+        self.cond = threading.Condition()
+        self.last_accepted = None
+        self.counts = collections.Counter()
+
+    def offer(self, frame):
+        """Returns True if the frame was queued."""
+        self.counts["received"] += 1
+        # 10% slack: a stream at exactly max_fps must not lose every other frame to jitter
+        if self.last_accepted is not None and frame.received - self.last_accepted < self.interval * 0.9:
+            self.counts["skipped"] += 1
+            return False
+        self.last_accepted = frame.received
+        with self.cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.counts["dropped_overflow"] += 1  # The deque pushes the oldest out
+            self.queue.append(frame)
+            self.cond.notify()
+        return True
+
+    def take(self, timeout=1.0):
+        """Oldest fresh frame, or None after timeout."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                while self.queue:
+                    frame = self.queue.popleft()
+                    if self.max_age and time.monotonic() - frame.received > self.max_age:
+                        self.counts["dropped_stale"] += 1
+                        continue
+                    return frame
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+
+def read_mjpeg(url, on_frame, should_run, timeout=5.0):
+    """
+    Reads a multipart/x-mixed-replace stream (the RTSP process's /mjpeg) and calls
+    on_frame(jpeg, captured) for every part. Returns when the stream ends or should_run()
+    turns false; raises on connection errors.
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        conn.request("GET", parts.path or "/")
+        response = conn.getresponse()
+        if response.status != 200:
+            raise ConnectionError(f"HTTP {response.status} from {url}")
+        while should_run():
+            line = response.readline()
+            if not line:
+                return
+            if not line.startswith(b"--"):
+                continue
+            headers = {}
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if not line:
+                    break
+                key, _, value = line.partition(b":")
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get(b"content-length", 0))
+            if not length:
+                continue
+            data = response.read(length)
+            if len(data) < length:
+                return
+            captured = headers.get(b"x-capture-time")
+            on_frame(data, float(captured) if captured else time.time())
+    finally:
+        conn.close()
+
+
+class DetectorService:
+    """
+    On-device behavior detection. A reader thread pulls camera JPEGs from the MJPEG branch of
+    the RTSP process into a FrameScheduler; the detector thread runs the plugin on the frames
+    the scheduler lets through and sends every event into dispatch (AlertDispatcher.dispatch,
+    source "detector"), so detections take the same path as the local ingest socket.
+    The RTSP process serves the stream from its own threads and never waits for this reader.
+    """
+
+    SAMPLES = 512
+    RECONNECT_MIN = 1.0
+    RECONNECT_MAX = 15.0
+
+    def __init__(self, plugin, dispatch, url=DEFAULT_MJPEG_URL, max_fps=5.0, queue_size=1, max_age=0.5):
+        self.plugin = plugin
+        self.dispatch = dispatch
+        self.url = url
+        self.scheduler = FrameScheduler(max_fps=max_fps, queue_size=queue_size, max_age=max_age)
+        self.running = False
+        self.connected = False
+        self.frame_id = 0
+        self.counts = collections.Counter()
+        self.costs = collections.deque(maxlen=self.SAMPLES)      # seconds per processed frame
+        self.latencies = collections.deque(maxlen=self.SAMPLES)  # capture -> dispatched, seconds
+        self.waits = collections.deque(maxlen=self.SAMPLES)      # received -> processing start, seconds
+        self.last_error = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self._read_loop, name="DetectorReader", daemon=True).start()
+        threading.Thread(target=self._detect_loop, name="DetectorWorker", daemon=True).start()
+        print(f"[DetectorService] Plugin '{self.plugin.name}' on {self.url}.")
+
+    def stop(self):
+        self.running = False
+        self.scheduler.wake()
+
+    def offer(self, jpeg, captured):
+        """Feeds one frame (also used by tests without a stream)."""
+        self.frame_id += 1
+        self.connected = True
+        return self.scheduler.offer(Frame(jpeg, self.frame_id, captured))
+
+    def _read_loop(self):
+        backoff = self.RECONNECT_MIN
+        while self.running:
+            try:
+                read_mjpeg(self.url, self.offer, lambda: self.running)
+                backoff = self.RECONNECT_MIN
+            except Exception as e:
+                if str(e) != self.last_error:
+                    print(f"[DetectorService] Stream error: {e}")
+                    self.last_error = str(e)
+            self.connected = False
+            if self.running:
+                self.counts["reconnects"] += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.RECONNECT_MAX)
+
+    def _detect_loop(self):
+        try:
+            self.plugin.setup()
+        except Exception as e:
+            print(f"[DetectorService] Plugin '{self.plugin.name}' failed to start: {e}")
+            self.running = False
+            return
+        while self.running:
+            frame = self.scheduler.take(1.0)
+            if frame is None:
+                continue
+            self.waits.append(time.monotonic() - frame.received)
+            t0 = time.perf_counter()
+            try:
+                events = list(self.plugin.process(frame) or ())
+            except Exception as e:
+                self.counts["errors"] += 1
+                print(f"[DetectorService] Plugin error: {e}")
+                continue
+            self.costs.append(time.perf_counter() - t0)
+            self.counts["processed"] += 1
+            for behavior, level, priority in events:
+                self.counts["events"] += 1
+                self.dispatch(behavior, level, priority, event_id=str(uuid.uuid4()), source="detector",
+                              created_at=frame.captured)
+                self.latencies.append(time.time() - frame.captured)
+        self.plugin.close()
+
+    def stats(self):
+        """Numeric counters for the metrics endpoint (costs and latencies in ms over the last SAMPLES)."""
+        stats = dict(self.scheduler.counts)
+        stats.update(self.counts)
+        stats["connected"] = 1 if self.connected else 0
+        for name, samples in (("frame_cost", self.costs), ("event_latency", self.latencies),
+                              ("queue_wait", self.waits)):
+            ordered = sorted(samples)
+            if ordered:
+                stats[name + "_p50_ms"] = ordered[len(ordered) // 2] * 1000
+                stats[name + "_p95_ms"] = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+                stats[name + "_max_ms"] = ordered[-1] * 1000
+        return stats
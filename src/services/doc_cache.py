@@ -0,0 +1,118 @@
+import datetime
+import json
+import os
+import threading
+
+DEFAULT_CACHE_PATH = r"data/firestore_cache.json"
+
+
+def _encode(value):
+    """JSON encoder hook for Firestore values (timestamps, GeoPoints, references)."""
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    if hasattr(value, "path"):
+        return {"__ref__": value.path}
+    return str(value)
+
+
+# Shapes datetime.isoformat() writes; fromisoformat() is 3.7+ and JetPack 4 ships 3.6
+_ISO_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z",
+                "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S")
+
+
+def _parse_iso(text):
+    """Inverse of datetime.isoformat(); 3.6's %z wants "+0000", so the offset's colon is dropped."""
+    if len(text) > 6 and text[-6] in "+-" and text[-3] == ":":
+        text = text[:-3] + text[-2:]
+    for fmt in _ISO_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"not an isoformat datetime: {text!r}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj and len(obj) == 1:
+        try:
+            return _parse_iso(obj["__datetime__"])
+        except ValueError:
+            return obj["__datetime__"]
+    return obj
+
+
+def diff_fields(current, desired):
+    """
+    Returns the subset of `desired` that differs from `current` (nested dicts compared
+    field by field). An empty result means the write would be a no-op.
+    """
+    current = current or {}
+    changes = {}
+    for key, value in desired.items():
+        if isinstance(value, dict) and isinstance(current.get(key), dict):
+            nested = diff_fields(current[key], value)
+            if nested:
+                # set(merge=True) merges nested maps, so only the changed leaves are sent
+                changes[key] = nested
+        elif key not in current or current[key] != value:
+            changes[key] = value
+    return changes
+
+
+class DocCache:
+    """
+    In-memory copy of the Firestore documents this device cares about (its device doc and
+    the linked user doc), backed by a small JSON file so the next boot has them before the network.
+    Keys are document paths, e.g. "devices/jetson-nano-iot-test".
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.docs = {}
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.skipped_writes = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.docs = json.load(f, object_hook=_decode)
+            print(f"[DocCache] Loaded {len(self.docs)} cached documents from {self.path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[DocCache] Ignoring unreadable cache {self.path}: {e}")
+            self.docs = {}
+
+    def get(self, doc_path):
+        return self.docs.get(doc_path)
+
+    def put(self, doc_path, data):
+        """Stores a document (None = deleted). Only touches the file if the content changed."""
+        with self.lock:
+            if self.docs.get(doc_path) == data:
+                self.skipped_writes += 1
+                return False
+            if data is None:
+                self.docs.pop(doc_path, None)
+            else:
+                self.docs[doc_path] = data
+            self._save()
+            return True
+
+    def _save(self):
+        # Write-then-rename so a power cut never leaves a truncated cache
+        tmp_path = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.docs, f, default=_encode, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.writes += 1
+        except OSError as e:
+            print(f"[DocCache] Error saving cache: {e}")
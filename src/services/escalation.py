@@ -0,0 +1,262 @@
+import collections
+import threading
+import time
+
+
+class RateWindow:
+    """
+    Events in the last `window` seconds, counted in window / bucket fixed slots.
+    add() and count() touch one slot plus the slots that expired since the last call,
+    so there is no per-event allocation and the cost is bounded by the slot count.
+    """
+    __slots__ = ("window", "bucket", "slots", "counts", "head", "total")
+
+    def __init__(self, window, bucket):
+        self.window = window
+        self.bucket = bucket
+        self.slots = max(1, int(round(window / bucket)))
+        self.counts = [0] * self.slots
+        self.head = None   # bucket number held by the newest slot
+        self.total = 0
+
+    def _advance(self, number):
+        if self.head is None or number - self.head >= self.slots:
+            for i in range(self.slots):
+                self.counts[i] = 0
+            self.total = 0
+        else:
+            for n in range(self.head + 1, number + 1):
+                i = n % self.slots
+                self.total -= self.counts[i]
+                self.counts[i] = 0
+        self.head = number
+
+    def add(self, now):
+        """Counts one event at `now`. Returns the number of events in the window."""
+        number = int(now // self.bucket)
+        if self.head is None or number > self.head:
+            self._advance(number)
+        # A clock step backwards counts into the newest slot
+        self.counts[self.head % self.slots] += 1
+        self.total += 1
+        return self.total
+
+    def count(self, now):
+        number = int(now // self.bucket)
+        if self.head is not None and number > self.head:
+            self._advance(number)
+        return self.total
+
+    def clear(self):
+        self.head = None
+        self._advance(0)
+
+
+class EscalationStep:
+    __slots__ = ("count", "level", "priority", "suggest_rest")
+
+    def __init__(self, count, level=None, priority=None, suggest_rest=False):
+        self.count = count
+        self.level = level
+        self.priority = priority
+        self.suggest_rest = suggest_rest
+
+
+class EscalationRule:
+    """Steps for one behavior, with a count -> step table so evaluation is one index."""
+    __slots__ = ("behavior", "window", "bucket", "steps", "table")
+
+    def __init__(self, behavior, window, bucket, steps):
+        self.behavior = behavior
+        self.window = window
+        self.bucket = bucket
+        self.steps = sorted(steps, key=lambda step: step.count)
+        self.table = [None] * (self.steps[-1].count + 1)
+        for step in self.steps:
+            for n in range(step.count, len(self.table)):
+                self.table[n] = step
+
+    def step_for(self, count):
+        return self.table[count if count < len(self.table) else -1]
+
+
+class RestPrompt:
+    __slots__ = ("text", "cooldown", "priority", "max_wait")
+
+    def __init__(self, text, cooldown=900.0, priority=4, max_wait=20.0):
+        self.text = text
+        self.cooldown = cooldown
+        self.priority = priority
+        self.max_wait = max_wait
+
+
+def compile_escalation(raw, behaviors, errors):
+    """
+    Validates the profile's "escalation" section. Returns ({behavior: EscalationRule}, RestPrompt or None);
+    problems are appended to errors like the rest of compile_profile.
+    """
+    if not raw:
+        return {}, None
+    if not isinstance(raw, dict):
+        errors.append("escalation: must be an object")
+        return {}, None
+
+    bucket = raw.get("bucket_seconds", 10)
+    if not isinstance(bucket, (int, float)) or bucket <= 0:
+        errors.append("escalation: bucket_seconds must be a positive number")
+        bucket = 10
+
+    rest = None
+    rest_raw = raw.get("rest_prompt")
+    if rest_raw is not None:
+        if not isinstance(rest_raw, dict) or not rest_raw.get("text"):
+            errors.append("escalation: rest_prompt needs a 'text'")
+        else:
+            rest = RestPrompt(rest_raw["text"], float(rest_raw.get("cooldown", 900)),
+                              rest_raw.get("priority", 4), float(rest_raw.get("max_wait", 20)))
+
+    rules = {}
+    for behavior, spec in (raw.get("behaviors") or {}).items():
+        where = f"escalation '{behavior}'"
+        if behavior not in behaviors:
+            errors.append(f"{where}: unknown behavior")
+            continue
+        window = spec.get("window", 600) if isinstance(spec, dict) else None
+        if not isinstance(window, (int, float)) or window < bucket:
+            errors.append(f"{where}: window must be a number of seconds >= bucket_seconds")
+            continue
+        steps = []
+        for step in spec.get("steps") or []:
+            count = step.get("count") if isinstance(step, dict) else None
+            if not isinstance(count, int) or count < 1:
+                errors.append(f"{where}: every step needs an integer 'count' >= 1")
+                continue
+            if step.get("suggest_rest") and rest is None:
+                errors.append(f"{where}: suggest_rest needs escalation.rest_prompt")
+            steps.append(EscalationStep(count, step.get("level"), step.get("priority"),
+                                        bool(step.get("suggest_rest"))))
+        if steps:
+            rules[behavior] = EscalationRule(behavior, float(window), float(bucket), steps)
+    return rules, rest
+
+
+class EscalationEngine:
+    """
+    Sits between the alert sources and AudioService: counts each behavior over a sliding
+    window and, once a profile threshold is crossed, raises the alert level (clip + LED
+    pattern) and/or priority, and can ask the driver to take a break (TTS) after the alert.
+
+    Rules come from the "escalation" section of the alert profile and follow its hot
+    reload. Windows are cleared when the trip store starts a new trip.
+    """
+
+    def __init__(self, profile, audio_service=None, trip_store=None, clock=time.monotonic):
+        self.profile = profile
+        self.audio_service = audio_service
+        self.trip_store = trip_store
+        self.clock = clock
+        self.lock = threading.Lock()  # alerts arrive on the ingest and Firestore threads
+        self.compiled = None
+        self.windows = {}           # behavior -> RateWindow
+        self.trip_id = None
+        self.last_rest = None       # clock() of the last rest prompt
+        self.rest_pending = False
+        self.escalated = collections.Counter()  # behavior -> escalated alerts
+        self.rest_prompts = 0
+
+    def _rebind(self, compiled):
+        """New profile tables: keep windows whose geometry did not change."""
+        windows = {}
+        for behavior, rule in compiled.escalation.items():
+            window = self.windows.get(behavior)
+            if window is None or window.window != rule.window or window.bucket != rule.bucket:
+                window = RateWindow(rule.window, rule.bucket)
+            windows[behavior] = window
+        self.windows = windows
+        self.compiled = compiled
+
+    def _check_trip(self):
+        # Read-only: the store rolls the trip over itself when the dispatcher records this alert
+        trip_id = self.trip_store.next_trip_id()
+        if trip_id != self.trip_id:
+            if self.trip_id is not None:
+                for window in self.windows.values():
+                    window.clear()
+                self.last_rest = None
+            self.trip_id = trip_id
+
+    def evaluate(self, behavior, level, priority, now=None):
+        """
+        Counts one alert and returns (level, priority, suggest_rest) to play it with.
+        Unescalated alerts come back unchanged.
+        """
+        compiled = self.profile.current
+        if compiled.escalation.get(behavior) is None:
+            return level, priority, False
+        now = self.clock() if now is None else now
+        with self.lock:
+            if compiled is not self.compiled:
+                self._rebind(compiled)
+            if self.trip_store is not None:
+                self._check_trip()
+            step = compiled.escalation[behavior].step_for(self.windows[behavior].add(now))
+            if step is None:
+                return level, priority, False
+            return self._apply(step, compiled, behavior, level, priority, now)
+
+    def _apply(self, step, compiled, behavior, level, priority, now):
+        escalated = False
+        if step.level is not None:
+            try:
+                current = int(level) if level is not None else 0
+            except (TypeError, ValueError):
+                current = 0
+            if step.level > current:
+                level = step.level
+                escalated = True
+        if step.priority is not None and (priority is None or step.priority < priority):
+            priority = step.priority
+            escalated = True
+        if escalated:
+            self.escalated[behavior] += 1
+
+        suggest_rest = False
+        if step.suggest_rest and compiled.rest_prompt is not None and not self.rest_pending:
+            if self.last_rest is None or now - self.last_rest >= compiled.rest_prompt.cooldown:
+                self.last_rest = now
+                suggest_rest = True
+        return level, priority, suggest_rest
+
+    def suggest_rest(self):
+        """Speaks the rest prompt once the current alert has finished (background thread)."""
+        prompt = self.profile.current.rest_prompt
+        if prompt is None or self.audio_service is None or self.rest_pending:
+            return
+        self.rest_pending = True
+        thread = threading.Thread(target=self._speak_rest, args=(prompt,), name="RestPrompt")
+        thread.daemon = True
+        thread.start()
+
+    def _speak_rest(self, prompt):
+        try:
+            deadline = time.monotonic() + prompt.max_wait
+            while self.audio_service.is_busy() and time.monotonic() < deadline:
+                time.sleep(0.2)
+            print(f"[EscalationEngine] Suggesting a rest: '{prompt.text}'")
+            self.audio_service.speak(prompt.text, priority=prompt.priority)
+            self.rest_prompts += 1
+        except Exception as e:
+            print(f"[EscalationEngine] Rest prompt failed: {e}")
+        finally:
+            self.rest_pending = False
+
+    def rates(self, now=None):
+        """{behavior: alerts in its window} (for the metrics endpoint)."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            return {behavior: window.count(now) for behavior, window in self.windows.items()}
+
+    def stats(self):
+        stats = {f"escalated_{behavior}": count for behavior, count in list(self.escalated.items())}
+        stats["rest_prompts"] = self.rest_prompts
+        return stats
@@ -1,23 +1,98 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+import collections
 import datetime
 import threading
 import time
+from services.connectivity import ConnectivityManager
+from services.doc_cache import DocCache, diff_fields
+from services.profiler import timed
+
+DEFAULT_DEVICE_ID = "jetson-nano-iot-test"
+
+DEVICE_INFO = {
+    "model": "Jetson Nano",
+    "version": "1.0.0"
+}
+
+
+def build_greeting(full_name, is_startup):
+    if is_startup:
+        # Startup message
+        return f"Chào mừng {full_name} trở lại, chúc bạn có chuyến đi vui vẻ và bình an"
+    # Realtime message
+    return f"Chào mừng {full_name} đến với hệ thống, chúc bạn có chuyến đi vui vẻ và bình an"
+
+
+def greet_from_cache(cache, audio_service, device_id=DEFAULT_DEVICE_ID):
+    """
+    Greets the user linked at last shutdown using only the local cache, before the network is up.
+    Only a greeting pre-rendered into the audio bank plays (scripts/build_audio_bank.py --greet);
+    gTTS would need the network. Returns the greeted user id (pass it to
+    FirebaseService.greeted_user_id) only when the greeting played, else None so the live
+    snapshot greets instead.
+    """
+    device = cache.get(f"devices/{device_id}")
+    user_id = device.get("linkedUserId") if device else None
+    user = cache.get(f"users/{user_id}") if user_id else None
+    if not user:
+        return None
+
+    message = build_greeting(user.get("fullName", "bạn"), is_startup=True)
+    print(f"[FirebaseService] Playing cached TTS: {message}")
+    if audio_service and audio_service.speak(message, priority=10, lang='vi', offline=True):
+        return user_id
+    return None
+
 
 class FirebaseService:
-    def __init__(self, cred_path, device_id="jetson-nano-iot-test", audio_service=None):
+    # Histories are queried from the last processed time on resubscribe, so a reconnect only
+    # transfers the gap. The field must be server-set (senders write firestore.SERVER_TIMESTAMP,
+    # equal to the doc's create_time); as soon as one alert arrives without it, resubscribes
+    # listen to the whole collection instead. Set to None to always do that.
+    HISTORIES_RESUME_FIELD = "serverTime"
+    # How long the server copy of the device doc may be newer than our last snapshot before
+    # the device listener is considered stalled
+    STALL_GRACE = datetime.timedelta(seconds=30)
+
+    def __init__(self, cred_path, device_id=DEFAULT_DEVICE_ID, audio_service=None, db=None, cache=None,
+                 connectivity=None):
         self.device_id = device_id
         self.audio_service = audio_service
+        # AlertDispatcher shared with the local ingest path (falls back to audio_service directly)
+        self.dispatcher = None
         self.db = None
+        self.cache = cache if cache is not None else DocCache()
+        # Owns the device, user and histories listeners (names "device", "user", "histories")
+        self.connectivity = connectivity or ConnectivityManager(probe=self._probe_device_listener)
         self.linked_user_id = None
-        self.user_listener = None
-        self.histories_listener = None
         self.is_first_load = True # Flag to track startup status
         self.listen_start_time = None 
-        
+        # Resume point for the histories listener: newest processed create_time + recent doc ids
+        self.last_history_time = None
+        self.processed_ids = collections.deque(maxlen=512)
+        self.processed_id_set = set()
+        self.histories_first_snapshot = True
+        # False once an alert without HISTORIES_RESUME_FIELD was seen: a filtered query would miss such docs
+        self.resume_field_ok = True
+        self.device_update_time = None
+        # Device doc defaults are applied from the first device snapshot (no extra get())
+        self.device_init_pending = False
+        # User already greeted (from cache at boot, or from the user snapshot)
+        self.greeted_user_id = None
+        self.greet_as_startup = False
+
+        if db is not None:
+            # Pre-built client (e.g. shared by simulated devices or the emulator)
+            self.db = db
+            return
+
         # Initialize Firebase
         try:
+            # Imported here: firebase_admin pulls in grpc and takes seconds to import on the Nano,
+            # so main.py can get the alert path ready while this loads on another thread.
+            import firebase_admin
+            from firebase_admin import credentials
+            from firebase_admin import firestore
+
             cred = credentials.Certificate(cred_path)
             firebase_admin.initialize_app(cred)
             self.db = firestore.client()
@@ -26,146 +101,194 @@ class FirebaseService:
             print(f"[FirebaseService] Error initializing: {e}")
             raise e
 
+    def _device_path(self):
+        return f"devices/{self.device_id}"
+
     def initialize_device(self):
-        """Creates or updates the device document."""
+        """
+        Creates or updates the device document.
+        The current document comes from the device listener (see start_listening), so this only
+        marks the work as pending; it runs on the first snapshot and writes nothing if the doc is up to date.
+        """
+        self.device_init_pending = True
+
+    def _ensure_device_doc(self, exists, current_data):
         doc_ref = self.db.collection("devices").document(self.device_id)
-        
         try:
-            doc = doc_ref.get()
-            
-            device_data = {
-                "deviceId": self.device_id,
-                "deviceInfo": {
-                    "model": "Jetson Nano",
-                    "version": "1.0.0"
-                }
-            }
-            
-            if doc.exists:
-                current_data = doc.to_dict()
-                # Preserve existing fields if they exist, else set default
-                if "linkedUserId" not in current_data:
-                    device_data["linkedUserId"] = None
-                
-                if "linkedAt" not in current_data:
-                    device_data["linkedAt"] = None
-                    
-                if "status" not in current_data:
-                    device_data["status"] = "deactivate"
-                
-                # We merge to update deviceInfo but keep others if they exist (or set defaults if missing)
-                # Actually, user said: "nếu như lúc chạy lên có dữ liệu thì giữ nguyên dữ liệu còn chưa có thì mặc định là null"
-                # So we only set defaults if they are MISSING.
-                # The merge=True in set() will update provided fields and keep others.
-                # But we want to ensure defaults are set if missing.
-                
-                # Let's prepare the update dict
-                update_data = {
+            if not exists:
+                # New document
+                device_data = {
                     "deviceId": self.device_id,
-                    "deviceInfo": {
-                        "model": "Jetson Nano",
-                        "version": "1.0.0"
-                    }
+                    "deviceInfo": dict(DEVICE_INFO),
+                    "linkedUserId": None,
+                    "linkedAt": None,
+                    "status": "deactivate",
                 }
-                # Check and set defaults if missing in DB
-                if "linkedUserId" not in current_data:
-                    update_data["linkedUserId"] = None
-                if "linkedAt" not in current_data:
-                    update_data["linkedAt"] = None
-                if "status" not in current_data:
-                    update_data["status"] = "deactivate"
-                    
-                doc_ref.set(update_data, merge=True)
-                print(f"[FirebaseService] Device {self.device_id} updated.")
-                
-            else:
-                # New document
-                device_data["linkedUserId"] = None
-                device_data["linkedAt"] = None
-                device_data["status"] = "deactivate"
                 doc_ref.set(device_data)
                 print(f"[FirebaseService] Device {self.device_id} created.")
-                
+                return
+
+            # "nếu như lúc chạy lên có dữ liệu thì giữ nguyên dữ liệu còn chưa có thì mặc định là null"
+            # -> keep existing fields, only add defaults for the MISSING ones.
+            update_data = diff_fields(current_data, {
+                "deviceId": self.device_id,
+                "deviceInfo": dict(DEVICE_INFO),
+            })
+            for field, default in (("linkedUserId", None), ("linkedAt", None), ("status", "deactivate")):
+                if field not in current_data:
+                    update_data[field] = default
+
+            if not update_data:
+                print(f"[FirebaseService] Device {self.device_id} up to date, skipping write.")
+                return
+            doc_ref.set(update_data, merge=True)
+            print(f"[FirebaseService] Device {self.device_id} updated: {sorted(update_data)}")
         except Exception as e:
             print(f"[FirebaseService] Error initializing device: {e}")
 
     def start_listening(self):
         """Starts listening to device changes."""
         doc_ref = self.db.collection("devices").document(self.device_id)
-        self.user_listener = doc_ref.on_snapshot(self._on_device_snapshot)
+        self.connectivity.register("device", doc_ref.on_snapshot, self._on_device_snapshot)
+        self.connectivity.start()
         print(f"[FirebaseService] Listening for changes on device {self.device_id}...")
 
+    def stop_listening(self):
+        self.connectivity.stop()
+
+    def _probe_device_listener(self):
+        """
+        Connectivity probe: one point read of the device doc. Raises when Firestore is unreachable,
+        returns False when the server copy is newer than anything the device listener delivered.
+        """
+        doc = self.db.collection("devices").document(self.device_id).get(timeout=10)
+        server_time = getattr(doc, "update_time", None)
+        if server_time is None or self.device_update_time is None:
+            return True
+        if server_time <= self.device_update_time:
+            return True
+        age = datetime.datetime.now(datetime.timezone.utc) - server_time
+        return age < self.STALL_GRACE
+
     def _on_device_snapshot(self, doc_snapshot, changes, read_time):
-        for doc in doc_snapshot:
-            data = doc.to_dict()
+        # A watch on a missing (or deleted) document calls back with an empty list
+        for doc in list(doc_snapshot) or [None]:
+            exists = doc is not None and getattr(doc, "exists", True)
+            update_time = getattr(doc, "update_time", None)
+            if update_time is not None:
+                self.device_update_time = update_time
+            data = (doc.to_dict() or {}) if exists else {}
+            self.cache.put(self._device_path(), data if exists else None)
+
+            if self.device_init_pending:
+                self.device_init_pending = False
+                self._ensure_device_doc(exists, data)
+
             new_linked_user_id = data.get("linkedUserId")
             
             if new_linked_user_id != self.linked_user_id:
                 self.linked_user_id = new_linked_user_id
                 print(f"[FirebaseService] Linked User ID changed to: {self.linked_user_id}")
                 
-                print(f"[FirebaseService] Linked User ID changed to: {self.linked_user_id}")
-                
-                # If we have a user, start listening to their histories
+                # If we have a user, start listening to their profile and histories
                 if self.linked_user_id:
-                    self._fetch_user_info(is_startup=self.is_first_load)
+                    self.greet_as_startup = self.is_first_load
+                    self._listen_to_user()
                     self._listen_to_histories()
                 else:
                     # Stop listening if unlinked
-                    if self.histories_listener:
-                        self.histories_listener.unsubscribe()
-                        self.histories_listener = None
-                        print("[FirebaseService] Unlinked. Stopped listening to histories.")
+                    self.greeted_user_id = None
+                    self.connectivity.unregister("user")
+                    self.connectivity.unregister("histories")
+                    print("[FirebaseService] Unlinked. Stopped listening to histories.")
 
         # After processing the snapshot, update first load flag
         self.is_first_load = False
 
-    def _fetch_user_info(self, is_startup=False):
+    def _listen_to_user(self):
+        """Keeps users/{uid} in the cache via a listener instead of a blocking get() per link change."""
+        user_ref = self.db.collection("users").document(self.linked_user_id)
+        self.connectivity.register("user", user_ref.on_snapshot, self._on_user_snapshot)
+        print(f"[FirebaseService] Listening to user doc {self.linked_user_id}...")
+
+    def _on_user_snapshot(self, doc_snapshot, changes, read_time):
+        for doc in doc_snapshot:
+            user_id = doc.id
+            if user_id != self.linked_user_id:
+                # Late snapshot from a listener we already replaced
+                continue
+            if not getattr(doc, "exists", True):
+                print(f"[FirebaseService] User {user_id} not found in 'users' collection.")
+                self.cache.put(f"users/{user_id}", None)
+                continue
+
+            data = doc.to_dict() or {}
+            self.cache.put(f"users/{user_id}", data)
+
+            if user_id == self.greeted_user_id:
+                # Profile edit, or the user was already greeted from cache at boot
+                continue
+            self.greeted_user_id = user_id
+            self._greet_user(data, is_startup=self.greet_as_startup)
+
+    def _greet_user(self, data, is_startup=False):
         try:
-            print(f"[FirebaseService] Fetching info for user: {self.linked_user_id}")
-            user_doc = self.db.collection("users").document(self.linked_user_id).get()
-            if user_doc.exists:
-                data = user_doc.to_dict()
-                print(f"[FirebaseService] User Info: {data}")
-                
-                full_name = data.get("fullName", "bạn")
-                
-                message = ""
-                if is_startup:
-                    # Startup message
-                    message = f"Chào mừng {full_name} trở lại, chúc bạn có chuyến đi vui vẻ và bình an"
-                else:
-                    # Realtime message
-                    message = f"Chào mừng {full_name} đến với hệ thống, chúc bạn có chuyến đi vui vẻ và bình an"
-                
-                print(f"[FirebaseService] Playing TTS: {message}")
-                if self.audio_service:
-                    # Use a low priority (e.g., 10) so it doesn't override critical warnings (priority 1 or 2)
-                    # But ensures it plays if nothing else is playing.
-                    self.audio_service.speak(message, priority=10, lang='vi')
-                    
-            else:
-                print(f"[FirebaseService] User {self.linked_user_id} not found in 'users' collection.")
+            print(f"[FirebaseService] User Info: {data}")
+            message = build_greeting(data.get("fullName", "bạn"), is_startup)
+            print(f"[FirebaseService] Playing TTS: {message}")
+            if self.audio_service:
+                # Use a low priority (e.g., 10) so it doesn't override critical warnings (priority 1 or 2)
+                # But ensures it plays if nothing else is playing.
+                self.audio_service.speak(message, priority=10, lang='vi')
         except Exception as e:
-            print(f"[FirebaseService] Error fetching user info: {e}")
+            print(f"[FirebaseService] Error greeting user: {e}")
 
     def _listen_to_histories(self):
-        if self.histories_listener:
-            self.histories_listener.unsubscribe()
-            
-        histories_ref = self.db.collection("users").document(self.linked_user_id).collection("histories")
-        
         # Set start time for filtering (UTC to match Firestore)
         self.listen_start_time = datetime.datetime.now(datetime.timezone.utc)
+        self.last_history_time = None
+        self.resume_field_ok = True
+        self.processed_ids.clear()
+        self.processed_id_set.clear()
         print(f"[FirebaseService] Listening to histories from: {self.listen_start_time}")
 
         # Listen for new additions
-        self.histories_listener = histories_ref.on_snapshot(self._on_histories_snapshot)
+        self.connectivity.register("histories", self._subscribe_histories, self._on_histories_snapshot)
         print(f"[FirebaseService] Listening to histories for user {self.linked_user_id}...")
 
+    def _subscribe_histories(self, callback):
+        """(Re)subscribes the histories listener, resuming from the last processed alert."""
+        query = self.db.collection("users").document(self.linked_user_id).collection("histories")
+        if self.HISTORIES_RESUME_FIELD and self.resume_field_ok and self.last_history_time:
+            # Server-set, so no sender clock skew; replays at the boundary are dropped by doc id
+            query = query.where(self.HISTORIES_RESUME_FIELD, ">=", self.last_history_time)
+            print(f"[FirebaseService] Resuming histories after {self.last_history_time}")
+        elif self.last_history_time:
+            print(f"[FirebaseService] Resuming histories after {self.last_history_time} (full listen)")
+        self.histories_first_snapshot = True
+        return query.on_snapshot(callback)
+
+    def _mark_processed(self, doc_id, create_time):
+        if len(self.processed_ids) == self.processed_ids.maxlen:
+            self.processed_id_set.discard(self.processed_ids[0])
+        self.processed_ids.append(doc_id)
+        self.processed_id_set.add(doc_id)
+        if create_time and (self.last_history_time is None or create_time > self.last_history_time):
+            self.last_history_time = create_time
+
+    @timed("firebase.histories_snapshot")
     def _on_histories_snapshot(self, col_snapshot, changes, read_time):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        # Changes are not in create_time order, so only alerts older than the previous snapshots' newest are replays
+        replayed_before = self.last_history_time
+        delivered = 0
         for change in changes:
             if change.type.name == 'ADDED':
+                doc_id = change.document.id
+                if doc_id in self.processed_id_set:
+                    # Already handled before a resubscribe
+                    continue
+
                 data = change.document.to_dict()
                 
                 # Use server-side create_time for filtering
@@ -178,6 +301,15 @@ class FirebaseService:
                    if create_time < self.listen_start_time:
                        print(f"[FirebaseService] Ignoring historical alert (Created: {create_time} vs Start: {self.listen_start_time})")
                        continue
+                # Committed before an alert we already delivered, so it was in that snapshot
+                if replayed_before and create_time and create_time < replayed_before:
+                    continue
+                if self.HISTORIES_RESUME_FIELD and data.get(self.HISTORIES_RESUME_FIELD) is None:
+                    self.resume_field_ok = False
+
+                self._mark_processed(doc_id, create_time)
+                delivered += 1
+                self.connectivity.record_alert((now - create_time).total_seconds() if create_time else None)
                 
                 print(f"[FirebaseService] New history added: {data}")
                 
@@ -185,11 +317,29 @@ class FirebaseService:
                 priority = data.get("priority")
                 level = data.get("level")
                 
-                if behavior and priority is not None:
-                    if self.audio_service:
-                        # Ensure priority is int
+                if behavior:
+                    # Ensure priority is int; None means "use the profile default"
+                    if priority is not None:
                         try:
                             priority = int(priority)
                         except:
                             pass
+                    if self.dispatcher:
+                        event_id = data.get("eventId", doc_id)
+                        if self.dispatcher.ack_writer:
+                            self.dispatcher.ack_writer.attach_path(event_id, change.document.reference.path)
+                        # Same path as the local ingest socket; the dispatcher drops the copy
+                        # of an event that already arrived locally (matched on eventId / doc id)
+                        self.dispatcher.dispatch(
+                            behavior, level, priority,
+                            event_id=event_id,
+                            source="firestore",
+                            created_at=create_time.timestamp() if create_time else None,
+                        )
+                    elif self.audio_service:
                         self.audio_service.play_sound(behavior, level, priority)
+
+        if self.histories_first_snapshot:
+            # Alerts created while we were not subscribed (0 on a clean start)
+            self.histories_first_snapshot = False
+            self.connectivity.record_backlog(delivered)
@@ -0,0 +1,220 @@
+import datetime
+import json
+import os
+import struct
+import time
+
+DEFAULT_GPS_STATE_PATH = r"data/gps_state.json"
+
+UBX_SYNC = b"\xb5\x62"
+
+# (class, id)
+CFG_PRT = (0x06, 0x00)
+CFG_MSG = (0x06, 0x01)
+CFG_RST = (0x06, 0x04)
+CFG_RATE = (0x06, 0x08)
+ACK_NAK = (0x05, 0x00)
+ACK_ACK = (0x05, 0x01)
+MGA_INI = (0x13, 0x40)
+
+NMEA_CLASS = 0xF0
+NMEA_IDS = {"GGA": 0x00, "GLL": 0x01, "GSA": 0x02, "GSV": 0x03, "RMC": 0x04, "VTG": 0x05, "ZDA": 0x08}
+
+PORT_UART1 = 1
+PORT_USB = 3
+
+# CFG-RST navBbrMask: which battery-backed data the receiver forgets
+RESET_BBR = {"hot": 0x0000, "warm": 0x0001, "cold": 0xFFFF}
+
+# Position older than this is not injected (the receiver would search the wrong sky)
+MAX_STATE_AGE = 4 * 3600
+
+
+def ubx_checksum(body):
+    ck_a = ck_b = 0
+    for byte in body:
+        ck_a = (ck_a + byte) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return bytes((ck_a, ck_b))
+
+
+def ubx_message(msg, payload=b""):
+    """Frames one UBX message. msg is a (class, id) tuple."""
+    body = struct.pack("<BBH", msg[0], msg[1], len(payload)) + payload
+    return UBX_SYNC + body + ubx_checksum(body)
+
+
+class UbxParser:
+    """Pulls UBX frames out of a mixed UBX/NMEA byte stream."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Returns [((class, id), payload)] for every complete, valid frame in data."""
+        self.buffer += data
+        messages = []
+        while True:
+            start = self.buffer.find(UBX_SYNC)
+            if start < 0:
+                del self.buffer[:-1]  # Keep a trailing 0xB5 in case the sync word is split
+                return messages
+            del self.buffer[:start]
+            if len(self.buffer) < 6:
+                return messages
+            length = struct.unpack_from("<H", self.buffer, 4)[0]
+            if len(self.buffer) < 8 + length:
+                return messages
+            frame = bytes(self.buffer[:8 + length])
+            if ubx_checksum(frame[2:6 + length]) == frame[6 + length:]:
+                messages.append(((frame[2], frame[3]), frame[6:6 + length]))
+                del self.buffer[:8 + length]
+            else:
+                del self.buffer[:2]  # Bad frame: resync after this sync word
+
+
+def cfg_msg_rate(sentence, rate):
+    """CFG-MSG (short form: current port) setting an NMEA sentence's output rate (0 = off)."""
+    return ubx_message(CFG_MSG, struct.pack("<BBB", NMEA_CLASS, NMEA_IDS[sentence], rate))
+
+
+def cfg_rate(meas_rate_ms):
+    """CFG-RATE: one navigation solution every meas_rate_ms, aligned to GPS time."""
+    return ubx_message(CFG_RATE, struct.pack("<HHH", meas_rate_ms, 1, 1))
+
+
+def cfg_prt_uart(baudrate):
+    """CFG-PRT for UART1: 8N1 at baudrate, UBX+NMEA in and out."""
+    return ubx_message(CFG_PRT, struct.pack("<BBHIIHHHH", PORT_UART1, 0, 0, 0x000008D0, baudrate,
+                                            0x0003, 0x0003, 0, 0))
+
+
+def cfg_rst(kind="hot"):
+    """CFG-RST: controlled GNSS-only restart ("hot", "warm" or "cold"). Not acknowledged."""
+    return ubx_message(CFG_RST, struct.pack("<HBB", RESET_BBR[kind], 0x02, 0))
+
+
+def mga_ini_time_utc(now=None, accuracy_s=2):
+    """MGA-INI-TIME_UTC (M8 and later) from the system clock."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return ubx_message(MGA_INI, struct.pack(
+        "<BBBbHBBBBBBIHHI", 0x10, 0x00, 0x00, -128, now.year, now.month, now.day,
+        now.hour, now.minute, now.second, 0, now.microsecond * 1000, accuracy_s, 0, 0))
+
+
+def mga_ini_pos_llh(lat, lon, alt_m=0.0, accuracy_m=1000.0):
+    """MGA-INI-POS_LLH: approximate position for a hot start."""
+    return ubx_message(MGA_INI, struct.pack(
+        "<BBHiiiI", 0x01, 0x00, 0, int(round(lat * 1e7)), int(round(lon * 1e7)),
+        int(round(alt_m * 100)), int(accuracy_m * 100)))
+
+
+def load_state(path=DEFAULT_GPS_STATE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(lat, lon, alt_m=None, fix_time=None, path=DEFAULT_GPS_STATE_PATH):
+    """Persists the last fix (epoch seconds) for the next boot's hot start."""
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"lat": lat, "lon": lon, "alt": alt_m, "time": fix_time or time.time()}, f)
+        os.replace(tmp, path)
+        print(f"[GpsConfig] Saved last position {lat:.5f}, {lon:.5f} for hot start.")
+    except OSError as e:
+        print(f"[GpsConfig] Could not save GPS state: {e}")
+
+
+class UbxConfigurator:
+    """
+    Configures a u-blox receiver right after the serial port is opened:
+      - injects time (and the last saved position) with MGA-INI for a hot start
+      - turns off NMEA sentences the client does not parse
+      - sets the navigation rate
+      - raises the UART baud rate (skipped on USB, where baud is meaningless)
+    Each CFG message waits for ACK-ACK/ACK-NAK; a receiver that never answers is left as is.
+    """
+
+    def __init__(self, keep_sentences=("GGA", "RMC"), nav_rate_ms=1000, target_baudrate=115200,
+                 ack_timeout=1.0, state_path=DEFAULT_GPS_STATE_PATH):
+        self.keep_sentences = keep_sentences
+        self.nav_rate_ms = nav_rate_ms
+        self.target_baudrate = target_baudrate
+        self.ack_timeout = ack_timeout
+        self.state_path = state_path
+        self.parser = UbxParser()
+        self.results = {}
+
+    def _wait_ack(self, ser, msg):
+        """True on ACK-ACK, False on ACK-NAK, None on timeout."""
+        deadline = time.monotonic() + self.ack_timeout
+        while time.monotonic() < deadline:
+            data = ser.read(ser.in_waiting or 1)
+            for kind, payload in self.parser.feed(data):
+                if kind in (ACK_ACK, ACK_NAK) and tuple(payload[:2]) == msg:
+                    return kind == ACK_ACK
+        return None
+
+    def _send(self, ser, name, frame, msg=None):
+        ser.write(frame)
+        ser.flush()
+        result = self._wait_ack(ser, msg) if msg else True
+        self.results[name] = result
+        return result
+
+    def inject_hot_start(self, ser):
+        self._send(ser, "time", mga_ini_time_utc())
+        state = load_state(self.state_path)
+        if not state:
+            return False
+        age = time.time() - state.get("time", 0)
+        if age > MAX_STATE_AGE:
+            print(f"[GpsConfig] Saved position is {age / 3600:.1f}h old, not injected.")
+            return False
+        # Assume the car moved at most ~30 m/s since the last fix
+        accuracy = min(300000.0, 1000.0 + age * 30.0)
+        self._send(ser, "position", mga_ini_pos_llh(state["lat"], state["lon"], state.get("alt") or 0.0, accuracy))
+        print(f"[GpsConfig] Injected time and last position ({age / 60:.0f} min old) for hot start.")
+        return True
+
+    def configure(self, ser, is_usb=False):
+        """Runs the whole sequence on an open pyserial port. Returns {step: True/False/None}."""
+        self.results = {}
+        self.inject_hot_start(ser)
+
+        for sentence in NMEA_IDS:
+            if sentence not in self.keep_sentences:
+                self._send(ser, f"disable_{sentence}", cfg_msg_rate(sentence, 0), CFG_MSG)
+        self._send(ser, "nav_rate", cfg_rate(self.nav_rate_ms), CFG_RATE)
+
+        if not is_usb and self.target_baudrate and self.target_baudrate != ser.baudrate:
+            old_baudrate = ser.baudrate
+            ser.write(cfg_prt_uart(self.target_baudrate))
+            ser.flush()
+            time.sleep(0.1)  # The receiver switches after sending the ACK at the old rate
+            ser.baudrate = self.target_baudrate
+            ser.reset_input_buffer()
+            if self._wait_for_nmea(ser):
+                self.results["baudrate"] = True
+            else:
+                ser.baudrate = old_baudrate
+                self.results["baudrate"] = False
+                print(f"[GpsConfig] No data at {self.target_baudrate} baud, staying at {old_baudrate}.")
+
+        failed = [step for step, ok in self.results.items() if ok is not True]
+        print(f"[GpsConfig] Receiver configured ({len(self.results) - len(failed)}/{len(self.results)} acknowledged"
+              + (f"; no ack: {', '.join(failed)})" if failed else ")"))
+        return self.results
+
+    def _wait_for_nmea(self, ser, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            line = ser.readline()
+            if line.startswith(b"$") and b"*" in line:
+                return True
+        return False
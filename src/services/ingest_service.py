@@ -0,0 +1,214 @@
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import uuid
+
+# Compact binary datagram (32 bytes):
+#   magic 'A', version, behavior code, level (-1 = none), priority (-1 = none), 3 pad,
+#   detection time (uint64 epoch ms), event id (16 raw bytes, all zero = none)
+BINARY_FORMAT = "!cBBbb3xQ16s"
+BINARY_SIZE = struct.calcsize(BINARY_FORMAT)
+BINARY_MAGIC = b"A"
+BINARY_VERSION = 1
+
+# Behavior codes for the binary format (index = code). Append only, never reorder.
+BEHAVIOR_CODES = ("sleepy_eye", "yawn", "phone", "look_away")
+_BEHAVIOR_INDEX = {name: code for code, name in enumerate(BEHAVIOR_CODES)}
+
+_NO_ID = bytes(16)
+
+
+def encode_binary(behavior, level=None, priority=None, event_id=None, ts=None):
+    """Builds a binary alert datagram. event_id may be a uuid string; ts is epoch seconds."""
+    ts = time.time() if ts is None else ts
+    raw_id = uuid.UUID(event_id).bytes if event_id else _NO_ID
+    return struct.pack(BINARY_FORMAT, BINARY_MAGIC, BINARY_VERSION, _BEHAVIOR_INDEX[behavior],
+                       -1 if level is None else int(level), -1 if priority is None else int(priority),
+                       int(ts * 1000), raw_id)
+
+
+def encode_json(behavior, level=None, priority=None, event_id=None, ts=None):
+    """Builds one line-JSON alert message (newline terminated)."""
+    message = {"behavior": behavior, "level": level, "priority": priority,
+               "ts": int((time.time() if ts is None else ts) * 1000)}
+    if event_id:
+        message["id"] = event_id
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def decode_message(data):
+    """Returns a dict with behavior/level/priority/id/ts (ts in epoch seconds), or raises ValueError."""
+    if data[:1] == BINARY_MAGIC and len(data) == BINARY_SIZE:
+        _, version, code, level, priority, ts_ms, raw_id = struct.unpack(BINARY_FORMAT, data)
+        if version != BINARY_VERSION or code >= len(BEHAVIOR_CODES):
+            raise ValueError(f"unsupported binary message (version={version}, behavior={code})")
+        return {
+            "behavior": BEHAVIOR_CODES[code],
+            "level": None if level < 0 else level,
+            "priority": None if priority < 0 else priority,
+            "id": None if raw_id == _NO_ID else str(uuid.UUID(bytes=raw_id)),
+            "ts": ts_ms / 1000.0 if ts_ms else None,
+        }
+
+    message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError("message must be a JSON object")
+    ts = message.get("ts")
+    message["ts"] = ts / 1000.0 if isinstance(ts, (int, float)) else None
+    return message
+
+
+class IngestService:
+    """
+    Local alert ingest that skips the Firestore round trip.
+    Accepts the same {behavior, level, priority} payload on:
+      - UDP (localhost or LAN): one binary or JSON message per datagram
+      - Unix domain stream socket: newline-delimited JSON
+    Every alert goes through the shared AlertDispatcher, which drops the later Firestore copy.
+    Messages with a "cmd" key are control commands (see register_command).
+    """
+
+    def __init__(self, dispatcher, udp_host="127.0.0.1", udp_port=5055, unix_path="/tmp/ck_alerts.sock"):
+        self.dispatcher = dispatcher
+        self.udp_host = udp_host
+        self.udp_port = udp_port
+        self.unix_path = unix_path
+
+        self.selector = None
+        self.running = False
+        self.thread = None
+        self.commands = {}  # name -> callable(message) -> dict reply
+
+        self.received = 0
+        self.rejected = 0
+
+    def register_command(self, name, handler):
+        self.commands[name] = handler
+
+    def start(self):
+        if self.running:
+            return
+        self.selector = selectors.DefaultSelector()
+
+        if self.udp_port:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            udp.bind((self.udp_host, self.udp_port))
+            udp.setblocking(False)
+            self.selector.register(udp, selectors.EVENT_READ, self._on_udp)
+            print(f"[IngestService] UDP ingest on {self.udp_host}:{self.udp_port}")
+
+        if self.unix_path and hasattr(socket, "AF_UNIX"):
+            try:
+                os.unlink(self.unix_path)
+            except FileNotFoundError:
+                pass
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(self.unix_path)
+            server.listen(8)
+            server.setblocking(False)
+            self.selector.register(server, selectors.EVENT_READ, self._on_accept)
+            print(f"[IngestService] Unix socket ingest on {self.unix_path}")
+
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="Ingest")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        if self.selector:
+            for key in list(self.selector.get_map().values()):
+                key.fileobj.close()
+            self.selector.close()
+            self.selector = None
+        if self.unix_path:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+
+    def _loop(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.5):
+                try:
+                    key.data(key.fileobj)
+                except Exception as e:
+                    print(f"[IngestService] Error: {e}")
+
+    def _on_udp(self, sock):
+        data, addr = sock.recvfrom(2048)
+        reply = self._handle(data)
+        if reply is not None:
+            sock.sendto(json.dumps(reply).encode("utf-8"), addr)
+
+    def _on_accept(self, server):
+        conn, _ = server.accept()
+        conn.setblocking(False)
+        self.selector.register(conn, selectors.EVENT_READ, _LineReader(self, conn))
+
+    def _handle(self, data):
+        """Parses and dispatches one message. Returns a reply dict for control commands."""
+        recv_time = time.time()
+        try:
+            message = decode_message(data)
+        except ValueError as e:
+            self.rejected += 1
+            print(f"[IngestService] Rejected message: {e}")
+            return None
+
+        command = message.get("cmd")
+        if command:
+            handler = self.commands.get(command)
+            if not handler:
+                return {"ok": False, "error": f"unknown command {command}"}
+            return handler(message)
+
+        behavior = message.get("behavior")
+        if not behavior:
+            self.rejected += 1
+            return None
+        self.received += 1
+        self.dispatcher.dispatch(
+            behavior,
+            message.get("level"),
+            message.get("priority"),
+            event_id=message.get("id"),
+            source="local",
+            created_at=message.get("ts") or recv_time,
+        )
+        return None
+
+
+class _LineReader:
+    """Per-connection state for the newline-delimited JSON stream."""
+
+    MAX_LINE = 4096
+
+    def __init__(self, service, conn):
+        self.service = service
+        self.conn = conn
+        self.buffer = b""
+
+    def __call__(self, conn):
+        chunk = conn.recv(4096)
+        if not chunk:
+            self.service.selector.unregister(conn)
+            conn.close()
+            return
+        self.buffer += chunk
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            if line.strip():
+                reply = self.service._handle(line)
+                if reply is not None:
+                    conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+        if len(self.buffer) > self.MAX_LINE:
+            print("[IngestService] Dropping oversized line")
+            self.buffer = b""
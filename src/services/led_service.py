@@ -1,7 +1,7 @@
 try:
     import Jetson.GPIO as GPIO
 except ImportError:
-    # Check if we are potentially on a system that supports it but it's just missing, 
+    # Check if we are potentially on a system that supports it but it's just missing,
     # or if we are on Windows where it definitely won't work well (unless using a specific windows fork).
     # Since the user is testing on Windows, a mock is helpful.
     print("[LedService] Jetson.GPIO not found or failed to import. Using Mock GPIO.")
@@ -13,6 +13,8 @@ except ImportError:
         HIGH = 1
         FALLING = 'FALLING'
         @staticmethod
+        def getmode(): return None
+        @staticmethod
         def setmode(*args): pass
         @staticmethod
         def setup(*args, **kwargs): print(f"[MockGPIO] setup {args} {kwargs}")
@@ -26,9 +28,41 @@ except ImportError:
         def input(*args): return 0
 import threading
 import time
+from services.profiler import timed
+
+
+class LedEffect:
+    """
+    A precomputed LED animation.
+    frames: list of tuples, one value per pin in LedService.all_pins order.
+    ticks_per_frame: how many engine ticks each frame is held.
+    A single-frame effect is static and costs nothing once applied.
+    """
+    __slots__ = ("name", "frames", "ticks_per_frame")
+
+    def __init__(self, name, frames, ticks_per_frame=1):
+        self.name = name
+        self.frames = frames
+        self.ticks_per_frame = max(1, int(ticks_per_frame))
+
+    @property
+    def is_static(self):
+        return len(self.frames) == 1
+
 
 class LedService:
-    def __init__(self):
+    # Engine tick: every effect period is a multiple of this
+    TICK_INTERVAL = 0.05
+
+    # Default pattern per behavior level (level -> pattern name)
+    LEVEL_PATTERNS = {
+        None: "solid",
+        1: "solid",
+        2: "blink",
+        3: "pulse",
+    }
+
+    def __init__(self, tick_interval=None):
         # Map filenames to GPIO pins (BOARD mode)
         self.pins_map = {
             "sleepy_eye_level_1_and_yawn.wav": 32,
@@ -40,11 +74,28 @@ class LedService:
         self.all_pins = list(self.pins_map.values())
         # Order for chase effect: 32 -> 33 -> 35 -> 36 -> 37
         self.sorted_pins = sorted(self.all_pins)
-        
-        self.is_running_effect = False
-        self.effect_thread = None
+        self.tick_interval = tick_interval or self.TICK_INTERVAL
+
+        self.off_frame = tuple(GPIO.LOW for _ in self.all_pins)
+        self.off_effect = LedEffect("off", [self.off_frame])
+
+        # Desired effect (written by callers) and the frame last written to GPIO (engine only)
         self.lock = threading.Lock()
-        
+        self._effect = self.off_effect
+        self._effect_start_tick = 0
+        self._applied = [None] * len(self.all_pins)  # None = unknown, forces first write
+        self._tick = 0
+        self._wake = threading.Event()
+        self._running = False
+        self.engine_thread = None
+
+        # Per-frame cost counters (read without locking, monotonic ints/floats)
+        self.frames_applied = 0
+        self.gpio_calls = 0
+        self.pin_writes = 0
+        self.frame_time_total = 0.0
+        self.frame_time_max = 0.0
+
         # Initialize GPIO
         try:
             cur_mode = GPIO.getmode()
@@ -60,99 +111,197 @@ class LedService:
                 except Exception as e:
                      print(f"[LedService] Could not switch mode: {e}")
 
-            for pin in self.all_pins:
-                GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
-            
-            # CRITICAL: Ensure all lights are OFF immediately on startup
-            self.turn_off_all()
-            
+            # CRITICAL: Ensure all lights are OFF immediately on startup (initial=LOW, one call)
+            GPIO.setup(self.all_pins, GPIO.OUT, initial=GPIO.LOW)
+            self._applied = list(self.off_frame)
+
             print("[LedService] Initialized GPIO pins: ", self.all_pins)
         except Exception as e:
             print(f"[LedService] GPIO Init Error: {e}")
 
-    def turn_on_file(self, filename):
+        self._start_engine()
+
+    # ---------- Effect builders ----------
+
+    def _frame_for(self, on_pins):
+        return tuple(GPIO.HIGH if pin in on_pins else GPIO.LOW for pin in self.all_pins)
+
+    def _ticks(self, seconds):
+        return max(1, int(round(seconds / self.tick_interval)))
+
+    def build_effect(self, pattern, pins):
+        """Precomputes the frames for a named pattern over the given pins."""
+        pins = [pin for pin in pins if pin in self.all_pins]
+        on = self._frame_for(pins)
+        off = self.off_frame
+
+        if not pins or pattern == "off":
+            return self.off_effect
+        if pattern == "solid":
+            return LedEffect("solid", [on])
+        if pattern == "blink":
+            # 0.5s on / 0.5s off
+            return LedEffect("blink", [on, off], self._ticks(0.5))
+        if pattern == "fast_blink":
+            return LedEffect("fast_blink", [on, off], self._ticks(0.15))
+        if pattern == "pulse":
+            # Double flash then pause: on, off, on, off, off, off (0.1s slots)
+            return LedEffect("pulse", [on, off, on, off, off, off], self._ticks(0.1))
+        if pattern == "chase":
+            ordered = [pin for pin in self.sorted_pins if pin in pins]
+            frames = [self._frame_for((pin,)) for pin in ordered]
+            # Speed of chase: 0.1s per LED
+            return LedEffect("chase", frames, self._ticks(0.1))
+
+        print(f"[LedService] Unknown pattern '{pattern}', using solid.")
+        return LedEffect("solid", [on])
+
+    def pattern_for_level(self, level):
+        try:
+            level = int(level)
+        except (TypeError, ValueError):
+            level = None
+        return self.LEVEL_PATTERNS.get(level, "solid")
+
+    # ---------- Public API ----------
+
+    def set_effect(self, effect):
+        """Atomically replaces the running effect. The engine applies it on its next wake-up."""
+        with self.lock:
+            if effect is self._effect:
+                return
+            self._effect = effect
+            self._effect_start_tick = self._tick
+        self._wake.set()
+
+    def show(self, pins, pattern="solid"):
+        """Shows a pattern on the given pins, all other pins off."""
+        self.set_effect(self.build_effect(pattern, pins))
+
+    @property
+    def is_running_effect(self):
+        return not self._effect.is_static
+
+    def turn_on_file(self, filename, level=None):
         """Turns on the LED corresponding to the filename, turns others off."""
-        self.stop_effect()
-        
         target_pin = self.pins_map.get(filename)
         if not target_pin:
             print(f"[LedService] No pin mapped for file: {filename}")
             self.turn_off_all()
             return
 
-        with self.lock:
-            for pin in self.all_pins:
-                if pin == target_pin:
-                    GPIO.output(pin, GPIO.HIGH)
-                else:
-                    GPIO.output(pin, GPIO.LOW)
-        
-        print(f"[LedService] Turned ON pin {target_pin} for {filename}")
+        pattern = self.pattern_for_level(level)
+        self.show([target_pin], pattern)
+        print(f"[LedService] Turned ON pin {target_pin} ({pattern}) for {filename}")
 
     def turn_off_all(self):
         """Turns off all mapped LEDs."""
-        try:
-            with self.lock:
-                for pin in self.all_pins:
-                    GPIO.output(pin, GPIO.HIGH) # According to some active-low setups, but usually LOW is OFF.
-                    # Wait, user said "cắm điện vào thì các đèn lại sáng lên" -> implies they might be active LOW or just floating HIGH.
-                    # BUT usually GPIO.LOW is 0V (OFF).
-                    # If the user says "plug in and they light up", maybe the initialized state was wrong or they are Active LOW relays?
-                    # "phát sáng đèn tương ứng là được" -> indicates positive logic usually.
-                    # Let's assume High=On, Low=Off.
-                    # If they were ON at startup, maybe GPIO.setup defaults?
-                    # The previous code had `initial=GPIO.LOW`.
-                    # I will stick to LOW = OFF.
-                    GPIO.output(pin, GPIO.LOW)
-        except Exception as e:
-            print(f"[LedService] Error turning off: {e}")
+        self.set_effect(self.off_effect)
 
     def start_chasing(self):
         """Starts the running light (chase) effect for TTS."""
-        if self.is_running_effect:
+        if self._effect.name == "chase":
             return
-            
         print("[LedService] Starting chase effect...")
-        self.is_running_effect = True
-        self.effect_thread = threading.Thread(target=self._chase_loop)
-        self.effect_thread.daemon = True
-        self.effect_thread.start()
+        self.show(self.sorted_pins, "chase")
 
     def stop_effect(self):
         """Stops any running effect (blink/chase)."""
         if not self.is_running_effect:
             return
-            
-        self.is_running_effect = False
-        if self.effect_thread and self.effect_thread.is_alive():
-            self.effect_thread.join(timeout=1.0)
-        self.effect_thread = None
         self.turn_off_all()
         print("[LedService] Stopped effect.")
 
-    def _chase_loop(self):
-        """Thread loop for chase effect."""
-        idx = 0
-        while self.is_running_effect:
-            target_pin = self.sorted_pins[idx]
-            
+    def stats(self):
+        """Frame cost counters. Lock-free, safe to call from any thread."""
+        frames = self.frames_applied
+        return {
+            "effect": self._effect.name,
+            "frames_applied": frames,
+            "gpio_calls": self.gpio_calls,
+            "pin_writes": self.pin_writes,
+            "avg_frame_us": (self.frame_time_total / frames * 1e6) if frames else 0.0,
+            "max_frame_us": self.frame_time_max * 1e6,
+        }
+
+    # ---------- Engine ----------
+
+    def _start_engine(self):
+        self._running = True
+        self.engine_thread = threading.Thread(target=self._engine_loop, name="LedEngine")
+        self.engine_thread.daemon = True
+        self.engine_thread.start()
+
+    @timed("led.apply_frame")
+    def _apply_frame(self, frame):
+        """Writes only the pins whose value differs from the last written frame, in one GPIO call."""
+        applied = self._applied
+        channels = []
+        values = []
+        for i, value in enumerate(frame):
+            if applied[i] != value:
+                channels.append(self.all_pins[i])
+                values.append(value)
+        if not channels:
+            return
+
+        t0 = time.perf_counter()
+        try:
+            GPIO.output(channels, values)
+            for i, value in enumerate(frame):
+                applied[i] = value
+        except Exception as e:
+            print(f"[LedService] Error writing frame: {e}")
+            return
+        elapsed = time.perf_counter() - t0
+
+        self.frames_applied += 1
+        self.gpio_calls += 1
+        self.pin_writes += len(channels)
+        self.frame_time_total += elapsed
+        if elapsed > self.frame_time_max:
+            self.frame_time_max = elapsed
+
+    def _engine_loop(self):
+        """Single long-lived thread: ticks while an animated effect runs, sleeps while static."""
+        next_deadline = time.monotonic()
+        while self._running:
             with self.lock:
-                for pin in self.all_pins:
-                    # Only the target pin is ON, others OFF
-                    GPIO.output(pin, GPIO.HIGH if pin == target_pin else GPIO.LOW)
-            
-            # Speed of chase: 0.1s per LED
-            for _ in range(2): # 0.1s total (2 * 0.05)
-                if not self.is_running_effect: break
-                time.sleep(0.05)
-            
-            idx = (idx + 1) % len(self.sorted_pins)
-        
-        # Ensure off when exiting loop
-        self.turn_off_all()
+                effect = self._effect
+                elapsed_ticks = self._tick - self._effect_start_tick
+
+            idx = (elapsed_ticks // effect.ticks_per_frame) % len(effect.frames)
+            self._apply_frame(effect.frames[idx])
+
+            if effect.is_static:
+                # Nothing to animate: block until someone changes the effect
+                self._wake.wait()
+                self._wake.clear()
+                next_deadline = time.monotonic()
+                continue
+
+            # Fixed-rate tick scheduler (deadline based so it does not drift)
+            next_deadline += self.tick_interval
+            timeout = next_deadline - time.monotonic()
+            if timeout < 0:
+                # Fell behind (e.g. CPU starved): skip missed ticks instead of bursting
+                missed = int(-timeout / self.tick_interval) + 1
+                self._tick += missed
+                next_deadline += (missed - 1) * self.tick_interval
+                continue
+            if self._wake.wait(timeout):
+                # Effect changed mid-tick: apply immediately, restart the schedule
+                self._wake.clear()
+                next_deadline = time.monotonic()
+                continue
+            self._tick += 1
 
     def cleanup(self):
-        self.stop_effect()
+        self._running = False
+        self._wake.set()
+        if self.engine_thread and self.engine_thread.is_alive():
+            self.engine_thread.join(timeout=1.0)
+        self._apply_frame(self.off_frame)
         try:
             GPIO.cleanup()
             print("[LedService] GPIO Cleaned up.")
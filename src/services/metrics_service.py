@@ -0,0 +1,254 @@
+import bisect
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Alert latency buckets (seconds): local ingest is sub-10 ms, Firestore over cellular is seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """http.server.ThreadingHTTPServer is 3.7+; JetPack 4's python3 is 3.6."""
+    daemon_threads = True
+
+
+class Histogram:
+    """Fixed-bucket histogram. observe() is a bisect plus two adds; no allocation."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """Cumulative (le, count) pairs in Prometheus order."""
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), list(self.counts)):
+            running += count
+            cumulative.append((bound, running))
+        return cumulative, self.sum, self.count
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class MetricsService:
+    """
+    Embedded HTTP endpoint for a running device:
+      GET /metrics  Prometheus text format
+      GET /status   JSON status document
+    Everything is read from lock-free counters/stats() on the services, so a scrape never
+    takes the audio or LED locks. Extra gauges can be added with register_gauge().
+    """
+
+    def __init__(self, host="127.0.0.1", port=9108):
+        self.host = host
+        self.port = port
+        self.started_at = time.time()
+        self.server = None
+        self.thread = None
+
+        # Sources (any may be None)
+        self.dispatcher = None
+        self.audio_service = None
+        self.led_service = None
+        self.connectivity = None
+        self.sos_service = None
+        self.rtsp_process = None
+
+        # name -> (help, callable() -> number or {label_value: number}, label_name)
+        self.gauges = {}
+        self.scrapes = 0
+
+    def register_gauge(self, name, help_text, fn, label=None):
+        """Adds a gauge read at scrape time. fn returns a number, or a dict when label is given."""
+        self.gauges[name] = (help_text, fn, label)
+
+    # ---------- Collection ----------
+
+    def _rtsp_state(self):
+        proc = self.rtsp_process
+        if proc is None:
+            return "not_started", None
+        code = proc.poll()
+        return ("running", None) if code is None else ("exited", code)
+
+    def collect(self):
+        """Returns [(name, type, help, [(labels, value)])] for every metric family."""
+        families = []
+
+        def add(name, kind, help_text, samples):
+            families.append((name, kind, help_text, samples))
+
+        dispatcher = self.dispatcher
+        if dispatcher:
+            counts = dict(dispatcher.counts)
+            for kind, metric, help_text in (
+                ("received", "ck_alerts_received_total", "Alerts received per ingest path"),
+                ("dispatched", "ck_alerts_dispatched_total", "Alerts handed to audio per ingest path"),
+                ("duplicate", "ck_alerts_duplicate_total", "Alerts dropped as duplicates per ingest path"),
+            ):
+                add(metric, "counter", help_text,
+                    [({"source": source}, value) for (source, k), value in counts.items() if k == kind])
+            add("ck_alert_latency_seconds", "histogram", "Detection to audio start latency",
+                [({"source": source}, histogram) for source, histogram in list(dispatcher.histograms.items())])
+
+        if self.audio_service:
+            outcomes = dict(self.audio_service.outcomes)
+            add("ck_audio_outcomes_total", "counter", "play_sound outcomes (played, ignored, dropped...)",
+                [({"outcome": outcome}, value) for outcome, value in outcomes.items()])
+
+        if self.led_service:
+            led = self.led_service.stats()
+            add("ck_led_frames_total", "counter", "LED frames written", [({}, led["frames_applied"])])
+            add("ck_led_pin_writes_total", "counter", "LED pins written", [({}, led["pin_writes"])])
+            add("ck_led_frame_avg_seconds", "gauge", "Average LED frame write time", [({}, led["avg_frame_us"] / 1e6)])
+
+        if self.connectivity:
+            conn = self.connectivity.stats()
+            add("ck_firestore_connected", "gauge", "1 if Firestore listeners are healthy", [({}, int(conn["connected"]))])
+            add("ck_firestore_disconnected_seconds_total", "counter", "Time spent disconnected",
+                [({}, conn["disconnected_seconds_total"])])
+            add("ck_firestore_listener_restarts_total", "counter", "Listener resubscriptions",
+                [({"listener": name}, h["restarts"]) for name, h in conn["listeners"].items()])
+            add("ck_firestore_alerts_delayed_total", "counter", "Alerts delivered later than the delay threshold",
+                [({}, conn["alerts_delayed"])])
+            add("ck_firestore_backlog", "gauge", "Alerts delivered by the last resubscribe", [({}, conn["last_backlog"])])
+
+        if self.sos_service:
+            sos = self.sos_service.stats()
+            add("ck_sos_sent_total", "counter", "SOS alerts delivered", [({}, sos["sent"])])
+            add("ck_sos_failed_total", "counter", "SOS send attempts that failed", [({}, sos["failed"])])
+            add("ck_sos_outbox_depth", "gauge", "SOS alerts waiting for retry", [({}, sos["outbox_depth"])])
+            if sos["last_fix_age"] is not None:
+                add("ck_gps_fix_age_seconds", "gauge", "Seconds since the last GPS fix", [({}, sos["last_fix_age"])])
+
+        state, code = self._rtsp_state()
+        add("ck_rtsp_up", "gauge", "1 if the RTSP child process is running", [({}, int(state == "running"))])
+
+        for name, (help_text, fn, label) in list(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                add(name, "gauge", help_text, [({label or "key": key}, v) for key, v in value.items()])
+            else:
+                add(name, "gauge", help_text, [({}, value)])
+
+        add("ck_threads", "gauge", "Python threads", [({}, threading.active_count())])
+        rss = _rss_bytes()
+        if rss is not None:
+            add("ck_process_resident_memory_bytes", "gauge", "Resident set size", [({}, rss)])
+        add("ck_uptime_seconds", "gauge", "Seconds since the client started", [({}, time.time() - self.started_at)])
+        return families
+
+    def render_prometheus(self):
+        lines = []
+        for name, kind, help_text, samples in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind == "histogram":
+                    buckets, total, count = value.snapshot()
+                    for bound, cumulative in buckets:
+                        bucket_labels = dict(labels, le=_format_bound(bound))
+                        lines.append(f"{name}_bucket{_label_text(bucket_labels)} {cumulative}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {total}")
+                    lines.append(f"{name}_count{_label_text(labels)} {count}")
+                else:
+                    lines.append(f"{name}{_label_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def status(self):
+        state, code = self._rtsp_state()
+        status = {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "threads": threading.active_count(),
+            "rss_bytes": _rss_bytes(),
+            "rtsp": {"state": state, "exit_code": code,
+                     "pid": self.rtsp_process.pid if self.rtsp_process else None},
+        }
+        if self.dispatcher:
+            status["alerts"] = self.dispatcher.latency_report()
+        if self.audio_service:
+            status["audio"] = dict(self.audio_service.outcomes)
+        if self.led_service:
+            status["led"] = self.led_service.stats()
+        if self.connectivity:
+            status["firestore"] = self.connectivity.stats()
+        if self.sos_service:
+            status["sos"] = self.sos_service.stats()
+        for name, (_, fn, _) in list(self.gauges.items()):
+            try:
+                status.setdefault("gauges", {})[name] = fn()
+            except Exception as e:
+                status.setdefault("gauges", {})[name] = f"error: {e}"
+        return status
+
+    # ---------- HTTP ----------
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                service.scrapes += 1
+                if self.path == "/metrics":
+                    body = service.render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path in ("/status", "/"):
+                    body = json.dumps(service.status(), default=str).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Keep stdout for the services' own logs
+
+        self.server = _ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="Metrics")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[MetricsService] Serving /metrics and /status on http://{self.host}:{self.port}")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,217 @@
+import os
+import threading
+
+POLICIES = {
+    "other": getattr(os, "SCHED_OTHER", 0),
+    "batch": getattr(os, "SCHED_BATCH", 3),
+    "idle": getattr(os, "SCHED_IDLE", 5),
+    "fifo": getattr(os, "SCHED_FIFO", 1),
+    "rr": getattr(os, "SCHED_RR", 2),
+}
+POLICY_NAMES = {value: name for name, value in POLICIES.items()}
+
+# Quad-core Nano: encoder on cores 2-3, alert path on 0, network on 1. Roles are applied in
+# this order, so "main" (every thread of this process) is the default the others override.
+DEFAULT_PLACEMENT = {
+    "main": {"process": "self", "cpus": [0, 1]},
+    "firestore": {"cpus": [1], "threads": ["ConsumeBidirectionalStream", "Connectivity"], "comm": ["grpc"]},
+    "audio": {"cpus": [0], "policy": "fifo", "rt_priority": 40, "nice": -10, "comm": ["SDLAudio"]},
+    "sos": {"cpus": [0], "nice": -5, "threads": ["SosMonitor", "GpsReader", "Ingest", "LedEngine"]},
+    "detector": {"cpus": [1], "nice": 5, "threads": ["DetectorReader", "DetectorWorker"]},
+    "rtsp": {"cpus": [2, 3], "nice": 5},
+}
+
+
+def _task_ids(pid):
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        return []
+
+
+def _comm(pid, tid):
+    try:
+        with open(f"/proc/{pid}/task/{tid}/comm") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _last_cpu(pid, tid):
+    """CPU the task last ran on (field 39 of stat)."""
+    try:
+        with open(f"/proc/{pid}/task/{tid}/stat") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[36])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class PlacementManager:
+    """
+    Applies CPU affinity and nice / real-time policy per role. A role targets
+      - a child process registered with register_process() (all of its threads),
+      - "process": "self" (all threads of this process), or
+      - threads of this process by Python thread name ("threads", substring match) or by
+        kernel thread name ("comm", prefix match) for native threads (SDL audio, gRPC).
+    Roles without a target are skipped. Lowering nice or a real-time policy needs root or
+    CAP_SYS_NICE; without it the role falls back to the nice value it may take and the
+    failure shows up in the report. Threads started later are placed by apply() again
+    (the placement thread does that every `interval` seconds).
+    """
+
+    def __init__(self, config=None, interval=30.0):
+        self.config = config if config is not None else DEFAULT_PLACEMENT
+        self.interval = interval
+        self.online = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        self.processes = {}    # role -> pid
+        self.placed = {}       # (pid, tid) -> role
+        self.errors = {}       # role -> last error text
+        self.lock = threading.Lock()
+        self.running = False
+        self.wake = threading.Event()
+
+    def register_process(self, role, pid):
+        """Places every thread of a child process (RTSP server, audio worker) as `role`."""
+        if pid is None:
+            return
+        self.processes[role] = pid
+        self.apply()
+
+    def _targets(self, role, spec):
+        pid = self.processes.get(role)
+        if pid is not None:
+            return pid, _task_ids(pid)
+        if spec.get("process") == "self":
+            return os.getpid(), _task_ids(os.getpid())
+        names = spec.get("threads", ())
+        prefixes = tuple(spec.get("comm", ()))
+        if not names and not prefixes:
+            return None, []
+        tids = set()
+        for thread in threading.enumerate():
+            native_id = getattr(thread, "native_id", None)
+            if native_id and any(name in thread.name for name in names):
+                tids.add(native_id)
+        if prefixes:
+            for tid in _task_ids(os.getpid()):
+                comm = _comm(os.getpid(), tid)
+                if comm and comm.startswith(prefixes):
+                    tids.add(tid)
+        return os.getpid(), sorted(tids)
+
+    def _apply_task(self, tid, spec):
+        """Returns None, or the reason part of the spec could not be applied."""
+        problems = []
+        cpus = [cpu for cpu in spec.get("cpus", ()) if cpu in self.online]
+        if cpus:
+            try:
+                os.sched_setaffinity(tid, cpus)
+            except OSError as e:
+                problems.append(f"affinity: {e.strerror}")
+
+        policy = spec.get("policy", "other")
+        realtime = policy in ("fifo", "rr")
+        if realtime:
+            try:
+                os.sched_setscheduler(tid, POLICIES[policy], os.sched_param(spec.get("rt_priority", 10)))
+            except OSError as e:
+                problems.append(f"{policy}: {e.strerror}")
+                realtime = False
+        elif policy in ("batch", "idle"):
+            try:
+                os.sched_setscheduler(tid, POLICIES[policy], os.sched_param(0))
+            except OSError as e:
+                problems.append(f"{policy}: {e.strerror}")
+
+        if not realtime and "nice" in spec:
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, spec["nice"])  # Per thread on Linux
+            except OSError as e:
+                problems.append(f"nice {spec['nice']}: {e.strerror}")
+        return "; ".join(problems) or None
+
+    def apply(self):
+        """Places every matching thread not placed yet. Returns the number placed."""
+        if not self.online:
+            return 0
+        placed = 0
+        with self.lock:
+            live = set()
+            for role, spec in self.config.items():
+                pid, tids = self._targets(role, spec)
+                for tid in tids:
+                    live.add((pid, tid))
+                    if self.placed.get((pid, tid)) == role:
+                        continue
+                    if spec.get("process") == "self" and (pid, tid) in self.placed:
+                        continue  # Already claimed by a specific role
+                    error = self._apply_task(tid, spec)
+                    if error:
+                        self.errors[role] = error
+                    self.placed[(pid, tid)] = role
+                    placed += 1
+            for key in list(self.placed):
+                if key not in live:
+                    del self.placed[key]
+        return placed
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.apply()
+        for role, error in self.errors.items():
+            print(f"[PlacementManager] {role}: {error}")
+        thread = threading.Thread(target=self._loop, name="Placement")
+        thread.daemon = True
+        thread.start()
+
+    def _loop(self):
+        while self.running:
+            self.wake.wait(self.interval)
+            if not self.running:
+                break
+            try:
+                self.apply()
+            except Exception as e:
+                print(f"[PlacementManager] Error: {e}")
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+
+    def report(self):
+        """Current placement of every thread of this process and the registered children."""
+        python_names = {t.native_id: t.name for t in threading.enumerate() if getattr(t, "native_id", None)}
+        rows = []
+        pids = [os.getpid()] + [pid for pid in self.processes.values() if pid != os.getpid()]
+        for pid in pids:
+            for tid in _task_ids(pid):
+                try:
+                    affinity = sorted(os.sched_getaffinity(tid))
+                    policy = POLICY_NAMES.get(os.sched_getscheduler(tid), "?")
+                    nice = os.getpriority(os.PRIO_PROCESS, tid)
+                except OSError:
+                    continue  # Thread exited
+                rows.append({
+                    "pid": pid,
+                    "tid": tid,
+                    "name": python_names.get(tid) if pid == os.getpid() else None,
+                    "comm": _comm(pid, tid),
+                    "role": self.placed.get((pid, tid)),
+                    "cpus": affinity,
+                    "policy": policy,
+                    "nice": nice,
+                    "last_cpu": _last_cpu(pid, tid),
+                })
+        return {"online_cpus": self.online, "threads": rows, "errors": dict(self.errors)}
+
+    def print_report(self):
+        report = self.report()
+        print(f"[PlacementManager] Online CPUs {report['online_cpus']}")
+        for row in report["threads"]:
+            label = row["name"] or row["comm"]
+            print(f"[PlacementManager] {row['pid']:>6}/{row['tid']:<6} {label:<28} role={row['role'] or '-':<10} "
+                  f"cpus={row['cpus']} {row['policy']} nice={row['nice']} on={row['last_cpu']}")
+        for role, error in report["errors"].items():
+            print(f"[PlacementManager] {role}: {error}")
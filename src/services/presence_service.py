@@ -0,0 +1,133 @@
+import datetime
+import threading
+import time
+from services.doc_cache import diff_fields
+
+# Fields that change on every check; they ride along with a write but never cause one
+DEFAULT_VOLATILE = ("uptimeSeconds", "alertsPlayed")
+
+
+def fix_state(fix_age):
+    """Buckets the GPS fix age so a ticking age does not count as a state change."""
+    if fix_age is None:
+        return "none"
+    if fix_age < 10:
+        return "fresh"
+    if fix_age < 300:
+        return "stale"
+    return "lost"
+
+
+class PresenceService:
+    """
+    Heartbeat for presence/{deviceId}. collect() is polled every check_interval (local reads
+    only); a write happens when
+      - a stable field changed (at most once per min_interval), or
+      - nothing changed for `interval`, which doubles after each idle heartbeat up to max_interval.
+    Each write is one set(merge=True) carrying only the changed stable fields, the volatile
+    fields and lastSeen. The backend treats a device as offline once lastSeen is older than
+    2 * max_interval.
+
+    doc_ref only needs set(data, merge=True), so a recording stand-in works for tests.
+    """
+
+    def __init__(self, doc_ref, collect, min_interval=30.0, max_interval=300.0, check_interval=5.0,
+                 volatile=DEFAULT_VOLATILE, connectivity=None, clock=time.monotonic):
+        self.doc_ref = doc_ref
+        self.collect = collect
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.check_interval = check_interval
+        self.volatile = volatile
+        self.connectivity = connectivity
+        self.clock = clock
+
+        self.interval = min_interval
+        self.written = {}         # stable fields as last written
+        self.last_write = None    # clock() of the last write
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+
+        self.writes = 0
+        self.fields_written = 0
+        self.checks = 0
+        self.failures = 0
+
+    def poke(self):
+        """Re-check now (e.g. right after a link change or the RTSP child exiting)."""
+        self.wake.set()
+
+    def tick(self):
+        """One check. Returns True if a write was made."""
+        self.checks += 1
+        state = self.collect()
+        stable = {key: value for key, value in state.items() if key not in self.volatile}
+        changed = diff_fields(self.written, stable)
+        now = self.clock()
+        since_write = None if self.last_write is None else now - self.last_write
+
+        if changed:
+            if since_write is not None and since_write < self.min_interval:
+                return False  # Flapping: hold the change until min_interval has passed
+            next_interval = self.min_interval
+        elif since_write is not None and since_write < self.interval:
+            return False
+        else:
+            next_interval = min(self.max_interval, self.interval * 2)
+
+        if self.connectivity is not None and not self.connectivity.connected:
+            return False
+
+        fields = dict(changed)
+        fields.update({key: state[key] for key in self.volatile if key in state})
+        fields["lastSeen"] = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            self.doc_ref.set(fields, merge=True)
+        except Exception as e:
+            self.failures += 1
+            print(f"[PresenceService] Heartbeat failed: {e}")
+            return False
+
+        self.written.update(changed)
+        self.last_write = now
+        self.interval = next_interval
+        self.writes += 1
+        self.fields_written += len(fields)
+        return True
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="Presence")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[PresenceService] Heartbeat every {self.min_interval:.0f}-{self.max_interval:.0f}s.")
+
+    def _loop(self):
+        while self.running:
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[PresenceService] Error: {e}")
+            self.wake.wait(self.check_interval)
+            self.wake.clear()
+
+    def stop(self):
+        """Marks the device offline (one write) and stops the heartbeat."""
+        self.running = False
+        self.wake.set()
+        try:
+            self.doc_ref.set({"online": False, "lastSeen": datetime.datetime.now(datetime.timezone.utc)}, merge=True)
+        except Exception as e:
+            print(f"[PresenceService] Could not mark offline: {e}")
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "checks": self.checks,
+            "fields_written": self.fields_written,
+            "failures": self.failures,
+            "interval": self.interval,
+        }
@@ -0,0 +1,247 @@
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_OUTPUT_DIR = r"data/profiles"
+
+# ---------------------------------------------------------------------------
+# Hot-path timing
+# ---------------------------------------------------------------------------
+
+# Checked on every call of a @timed function; a plain module global keeps the disabled
+# path to one global lookup + one branch.
+TIMING_ENABLED = False
+
+# name -> [count, total_seconds, max_seconds]
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def timed(name):
+    """Times the decorated function into timing_stats() while timing is enabled."""
+    def decorate(fn):
+        stats = _timings.setdefault(name, [0, 0.0, 0.0])
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not TIMING_ENABLED:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - t0
+                with _timings_lock:
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    if elapsed > stats[2]:
+                        stats[2] = elapsed
+        return wrapper
+    return decorate
+
+
+def set_timing(enabled):
+    global TIMING_ENABLED
+    TIMING_ENABLED = bool(enabled)
+    print(f"[Profiler] Hot-path timing {'enabled' if TIMING_ENABLED else 'disabled'}.")
+
+
+def reset_timing():
+    with _timings_lock:
+        for stats in _timings.values():
+            stats[0], stats[1], stats[2] = 0, 0.0, 0.0
+
+
+def timing_stats():
+    """name -> {count, avg_ms, max_ms, total_ms}"""
+    with _timings_lock:
+        items = [(name, list(stats)) for name, stats in _timings.items()]
+    return {
+        name: {
+            "count": count,
+            "avg_ms": (total / count * 1000) if count else 0.0,
+            "max_ms": longest * 1000,
+            "total_ms": total * 1000,
+        }
+        for name, (count, total, longest) in items
+    }
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler
+# ---------------------------------------------------------------------------
+
+class SamplingProfiler:
+    """
+    Low-overhead stack sampler: a timer thread snapshots every thread's stack with
+    sys._current_frames() and counts identical stacks. Nothing runs in the profiled threads.
+    Writes collapsed stacks (flamegraph.pl / speedscope) and a speedscope JSON profile.
+    """
+
+    def __init__(self, interval=0.005, output_dir=DEFAULT_OUTPUT_DIR, max_depth=64):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.thread = None
+        self.running = False
+        self.last_output = None
+
+    @property
+    def active(self):
+        return self.running
+
+    def start(self, seconds=10.0):
+        """Samples for `seconds` in the background, then writes the output files."""
+        if self.running:
+            print("[Profiler] Already running.")
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._run, args=(seconds,), name="Profiler")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[Profiler] Sampling every {self.interval * 1000:.1f} ms for {seconds}s...")
+        return True
+
+    def stop(self):
+        self.running = False
+
+    def _frame_key(self, frame, code_cache):
+        code = frame.f_code
+        key = code_cache.get(code)
+        if key is None:
+            key = (code.co_name, code.co_filename, code.co_firstlineno)
+            code_cache[code] = key
+        return key
+
+    def _run(self, seconds):
+        own_ident = threading.get_ident()
+        stacks = collections.Counter()   # (thread_name, frames...) -> samples
+        code_cache = {}
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_tick = started
+
+        while self.running and time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                depth = 0
+                while frame is not None and depth < self.max_depth:
+                    stack.append(self._frame_key(frame, code_cache))
+                    frame = frame.f_back
+                    depth += 1
+                stack.reverse()
+                stacks[(names.get(ident, str(ident)),) + tuple(stack)] += 1
+            samples += 1
+
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+
+        elapsed = time.perf_counter() - started
+        self.running = False
+        try:
+            self.last_output = self._write(stacks, samples, elapsed)
+            print(f"[Profiler] {samples} samples in {elapsed:.1f}s written to {self.last_output}.*")
+        except OSError as e:
+            print(f"[Profiler] Error writing profile: {e}")
+
+    def _write(self, stacks, samples, elapsed):
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, time.strftime("profile-%Y%m%d-%H%M%S"))
+
+        def label(key):
+            name, filename, line = key
+            return f"{name} ({os.path.basename(filename)}:{line})"
+
+        # Collapsed stacks: "thread;outer;...;inner count"
+        with open(base + ".collapsed", "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join([stack[0]] + [label(key) for key in stack[1:]]) + f" {count}\n")
+
+        # Speedscope sampled profile, one profile per thread
+        frame_index = {}
+        frames = []
+        per_thread = collections.defaultdict(lambda: ([], []))
+        for stack, count in stacks.items():
+            indices = []
+            for key in stack[1:]:
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                indices.append(frame_index[key])
+            sample_list, weights = per_thread[stack[0]]
+            sample_list.append(indices)
+            weights.append(count * self.interval)
+
+        document = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": sample_list,
+                    "weights": weights,
+                }
+                for thread_name, (sample_list, weights) in per_thread.items()
+            ],
+            "name": os.path.basename(base),
+            "exporter": f"ck-profiler ({samples} samples, {elapsed:.1f}s)",
+        }
+        with open(base + ".speedscope.json", "w") as f:
+            json.dump(document, f)
+        return base
+
+
+def install_signal_handlers(profiler, seconds=30.0):
+    """
+    SIGUSR1: profile for `seconds`. SIGUSR2: toggle hot-path timing.
+    Must be called from the main thread.
+    """
+    import signal
+
+    if not hasattr(signal, "SIGUSR1"):
+        return
+
+    def on_usr1(signum, frame):
+        profiler.start(seconds)
+
+    def on_usr2(signum, frame):
+        set_timing(not TIMING_ENABLED)
+
+    signal.signal(signal.SIGUSR1, on_usr1)
+    signal.signal(signal.SIGUSR2, on_usr2)
+    print(f"[Profiler] kill -USR1 {os.getpid()} to profile {seconds:.0f}s, kill -USR2 to toggle timing.")
+
+
+def register_commands(ingest_service, profiler):
+    """Control socket commands: {"cmd": "profile", "seconds": 10}, {"cmd": "timing", "enable": true}."""
+
+    def profile(message):
+        seconds = float(message.get("seconds", 10))
+        started = profiler.start(seconds)
+        return {"ok": started, "seconds": seconds, "output_dir": profiler.output_dir}
+
+    def timing(message):
+        if "enable" in message:
+            set_timing(message["enable"])
+        if message.get("reset"):
+            reset_timing()
+        return {"ok": True, "enabled": TIMING_ENABLED, "stats": timing_stats()}
+
+    ingest_service.register_command("profile", profile)
+    ingest_service.register_command("timing", timing)
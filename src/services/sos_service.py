@@ -1,10 +1,16 @@
 import threading
 import time
+import base64
 import json
-import requests
-import serial
-import pynmea2
 import os
+from services.gps_config import UbxConfigurator, save_state
+from services.profiler import timed
+from services.track_store import TrackRing
+
+DEFAULT_DEVICE_ID = "jetson-nano-iot"
+
+# requests, serial and pynmea2 are imported lazily (see warm_imports) so they
+# don't sit on the boot critical path.
 
 try:
     import Jetson.GPIO as GPIO
@@ -18,6 +24,8 @@ except ImportError:
         HIGH = 1
         FALLING = 'FALLING'
         @staticmethod
+        def getmode(): return None
+        @staticmethod
         def setmode(*args): pass
         @staticmethod
         def setup(*args, **kwargs): pass
@@ -31,7 +39,7 @@ except ImportError:
         def cleanup(): pass
 
 class SosService:
-    def __init__(self, device_id="jetson-nano-iot"):
+    def __init__(self, device_id=DEFAULT_DEVICE_ID):
         self.device_id = device_id
         
         # Hardware Config
@@ -40,19 +48,56 @@ class SosService:
         
         # API Config
         self.MAIN_API_URL = "https://iotapi.chathub.info.vn/api/alerts/create"
+        self.API_TIMEOUT = 10.0
         
         # GPS Config
         self.GPS_PORT = '/dev/ttyACM0'
         self.GPS_BAUDRATE = 9600
         self.GPS_TIMEOUT = 2
-        self.GPS_MAX_READ_LINES = 30
+        self.GPS_FIX_MAX_AGE = 5.0    # a fix older than this is stale
+        self.GPS_WAIT_FOR_FIX = 5.0   # how long an SOS waits for a fresh fix
+        # u-blox setup on start: only GGA/RMC, 1 Hz, faster UART, hot start from the last fix
+        self.GPS_CONFIGURE = True
+        self.GPS_TARGET_BAUDRATE = 115200
+        self.GPS_NAV_RATE_MS = 1000
+
+        # Track of recent fixes (16 bytes/point); the SOS carries the last few minutes of it
+        self.TRACK_CAPACITY = 3600
+        self.TRACK_PERSIST_INTERVAL = 60.0
+        self.SOS_TRACK_MINUTES = 10
+        self.SOS_TRACK_MAX_POINTS = 120
         
         # IP Geo Config
         self.IP_GEO_URL = "http://ip-api.com/json/"
+        self.IP_GEO_TIMEOUT = 4.0
+
+        # Camera snapshot served by the RTSP process (raw camera JPEG, no re-encode)
+        self.SNAPSHOT_URL = "http://127.0.0.1:8090/snapshot.jpg"
+        self.ATTACH_SNAPSHOT = False
+        self.SNAPSHOT_TIMEOUT = 1.0
         
         self.running = False
         self.thread = None
         self.led_timer = None
+        self.trip_store = None  # TripStore: presses are kept in the local history
+
+        # Failed SOS payloads waiting to be resent (oldest first)
+        self.OUTBOX_MAX = 20
+        self.OUTBOX_RETRY_INTERVAL = 30.0
+        self.outbox = []
+        self.outbox_lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush at a time (retry timer vs. after a press)
+        self.retry_timer = None
+
+        # Counters for the metrics endpoint
+        self.sent_count = 0
+        self.failed_count = 0
+        self.last_fix_time = None  # monotonic time of the last GPS fix
+        self.last_fix = None       # (lat, lon, alt) saved on stop for the next hot start
+        self.fix_event = threading.Event()
+        self.rmc_seen = False
+        self.track = TrackRing(capacity=self.TRACK_CAPACITY)
+        self.track.load()
         
         # Init GPIO
         try:
@@ -72,22 +117,37 @@ class SosService:
         except Exception as e:
             print(f"[SosService] GPIO Init Error: {e}")
 
+    @staticmethod
+    def warm_imports():
+        """Imports the network/GPS modules ahead of the first button press (call from a background thread)."""
+        import requests
+        import serial
+        import pynmea2
+
     def start(self):
         """Starts the button monitoring thread."""
         if self.running:
             return
         
         self.running = True
-        self.thread = threading.Thread(target=self._monitor_loop)
+        self.thread = threading.Thread(target=self._monitor_loop, name="SosMonitor")
         self.thread.daemon = True
         self.thread.start()
         print("[SosService] Started monitoring thread.")
 
+        threading.Thread(target=self._gps_loop, name="GpsReader", daemon=True).start()
+
     def stop(self):
         """Stops the monitoring thread."""
         self.running = False
         if self.led_timer:
             self.led_timer.cancel()
+        if self.retry_timer:
+            self.retry_timer.cancel()
+        if self.last_fix:
+            lat, lon, alt = self.last_fix
+            save_state(lat, lon, alt)
+        self.track.save()
         
         # Note: wait_for_edge is blocking, so the thread might not exit immediately 
         # until the next event or timeout if configured. 
@@ -121,31 +181,107 @@ class SosService:
         except:
              pass
 
-    def _get_gps_coordinates(self):
-        """Try USB GPS."""
-        print(f"[SosService] Connecting to GPS {self.GPS_PORT}...")
-        ser = None
+    def _gps_loop(self):
+        """Owns the GPS port: configures the receiver on every open, then records every fix into the track."""
+        import serial
+        import pynmea2
+
+        last_persist = time.monotonic()
+        last_error = None
+        while self.running:
+            ser = None
+            try:
+                # A reopen usually means the receiver was unplugged or reset and is back at its
+                # default baud with default messages, so always open at GPS_BAUDRATE and redo setup
+                ser = serial.Serial(self.GPS_PORT, self.GPS_BAUDRATE, timeout=self.GPS_TIMEOUT)
+                if self.GPS_CONFIGURE:
+                    self._configure_gps(ser)
+                print(f"[SosService] GPS reader on {self.GPS_PORT}.")
+                last_error = None
+                while self.running:
+                    line = ser.readline().decode('ascii', errors='ignore').strip()
+                    if line:
+                        try:
+                            self._on_nmea(line, pynmea2)
+                        except pynmea2.ParseError:
+                            pass
+                    if time.monotonic() - last_persist >= self.TRACK_PERSIST_INTERVAL:
+                        self.track.save()
+                        last_persist = time.monotonic()
+            except Exception as e:
+                if str(e) != last_error:
+                    print(f"[SosService] GPS Error: {e}")
+                    last_error = str(e)
+            finally:
+                if ser and ser.is_open: ser.close()
+            if self.running:
+                time.sleep(5)
+
+    def _configure_gps(self, ser):
+        """Sends the UBX configuration on the reader's open port; a raised baud only lives on that port."""
         try:
-            ser = serial.Serial(self.GPS_PORT, self.GPS_BAUDRATE, timeout=self.GPS_TIMEOUT)
-            for i in range(self.GPS_MAX_READ_LINES):
-                try:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    if line.startswith(('$GNGGA', '$GPGGA')):
-                        msg = pynmea2.parse(line)
-                        if msg.gps_qual > 0:
-                            return msg.latitude, msg.longitude, 'USB_GPS'
-                except pynmea2.ParseError: continue
+            configurator = UbxConfigurator(nav_rate_ms=self.GPS_NAV_RATE_MS,
+                                           target_baudrate=self.GPS_TARGET_BAUDRATE)
+            configurator.configure(ser, is_usb="ttyACM" in self.GPS_PORT)
         except Exception as e:
-            print(f"[SosService] GPS Error: {e}")
-        finally:
-            if ser and ser.is_open: ser.close()
+            print(f"[SosService] GPS configuration skipped: {e}")
+
+    def _on_nmea(self, line, pynmea2):
+        kind = line[3:6]
+        if kind == "GGA":
+            msg = pynmea2.parse(line)
+            if msg.gps_qual and msg.gps_qual > 0:
+                self.last_fix = (msg.latitude, msg.longitude, msg.altitude)
+                self.last_fix_time = time.monotonic()
+                self.fix_event.set()
+                if not self.rmc_seen:
+                    self.track.append(time.time(), msg.latitude, msg.longitude)
+        elif kind == "RMC":
+            # RMC carries speed and course; it is the track's point source when enabled
+            self.rmc_seen = True
+            msg = pynmea2.parse(line)
+            if msg.status == 'A':
+                self.track.append(time.time(), msg.latitude, msg.longitude,
+                                  (msg.spd_over_grnd or 0.0) * 0.514444, msg.true_course or 0.0)
+
+    def _fix_is_fresh(self):
+        return self.last_fix_time is not None and time.monotonic() - self.last_fix_time <= self.GPS_FIX_MAX_AGE
+
+    def _get_gps_coordinates(self):
+        """Latest fix from the GPS reader; waits up to GPS_WAIT_FOR_FIX for one when it is stale."""
+        if not self._fix_is_fresh():
+            print("[SosService] Waiting for a GPS fix...")
+            self.fix_event.clear()
+            self.fix_event.wait(self.GPS_WAIT_FOR_FIX)
+        if self._fix_is_fresh():
+            lat, lon, _ = self.last_fix
+            return lat, lon, 'USB_GPS'
         return None, None, None
 
+    def _get_last_known(self):
+        """Newest recorded track point (survives reboots) when neither GPS nor IP geo answered."""
+        point = self.track.last()
+        if point is None:
+            return None, None, None
+        ts, lat, lon, _, _ = point
+        print(f"[SosService] Using last known position ({(time.time() - ts) / 60:.0f} min old).")
+        return lat, lon, 'Last_Known'
+
+    def _track_for_payload(self):
+        """Last SOS_TRACK_MINUTES of fixes, thinned to at most SOS_TRACK_MAX_POINTS (newest kept)."""
+        points = self.track.recent(self.SOS_TRACK_MINUTES * 60)
+        if len(points) > self.SOS_TRACK_MAX_POINTS:
+            step = -(-len(points) // self.SOS_TRACK_MAX_POINTS)
+            points = points[::-1][::step][::-1]
+        return points
+
     def _get_ip_coordinates(self):
         """Fallback to IP Geolocation."""
+        import requests
+
         print("[SosService] Trying IP Geolocation...")
         try:
-            response = requests.get(self.IP_GEO_URL, timeout=4)
+            response = requests.get(self.IP_GEO_URL, timeout=self.IP_GEO_TIMEOUT)
             if response.status_code == 200 and response.json().get('status') == 'success':
                 data = response.json()
                 return data.get('lat'), data.get('lon'), 'IP_Geo'
@@ -153,41 +289,55 @@ class SosService:
             print(f"[SosService] IP Geo Error: {e}")
         return None, None, None
 
-    def _handle_button_press(self):
-        print("\n" + "="*40)
-        print("[SosService] 🟢 SOS BUTTON PRESSED!")
-        
-        # 1. Get Location
-        lat, lon, source = self._get_gps_coordinates()
-        if lat is None:
-            lat, lon, source = self._get_ip_coordinates()
-            
-        final_lat = lat if lat is not None else 0.0
-        final_lon = lon if lon is not None else 0.0
-        final_source = source if source is not None else "Unknown"
-        
-        print(f"[SosService] Location: {final_lat}, {final_lon} (Source: {final_source})")
+    def _get_snapshot(self):
+        """Latest camera JPEG from the RTSP process, or None."""
+        import requests
+
+        try:
+            response = requests.get(self.SNAPSHOT_URL, timeout=self.SNAPSHOT_TIMEOUT)
+            if response.status_code == 200:
+                return response.content
+            print(f"[SosService] Snapshot unavailable: HTTP {response.status_code}")
+        except Exception as e:
+            print(f"[SosService] Snapshot Error: {e}")
+        return None
 
-        # 2. Payload
-        api_payload = {
+    def build_payload(self, lat, lon, source, snapshot=None, track=None):
+        """Builds the alert API body. Missing coordinates are sent as 0.0 with source "Unknown"."""
+        payload = {
           "deviceId": self.device_id,
           "location": {
-            "latitude": final_lat,
-            "longitude": final_lon
+            "latitude": lat if lat is not None else 0.0,
+            "longitude": lon if lon is not None else 0.0
           },
           "metadata": {
-              "source": final_source
+              "source": source if source is not None else "Unknown"
           }
         }
+        if track:
+            payload["track"] = [
+                {"t": ts, "lat": round(p_lat, 7), "lon": round(p_lon, 7), "speed": speed, "heading": heading}
+                for ts, p_lat, p_lon, speed, heading in track
+            ]
+        if snapshot:
+            payload["metadata"]["snapshot"] = {
+                "contentType": "image/jpeg",
+                "data": base64.b64encode(snapshot).decode("ascii"),
+            }
+        return payload
+
+    def _send(self, api_payload):
+        """POSTs one SOS payload. Returns True on success (and lights the status LED)."""
+        import requests
 
-        # 3. Send API
         print(f"[SosService] Sending Alert to {self.MAIN_API_URL}...")
         try:
-            response = requests.post(self.MAIN_API_URL, json=api_payload, timeout=10)
+            response = requests.post(self.MAIN_API_URL, json=api_payload, timeout=self.API_TIMEOUT)
             print(f"[SosService] Status Code: {response.status_code}")
             
             if response.status_code in [200, 201]:
                 print("[SosService] ✅ SOS Sent Successfully!")
+                self.sent_count += 1
                 
                 # Turn ON LED
                 GPIO.output(self.LED_PIN, GPIO.HIGH)
@@ -197,9 +347,97 @@ class SosService:
                     self.led_timer.cancel()
                 self.led_timer = threading.Timer(30.0, self._turn_off_led)
                 self.led_timer.start()
-            else:
-                print(f"[SosService] ⚠️ Failed: {response.text}")
-                
+                return True
+            print(f"[SosService] ⚠️ Failed: {response.text}")
         except Exception as e:
             print(f"[SosService] ❌ Network Error: {e}")
+        self.failed_count += 1
+        return False
+
+    def _queue_retry(self, api_payload):
+        """Keeps a failed SOS in the outbox and schedules a retry."""
+        with self.outbox_lock:
+            if len(self.outbox) >= self.OUTBOX_MAX:
+                self.outbox.pop(0)
+                print("[SosService] Outbox full, dropping the oldest SOS.")
+            self.outbox.append(api_payload)
+            print(f"[SosService] SOS queued for retry ({len(self.outbox)} in outbox).")
+            if self.retry_timer is None and self.running:
+                self.retry_timer = threading.Timer(self.OUTBOX_RETRY_INTERVAL, self._retry_outbox)
+                self.retry_timer.daemon = True
+                self.retry_timer.start()
+
+    def _retry_outbox(self):
+        with self.outbox_lock:
+            self.retry_timer = None
+        self._flush_and_reschedule()
+
+    def _flush_and_reschedule(self):
+        if not self._flush_outbox():
+            with self.outbox_lock:
+                if self.outbox and self.retry_timer is None and self.running:
+                    self.retry_timer = threading.Timer(self.OUTBOX_RETRY_INTERVAL, self._retry_outbox)
+                    self.retry_timer.daemon = True
+                    self.retry_timer.start()
+
+    def _flush_outbox(self):
+        """
+        Resends queued SOS payloads oldest first. Returns True if the outbox is empty afterwards,
+        or if another flush is already running (it reschedules itself if it fails).
+        """
+        if not self.flush_lock.acquire(False):
+            return True
+        try:
+            while True:
+                with self.outbox_lock:
+                    if not self.outbox:
+                        return True
+                    api_payload = self.outbox[0]
+                if not self._send(api_payload):
+                    return False
+                with self.outbox_lock:
+                    if self.outbox and self.outbox[0] is api_payload:
+                        self.outbox.pop(0)
+        finally:
+            self.flush_lock.release()
+
+    def stats(self):
+        """Lock-free counters for the metrics endpoint."""
+        return {
+            "sent": self.sent_count,
+            "failed": self.failed_count,
+            "outbox_depth": len(self.outbox),
+            "last_fix_age": (time.monotonic() - self.last_fix_time) if self.last_fix_time else None,
+            "track_points": len(self.track),
+        }
+
+    @timed("sos.button_press")
+    def _handle_button_press(self):
+        print("\n" + "="*40)
+        print("[SosService] 🟢 SOS BUTTON PRESSED!")
+        
+        # 1. Camera frame at the moment of the press, then location
+        snapshot = self._get_snapshot() if self.ATTACH_SNAPSHOT else None
+        lat, lon, source = self._get_gps_coordinates()
+        if lat is None:
+            lat, lon, source = self._get_ip_coordinates()
+        if lat is None:
+            lat, lon, source = self._get_last_known()
+
+        # 2. Payload (with the recent trajectory)
+        api_payload = self.build_payload(lat, lon, source, snapshot, self._track_for_payload())
+        location = api_payload["location"]
+        print(f"[SosService] Location: {location['latitude']}, {location['longitude']} "
+              f"(Source: {api_payload['metadata']['source']})")
+
+        # 3. Send API: this SOS first, older ones only once the link has proven it is up
+        delivered = self._send(api_payload)
+        if not delivered:
+            self._queue_retry(api_payload)
+        if self.trip_store:
+            self.trip_store.record_sos(location["latitude"], location["longitude"],
+                                       api_payload["metadata"]["source"], delivered)
+        if delivered and self.outbox:
+            # Off the button thread: a slow resend must not delay the next press
+            threading.Thread(target=self._flush_and_reschedule, name="SosOutbox", daemon=True).start()
         print("="*40 + "\n")
@@ -0,0 +1,298 @@
+import bisect
+import collections
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+
+# Written once per second by jetson_usb_rtsp_simple.py (encoder fps / bitrate / latency)
+RTSP_STATS_PATH = os.environ.get("RTSP_STATS_PATH", "/tmp/ck_rtsp_stats.json")
+
+# Alerts are classified "hot" above this temperature (Nano CPU/GPU throttling starts in the 80s-90s C)
+HOT_TEMP_C = 80.0
+CPU_SATURATED_PCT = 90.0
+
+_TEGRA_PERCENT = re.compile(r"(GR3D_FREQ|EMC_FREQ) (\d+)%")
+
+
+class _SysFile:
+    """A /proc or /sys file kept open and re-read with pread (no open/close per sample)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def read(self):
+        try:
+            return os.pread(self.fd, 8192, 0)
+        except OSError:
+            return None
+
+    def read_int(self):
+        data = self.read()
+        try:
+            return int(data.split()[0]) if data else None
+        except (ValueError, IndexError):
+            return None
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def _open_optional(path):
+    try:
+        return _SysFile(path)
+    except OSError:
+        return None
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "n": len(values),
+        "p50_ms": values[len(values) // 2] * 1000,
+        "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+class SystemSampler:
+    """
+    Samples CPU load, memory, thermal zones, CPU/GPU clocks (and tegrastats when installed)
+    into a fixed-size ring buffer, together with the RTSP encoder stats. Every source is
+    optional: anything missing on this board is recorded as None.
+
+    correlate() lines up the dispatcher's alert latency traces with the nearest sample so
+    delayed alerts can be attributed to heat, CPU saturation or encoder load.
+    """
+
+    def __init__(self, interval=1.0, capacity=600, rtsp_stats_path=RTSP_STATS_PATH, use_tegrastats=True):
+        self.interval = interval
+        self.rtsp_stats_path = rtsp_stats_path
+        self.use_tegrastats = use_tegrastats
+        self.samples = collections.deque(maxlen=capacity)
+        self.running = False
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.tegrastats_process = None
+        self.tegra = {}
+        self.prev_cpu = None
+
+        self.proc_stat = _open_optional("/proc/stat")
+        self.meminfo = _open_optional("/proc/meminfo")
+
+        self.thermal = []  # (zone type, _SysFile)
+        for zone in sorted(glob.glob("/sys/class/thermal/thermal_zone*")):
+            try:
+                with open(os.path.join(zone, "type")) as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+            reader = _open_optional(os.path.join(zone, "temp"))
+            if reader:
+                self.thermal.append((name, reader))
+
+        cpufreq = sorted(glob.glob("/sys/devices/system/cpu/cpu[0-9]*/cpufreq"))
+        self.cpu_freq = [r for r in (_open_optional(os.path.join(d, "scaling_cur_freq")) for d in cpufreq) if r]
+        # Thermal capping shows up as scaling_max_freq dropping below cpuinfo_max_freq
+        self.cpu_cap = [r for r in (_open_optional(os.path.join(d, "scaling_max_freq")) for d in cpufreq) if r]
+        self.cpu_max_khz = None
+        if cpufreq:
+            reader = _open_optional(os.path.join(cpufreq[0], "cpuinfo_max_freq"))
+            if reader:
+                self.cpu_max_khz = reader.read_int()
+                reader.close()
+
+        gpu_freq_paths = (glob.glob("/sys/devices/gpu.0/devfreq/*/cur_freq")
+                          + glob.glob("/sys/class/devfreq/*gpu*/cur_freq"))
+        self.gpu_freq = _open_optional(gpu_freq_paths[0]) if gpu_freq_paths else None
+        self.gpu_load = _open_optional("/sys/devices/gpu.0/load")
+
+        self.thermal_names = [name for name, _ in self.thermal]
+        self.fields = (["time", "cpu_pct", "iowait_pct", "mem_used_mb", "mem_available_mb",
+                        "cpu_freq_mhz", "cpu_cap_mhz", "gpu_freq_mhz", "gpu_load_pct", "emc_pct",
+                        "encoder_fps", "encoder_kbps", "encoder_latency_ms"]
+                       + [f"temp_{name}" for name in self.thermal_names])
+        print(f"[SystemSampler] Sources: {len(self.thermal)} thermal zones, {len(self.cpu_freq)} cpufreq, "
+              f"gpu={'yes' if self.gpu_freq else 'no'}, tegrastats={'yes' if shutil.which('tegrastats') else 'no'}")
+
+    # ---------- Readers ----------
+
+    def _cpu(self):
+        data = self.proc_stat.read() if self.proc_stat else None
+        if not data:
+            return None, None
+        values = [int(v) for v in data.split(b"\n", 1)[0].split()[1:]]
+        idle, iowait = values[3], values[4] if len(values) > 4 else 0
+        total = sum(values)
+        previous, self.prev_cpu = self.prev_cpu, (total, idle, iowait)
+        if previous is None or total == previous[0]:
+            return None, None
+        dt = total - previous[0]
+        busy = dt - (idle - previous[1]) - (iowait - previous[2])
+        return 100.0 * busy / dt, 100.0 * (iowait - previous[2]) / dt
+
+    def _memory(self):
+        data = self.meminfo.read() if self.meminfo else None
+        if not data:
+            return None, None
+        fields = {}
+        for line in data.split(b"\n"):
+            key, _, rest = line.partition(b":")
+            if key in (b"MemTotal", b"MemAvailable"):
+                fields[key] = int(rest.split()[0])
+        total, available = fields.get(b"MemTotal"), fields.get(b"MemAvailable")
+        if total is None or available is None:
+            return None, None
+        return (total - available) / 1024, available / 1024
+
+    def _rtsp_stats(self, now):
+        try:
+            if now - os.path.getmtime(self.rtsp_stats_path) > max(3.0, 3 * self.interval):
+                return {}  # Stale: the RTSP child is gone or stuck
+            with open(self.rtsp_stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _tegrastats_loop(self):
+        for line in self.tegrastats_process.stdout:
+            self.tegra = {name: int(value) for name, value in _TEGRA_PERCENT.findall(line)}
+
+    def sample(self):
+        """Takes one sample and appends it to the ring. Returns it as a tuple in self.fields order."""
+        now = time.time()
+        cpu_pct, iowait_pct = self._cpu()
+        mem_used, mem_available = self._memory()
+        freqs = [v for v in (r.read_int() for r in self.cpu_freq) if v]
+        caps = [v for v in (r.read_int() for r in self.cpu_cap) if v]
+        gpu_freq = self.gpu_freq.read_int() if self.gpu_freq else None
+        gpu_load = self.gpu_load.read_int() if self.gpu_load else None  # per mille
+        rtsp = self._rtsp_stats(now)
+        temps = []
+        for _, reader in self.thermal:
+            value = reader.read_int()
+            temps.append(value / 1000 if value is not None else None)
+
+        row = (
+            now, cpu_pct, iowait_pct, mem_used, mem_available,
+            sum(freqs) / len(freqs) / 1000 if freqs else None,
+            min(caps) / 1000 if caps else None,
+            gpu_freq / 1e6 if gpu_freq else None,
+            gpu_load / 10 if gpu_load is not None else self.tegra.get("GR3D_FREQ"),
+            self.tegra.get("EMC_FREQ"),
+            rtsp.get("fps"), rtsp.get("kbps"), rtsp.get("encode_latency_ms"),
+        ) + tuple(temps)
+        self.samples.append(row)
+        return row
+
+    # ---------- Lifecycle ----------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.stop_event.clear()
+        tegrastats = shutil.which("tegrastats") if self.use_tegrastats else None
+        if tegrastats:
+            try:
+                self.tegrastats_process = subprocess.Popen(
+                    [tegrastats, "--interval", str(int(self.interval * 1000))],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+                threading.Thread(target=self._tegrastats_loop, name="Tegrastats", daemon=True).start()
+            except OSError as e:
+                print(f"[SystemSampler] tegrastats unavailable: {e}")
+        self.thread = threading.Thread(target=self._loop, name="SystemSampler")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"[SystemSampler] Sampling every {self.interval}s ({self.samples.maxlen} samples kept).")
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[SystemSampler] Sample error: {e}")
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.tegrastats_process:
+            self.tegrastats_process.terminate()
+            self.tegrastats_process = None
+
+    # ---------- Queries ----------
+
+    def latest(self):
+        """Most recent sample as a dict (None before the first sample)."""
+        if not self.samples:
+            return None
+        return dict(zip(self.fields, self.samples[-1]))
+
+    def history(self, seconds=None):
+        rows = list(self.samples)
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            rows = [row for row in rows if row[0] >= cutoff]
+        return [dict(zip(self.fields, row)) for row in rows]
+
+    def classify(self, row):
+        """hot / throttled / cpu_saturated / normal for one sample row."""
+        sample = dict(zip(self.fields, row))
+        temps = [sample[f"temp_{name}"] for name in self.thermal_names if sample[f"temp_{name}"] is not None]
+        if temps and max(temps) >= HOT_TEMP_C:
+            return "hot"
+        if self.cpu_max_khz and sample["cpu_cap_mhz"] and sample["cpu_cap_mhz"] * 1000 < self.cpu_max_khz * 0.95:
+            return "throttled"
+        if sample["cpu_pct"] is not None and sample["cpu_pct"] >= CPU_SATURATED_PCT:
+            return "cpu_saturated"
+        return "normal"
+
+    def correlate(self, traces, worst=5):
+        """
+        traces: iterable of (epoch time, source, latency seconds), e.g. AlertDispatcher.traces.
+        Returns latency percentiles per system state and the worst alerts with their sample.
+        """
+        rows = list(self.samples)
+        times = [row[0] for row in rows]
+        by_state = collections.defaultdict(list)
+        matched = []
+        for at, source, latency in list(traces):
+            if ":" in source or not rows:
+                continue
+            i = bisect.bisect_left(times, at)
+            if i == len(times) or (i > 0 and at - times[i - 1] < times[i] - at):
+                i -= 1
+            if abs(times[i] - at) > 2 * self.interval:
+                continue  # No sample close enough (sampler started later, or gap)
+            state = self.classify(rows[i])
+            by_state[state].append(latency)
+            matched.append((latency, source, at, rows[i]))
+
+        matched.sort(key=lambda item: item[0], reverse=True)
+        return {
+            "samples": len(rows),
+            "alerts_matched": len(matched),
+            "latency_by_state": {state: _percentiles(values) for state, values in by_state.items()},
+            "worst_alerts": [
+                {"latency_ms": latency * 1000, "source": source, "time": at,
+                 "state": self.classify(row), "system": dict(zip(self.fields, row))}
+                for latency, source, at, row in matched[:worst]
+            ],
+        }
+
+    def print_report(self, traces):
+        report = self.correlate(traces)
+        print(f"[SystemSampler] {report['samples']} samples, {report['alerts_matched']} alerts matched.")
+        for state, entry in sorted(report["latency_by_state"].items()):
+            print(f"[SystemSampler] {state}: n={entry['n']} p50={entry['p50_ms']:.1f}ms "
+                  f"p95={entry['p95_ms']:.1f}ms max={entry['max_ms']:.1f}ms")
@@ -0,0 +1,150 @@
+import os
+import time
+from array import array
+
+DEFAULT_TRACK_PATH = r"data/gps_track.bin"
+
+_MAGIC = b"CKT1"
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+class TrackRing:
+    """
+    Recent GPS fixes in parallel typed arrays used as a ring (16 bytes per point, no per-point
+    objects): time (epoch s), lat/lon (1e-7 deg), speed (cm/s), heading (0.01 deg).
+    Persisted as zigzag varint deltas between consecutive points, typically 6-10 bytes per point.
+    """
+
+    def __init__(self, capacity=3600, path=DEFAULT_TRACK_PATH):
+        self.capacity = capacity
+        self.path = path
+        self.times = array("I", bytes(4 * capacity))
+        self.lats = array("i", bytes(4 * capacity))
+        self.lons = array("i", bytes(4 * capacity))
+        self.speeds = array("H", bytes(2 * capacity))
+        self.headings = array("H", bytes(2 * capacity))
+        self.head = 0    # next slot to write
+        self.count = 0
+        self.dirty = False
+
+    def __len__(self):
+        return self.count
+
+    def append(self, ts, lat, lon, speed_mps=0.0, heading_deg=0.0):
+        i = self.head
+        self.times[i] = int(ts)
+        self.lats[i] = int(round(lat * 1e7))
+        self.lons[i] = int(round(lon * 1e7))
+        self.speeds[i] = max(0, min(0xFFFF, int(round((speed_mps or 0.0) * 100))))  # Some receivers report -0.01
+        self.headings[i] = int(round((heading_deg or 0.0) % 360 * 100)) % 36000
+        self.head = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+        self.dirty = True
+
+    def _slots(self):
+        """Ring slot indices, oldest first."""
+        start = (self.head - self.count) % self.capacity
+        return [(start + k) % self.capacity for k in range(self.count)]
+
+    def _point(self, i):
+        return (self.times[i], self.lats[i] / 1e7, self.lons[i] / 1e7,
+                self.speeds[i] / 100, self.headings[i] / 100)
+
+    def last(self):
+        """(ts, lat, lon, speed m/s, heading deg) of the newest point, or None."""
+        if not self.count:
+            return None
+        return self._point((self.head - 1) % self.capacity)
+
+    def recent(self, seconds, now=None):
+        """Points from the last `seconds`, oldest first."""
+        cutoff = (now or time.time()) - seconds
+        points = []
+        for i in reversed(self._slots()):
+            if self.times[i] < cutoff:
+                break
+            points.append(self._point(i))
+        points.reverse()
+        return points
+
+    # ---------- Persistence ----------
+
+    def encode(self):
+        out = bytearray(_MAGIC)
+        _write_varint(out, self.count)
+        previous = (0, 0, 0, 0, 0)
+        for i in self._slots():
+            current = (self.times[i], self.lats[i], self.lons[i], self.speeds[i], self.headings[i])
+            for value, before in zip(current, previous):
+                _write_varint(out, _zigzag(value - before))
+            previous = current
+        return bytes(out)
+
+    def decode(self, data):
+        if data[:4] != _MAGIC:
+            raise ValueError("not a track file")
+        count, pos = _read_varint(data, 4)
+        values = [0, 0, 0, 0, 0]
+        self.head = self.count = 0
+        for _ in range(count):
+            for k in range(5):
+                delta, pos = _read_varint(data, pos)
+                values[k] += _unzigzag(delta)
+            i = self.head
+            self.times[i], self.lats[i], self.lons[i], self.speeds[i], self.headings[i] = values
+            self.head = (i + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+        self.dirty = False
+
+    def save(self):
+        if not self.dirty:
+            return False
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(self.encode())
+            os.replace(tmp, self.path)
+            self.dirty = False
+            return True
+        except OSError as e:
+            print(f"[TrackRing] Save error: {e}")
+            return False
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.decode(f.read())
+            print(f"[TrackRing] Restored {self.count} track points.")
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, IndexError) as e:
+            print(f"[TrackRing] Ignoring unreadable track file: {e}")
+            return False
@@ -0,0 +1,363 @@
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TRIP_DB_PATH = r"data/trips.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    behavior TEXT NOT NULL,
+    level INTEGER,
+    source TEXT,
+    outcome TEXT,
+    latency_ms REAL,
+    event_id TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts);
+CREATE INDEX IF NOT EXISTS alerts_behavior ON alerts (behavior, level, ts);
+CREATE INDEX IF NOT EXISTS alerts_trip ON alerts (trip_id);
+CREATE INDEX IF NOT EXISTS alerts_event ON alerts (event_id);
+CREATE TABLE IF NOT EXISTS sos_events (
+    id INTEGER PRIMARY KEY,
+    trip_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    lat REAL,
+    lon REAL,
+    source TEXT,
+    delivered INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sos_ts ON sos_events (ts);
+CREATE TABLE IF NOT EXISTS trip_aggregates (
+    trip_id INTEGER NOT NULL,
+    behavior TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    played INTEGER NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (trip_id, behavior, level)
+);
+"""
+
+
+def _level(level):
+    """Firestore delivers levels as "2", the local path as 2; both count as the int (0 if missing/invalid)."""
+    try:
+        return int(level) if level is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class TripStore:
+    """
+    On-device history of alerts, playback outcomes and SOS events in SQLite (WAL).
+
+    record_*() only append to an in-memory queue and bump the current trip's counters, so the
+    alert path never waits on the SD card; a writer thread commits the queue in one
+    transaction every flush_interval (or once batch_size rows are waiting) and upserts the
+    per-trip aggregates for the keys it touched. count() / trip_summary() for the current trip
+    are dictionary lookups.
+
+    A new trip starts at open and after trip_gap seconds without alerts; the rollover only
+    swaps in-memory state (ids are allocated here, not by SQLite) and the writer thread
+    persists it with the next batch. Rows older than
+    retention_days are deleted, and the oldest alerts are trimmed while the database (plus WAL)
+    is larger than max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_TRIP_DB_PATH, flush_interval=2.0, batch_size=100, trip_gap=1800.0,
+                 retention_days=30, max_bytes=50 * 1024 * 1024, maintenance_interval=3600.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.trip_gap = trip_gap
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.maintenance_interval = maintenance_interval
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db_lock = threading.Lock()
+        with self.db_lock:
+            # auto_vacuum only takes effect before the first table is created
+            self.db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")  # WAL + NORMAL: no fsync per commit
+            self.db.executescript(_SCHEMA)
+
+        self.lock = threading.Lock()
+        self.alert_rows = []
+        self.sos_rows = []
+        self.outcome_updates = []      # (outcome, event_id)
+        self.touched = set()           # (trip_id, behavior, level) to upsert
+        self.closed_aggregates = []    # final aggregate rows of trips rolled over since the last flush
+        self.trip_starts = []          # (id, started_at) not yet inserted
+        self.trip_ends = []            # (ended_at, id) not yet written
+        self.current = {}              # (behavior, level) -> [count, played, last_ts] for the current trip
+        self.trip_id = None
+        self.trip_started = None
+        self.last_activity = None
+
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self.last_maintenance = 0.0
+        self.rows_written = 0
+        self.flushes = 0
+
+        # The first trip is inserted here so later ids can be allocated in memory
+        now = time.time()
+        with self.db_lock:
+            self.trip_id = self.db.execute("INSERT INTO trips (started_at) VALUES (?)", (now,)).lastrowid
+        self.trip_started = now
+        self.last_activity = now
+        print(f"[TripStore] Trip {self.trip_id} started.")
+
+    # ---------- Trips ----------
+
+    def start_trip(self, now=None):
+        """Closes the current trip and opens a new one (in memory; written by the next flush)."""
+        now = now or time.time()
+        with self.lock:
+            trip_id = self._rollover(now)
+        self.wake.set()
+        return trip_id
+
+    def _rollover(self, now):
+        """Caller holds self.lock. Keeps the closing trip's aggregates for the writer, then swaps in a new trip."""
+        for trip_id, behavior, level in self.touched:
+            entry = self.current.get((behavior, level)) if trip_id == self.trip_id else None
+            if entry:
+                self.closed_aggregates.append((trip_id, behavior, level, entry[0], entry[1], entry[2]))
+        self.touched = set()
+        self.trip_ends.append((self.last_activity or now, self.trip_id))
+        self.trip_id += 1
+        self.trip_starts.append((self.trip_id, now))
+        self.trip_started = now
+        self.last_activity = now
+        self.current = {}
+        print(f"[TripStore] Trip {self.trip_id} started.")
+        return self.trip_id
+
+    def _check_gap(self, now):
+        """Caller holds self.lock."""
+        if self.last_activity is not None and now - self.last_activity > self.trip_gap:
+            self._rollover(now)
+            return True
+        return False
+
+    def next_trip_id(self, now=None):
+        """Id the next alert arriving now will be recorded under, without rolling the trip over."""
+        now = now or time.time()
+        with self.lock:
+            if self.last_activity is not None and now - self.last_activity > self.trip_gap:
+                return self.trip_id + 1
+            return self.trip_id
+
+    def current_trip(self, now=None):
+        """Id of the trip an alert arriving now belongs to (starts a new one after trip_gap)."""
+        with self.lock:
+            rolled = self._check_gap(now or time.time())
+            trip_id = self.trip_id
+        if rolled:
+            self.wake.set()
+        return trip_id
+
+    # ---------- Recording (hot path) ----------
+
+    def record_alert(self, behavior, level, source=None, outcome=None, latency_ms=None, event_id=None, now=None):
+        now = now or time.time()
+        key = (behavior, _level(level))
+        with self.lock:
+            rolled = self._check_gap(now)
+            self.alert_rows.append((self.trip_id, now, behavior, key[1], source, outcome, latency_ms, event_id))
+            entry = self.current.get(key)
+            if entry is None:
+                entry = self.current[key] = [0, 0, now]
+            entry[0] += 1
+            if outcome == "played":
+                entry[1] += 1
+            entry[2] = now
+            self.touched.add((self.trip_id,) + key)
+            self.last_activity = now
+            ready = rolled or len(self.alert_rows) >= self.batch_size
+        if ready:
+            self.wake.set()
+
+    def record_outcome(self, event_id, outcome):
+        """Later outcome for an already recorded alert (e.g. preempted)."""
+        if event_id is None:
+            return
+        with self.lock:
+            self.outcome_updates.append((outcome, event_id))
+
+    def record_preempted(self, event_id):
+        self.record_outcome(event_id, "preempted")
+
+    def record_sos(self, lat, lon, source, delivered, now=None):
+        now = now or time.time()
+        with self.lock:
+            self.sos_rows.append((self.trip_id, now, lat, lon, source, 1 if delivered else 0))
+        self.wake.set()
+
+    # ---------- O(1) summaries ----------
+
+    def count(self, behavior, level=None):
+        """Alerts of behavior (at level, or all levels) in the current trip."""
+        if level is not None:
+            entry = self.current.get((behavior, _level(level)))
+            return entry[0] if entry else 0
+        return sum(entry[0] for (b, _), entry in list(self.current.items()) if b == behavior)
+
+    def trip_summary(self, trip_id=None):
+        """{behavior: {level: {count, played}}} for the current trip (memory) or a past one (aggregates table)."""
+        summary = {}
+        if trip_id is None or trip_id == self.trip_id:
+            rows = [(b, l, e[0], e[1]) for (b, l), e in list(self.current.items())]
+            trip_id = self.trip_id
+        else:
+            with self.db_lock:
+                rows = self.db.execute(
+                    "SELECT behavior, level, count, played FROM trip_aggregates WHERE trip_id = ?", (trip_id,)
+                ).fetchall()
+        for behavior, level, count, played in rows:
+            summary.setdefault(behavior, {})[level] = {"count": count, "played": played}
+        return {"trip_id": trip_id, "behaviors": summary}
+
+    def recent_trips(self, limit=10):
+        with self.db_lock:
+            return self.db.execute(
+                "SELECT t.id, t.started_at, t.ended_at, COALESCE(SUM(a.count), 0) "
+                "FROM trips t LEFT JOIN trip_aggregates a ON a.trip_id = t.id "
+                "GROUP BY t.id ORDER BY t.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    # ---------- Writer ----------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="TripStore")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self.last_maintenance >= self.maintenance_interval:
+                    self.maintain()
+            except sqlite3.Error as e:
+                print(f"[TripStore] Write error: {e}")
+
+    def flush(self):
+        """Commits queued rows and the touched aggregates in one transaction."""
+        with self.lock:
+            alert_rows, self.alert_rows = self.alert_rows, []
+            sos_rows, self.sos_rows = self.sos_rows, []
+            outcome_updates, self.outcome_updates = self.outcome_updates, []
+            touched, self.touched = self.touched, set()
+            trip_starts, self.trip_starts = self.trip_starts, []
+            trip_ends, self.trip_ends = self.trip_ends, []
+            aggregates, self.closed_aggregates = self.closed_aggregates, []
+            for trip_id, behavior, level in touched:
+                entry = self.current.get((behavior, level)) if trip_id == self.trip_id else None
+                if entry:
+                    aggregates.append((trip_id, behavior, level, entry[0], entry[1], entry[2]))
+        if not (alert_rows or sos_rows or outcome_updates or aggregates or trip_starts or trip_ends):
+            return 0
+
+        with self.db_lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("INSERT INTO trips (id, started_at) VALUES (?, ?)", trip_starts)
+                self.db.executemany("UPDATE trips SET ended_at = ? WHERE id = ?", trip_ends)
+                self.db.executemany(
+                    "INSERT INTO alerts (trip_id, ts, behavior, level, source, outcome, latency_ms, event_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", alert_rows)
+                self.db.executemany(
+                    "INSERT INTO sos_events (trip_id, ts, lat, lon, source, delivered) VALUES (?, ?, ?, ?, ?, ?)",
+                    sos_rows)
+                self.db.executemany("UPDATE alerts SET outcome = ? WHERE event_id = ?", outcome_updates)
+                # Absolute values from memory, so REPLACE is exact (and works on SQLite < 3.24 without UPSERT)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO trip_aggregates (trip_id, behavior, level, count, played, last_ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", aggregates)
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                raise
+        self.flushes += 1
+        self.rows_written += len(alert_rows) + len(sos_rows)
+        return len(alert_rows) + len(sos_rows)
+
+    def size_bytes(self):
+        total = 0
+        for suffix in ("", "-wal"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+    def maintain(self):
+        """Retention, size cap and space reclaim. Runs on the writer thread."""
+        self.last_maintenance = time.monotonic()
+        cutoff = time.time() - self.retention_days * 86400
+        with self.db_lock:
+            deleted = self.db.execute("DELETE FROM alerts WHERE ts < ?", (cutoff,)).rowcount
+            deleted += self.db.execute("DELETE FROM sos_events WHERE ts < ?", (cutoff,)).rowcount
+            self.db.execute("DELETE FROM trip_aggregates WHERE trip_id IN "
+                            "(SELECT id FROM trips WHERE ended_at IS NOT NULL AND ended_at < ?)", (cutoff,))
+            self.db.execute("DELETE FROM trips WHERE ended_at IS NOT NULL AND ended_at < ?", (cutoff,))
+            # Over the cap: drop the oldest 10% of alerts until it fits
+            while self.size_bytes() > self.max_bytes:
+                total = self.db.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+                if not total:
+                    break
+                trimmed = self.db.execute(
+                    "DELETE FROM alerts WHERE id IN (SELECT id FROM alerts ORDER BY ts LIMIT ?)",
+                    (max(1, total // 10),)).rowcount
+                deleted += trimmed
+                self.db.execute("PRAGMA incremental_vacuum")
+                self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if deleted:
+                self.db.execute("PRAGMA incremental_vacuum")
+                self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                print(f"[TripStore] Maintenance removed {deleted} rows ({self.size_bytes() // 1024} KB).")
+        return deleted
+
+    def close(self):
+        """Final flush, closes the current trip."""
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        try:
+            self.flush()
+            with self.db_lock:
+                self.db.execute("UPDATE trips SET ended_at = ? WHERE id = ?",
+                                (self.last_activity or time.time(), self.trip_id))
+                self.db.close()
+        except sqlite3.Error as e:
+            print(f"[TripStore] Close error: {e}")
+
+    def stats(self):
+        return {
+            "trip_id": self.trip_id,
+            "queued": len(self.alert_rows) + len(self.sos_rows),
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "db_bytes": self.size_bytes(),
+        }
@@ -0,0 +1,132 @@
+"""
+Compares alert playback in-process (pygame mixer, large buffer) with the AudioWorker child
+process (shared-memory command ring, small buffer) while this process is kept busy with
+GIL-heavy work (snapshot-sized JSON parsing, like a burst of Firestore callbacks).
+
+For every alert it measures request -> playback start: in-process that is the play_sound()
+call up to mixer play(); with the worker it is play_sound() up to the command being sent plus
+the worker's own ring -> play() latency. Underruns are the stall counters of each mode.
+
+Examples (from the project root):
+    python tests/audio_latency.py                             # SDL dummy audio driver
+    python tests/audio_latency.py --real-audio --alerts 100   # on the Jetson, through ALSA
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def gil_load(stop, counter):
+    """Pure-Python JSON churn: holds the GIL most of the time, like snapshot processing."""
+    doc = json.dumps({"changes": [{"id": f"doc-{i}", "behavior": "phone", "level": i % 3,
+                                   "tags": list(range(20))} for i in range(200)]})
+    while not stop.is_set():
+        data = json.loads(doc)
+        sum(len(change["tags"]) for change in data["changes"])
+        counter[0] += 1
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_mode(args, use_worker):
+    from services.audio_service import AudioService
+    audio = AudioService(assets_path=os.path.join(ROOT, "assets", "audios"),
+                         profile_path=os.path.join(ROOT, "src", "configs", "alert_profile.json"),
+                         use_worker=use_worker, buffer=args.buffer, worker_buffer=args.worker_buffer)
+    if use_worker and not audio.worker.wait_ready():
+        audio.close()
+        raise RuntimeError("audio worker did not start")
+
+    stop = threading.Event()
+    counter = [0]
+    threads = [threading.Thread(target=gil_load, args=(stop, counter), daemon=True) for _ in range(args.load_threads)]
+    for thread in threads:
+        thread.start()
+
+    samples = []
+    priorities = (3, 1)
+    try:
+        for i in range(args.alerts):
+            time.sleep(args.interval)
+            audio.current_priority = float('inf')
+            before = audio.worker.status()["latency_count"] if use_worker else None
+            t0 = time.monotonic()
+            outcome = audio.play_sound("sleepy_eye", 3, priorities[i % 2])
+            sent = time.monotonic() - t0
+            if outcome != "played":
+                continue
+            if use_worker:
+                deadline = time.monotonic() + 1.0
+                status = audio.worker.status()
+                while status["latency_count"] == before and time.monotonic() < deadline:
+                    time.sleep(0.001)
+                    status = audio.worker.status()
+                samples.append(sent + status["latency_last"])
+            else:
+                samples.append(audio.playback_stats()["latency_last"])
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        stats = audio.playback_stats()
+        audio.close()
+
+    return {
+        "mode": "worker" if use_worker else "in_process",
+        "buffer": args.worker_buffer if use_worker else args.buffer,
+        "alerts": len(samples),
+        "p50_ms": statistics.median(samples) * 1000 if samples else None,
+        "p95_ms": percentile(samples, 0.95) * 1000 if samples else None,
+        "max_ms": max(samples) * 1000 if samples else None,
+        "underruns": stats["underruns"],
+        "load_iterations": counter[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process vs worker-process audio latency")
+    parser.add_argument("--alerts", type=int, default=40)
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between alerts")
+    parser.add_argument("--load-threads", type=int, default=4)
+    parser.add_argument("--buffer", type=int, default=4096, help="in-process mixer buffer (frames)")
+    parser.add_argument("--worker-buffer", type=int, default=1024, help="worker mixer buffer (frames)")
+    parser.add_argument("--modes", default="in_process,worker")
+    parser.add_argument("--real-audio", action="store_true", help="use the default SDL audio driver")
+    args = parser.parse_args()
+
+    if not args.real_audio:
+        os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    try:
+        import pygame  # noqa: F401
+    except ImportError:
+        print("[AudioLatency] pygame is not installed.")
+        sys.exit(2)
+
+    results = []
+    for mode in args.modes.split(","):
+        print(f"[AudioLatency] Running {mode} ({args.alerts} alerts, {args.load_threads} load threads)...")
+        results.append(run_mode(args, mode == "worker"))
+
+    print("[AudioLatency] ---------------- Report ----------------")
+    print(f"  {'mode':<11} {'buffer':>6} {'alerts':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+          f"{'underruns':>9} {'load it':>8}")
+    for r in results:
+        fmt = lambda v: f"{v:8.2f}" if v is not None else f"{'-':>8}"
+        print(f"  {r['mode']:<11} {r['buffer']:>6} {r['alerts']:>6} {fmt(r['p50_ms'])} {fmt(r['p95_ms'])} "
+              f"{fmt(r['max_ms'])} {r['underruns']:>9} {r['load_iterations']:>8}")
+
+
+if __name__ == "__main__":
+    main()
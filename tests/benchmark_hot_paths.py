@@ -0,0 +1,483 @@
+"""
+Micro-benchmarks for the device client hot paths. Runs off-device: GPIO is replaced by a
+silent simulated GPIO and pygame uses the SDL dummy audio driver.
+
+    python tests/benchmark_hot_paths.py run                       # run and flag regressions against the baseline (exit 1)
+    python tests/benchmark_hot_paths.py run --no-compare          # just print results
+    python tests/benchmark_hot_paths.py run --save baseline       # store tests/benchmarks/baseline.json
+    python tests/benchmark_hot_paths.py compare baseline other    # compare two stored result files
+    python tests/benchmark_hot_paths.py list
+
+Benchmarks whose dependency is not installed (pygame, pynmea2) are reported as skipped.
+The committed tests/benchmarks/baseline.json records the machine it was taken on; timings
+only compare on the same hardware, so re-save it (--save baseline) on the target board.
+"""
+import argparse
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+BASELINE_DIR = os.path.join(ROOT, "tests", "benchmarks")
+DEFAULT_BASELINE = "baseline"
+REFERENCE_ITERATIONS = 2000
+
+BENCHMARKS = {}
+
+
+class Skip(Exception):
+    pass
+
+
+def benchmark(name):
+    """Registers a benchmark. The decorated function does the setup and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# ---------------------------------------------------------------------------
+# Simulated hardware / Firestore objects
+# ---------------------------------------------------------------------------
+
+class SimGPIO:
+    """Silent GPIO stand-in with the Jetson.GPIO call signatures used by the services."""
+    BOARD = 'BOARD'
+    OUT = 'OUT'
+    IN = 'IN'
+    LOW = 0
+    HIGH = 1
+    FALLING = 'FALLING'
+    calls = 0
+
+    @staticmethod
+    def getmode(): return SimGPIO.BOARD
+    @staticmethod
+    def setmode(*args): pass
+    @staticmethod
+    def setup(*args, **kwargs): pass
+    @staticmethod
+    def output(channels, values):
+        SimGPIO.calls += 1
+    @staticmethod
+    def input(*args): return 1
+    @staticmethod
+    def cleanup(): pass
+
+
+def _use_sim_gpio():
+    from services import led_service, sos_service
+    led_service.GPIO = SimGPIO
+    sos_service.GPIO = SimGPIO
+
+
+class NullAudio:
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        pass
+
+    def speak(self, text, priority=0, lang='vi'):
+        pass
+
+
+class _ChangeType:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeHistoryDoc:
+    def __init__(self, doc_id, data, create_time):
+        self.id = doc_id
+        self._data = data
+        self.create_time = create_time
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeChange:
+    ADDED = _ChangeType("ADDED")
+
+    def __init__(self, document):
+        self.type = FakeChange.ADDED
+        self.document = document
+
+
+class _Quiet:
+    """Swallows the services' print() logging while timing."""
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+@benchmark("profile.lookup")
+def bench_profile_lookup():
+    from services.alert_profile import AlertProfile
+    profile = AlertProfile(os.path.join(ROOT, "src", "configs", "alert_profile.json"))
+    keys = [("sleepy_eye", 3), ("phone", "1"), ("yawn", None), ("look_away", 2)]
+
+    def run():
+        for behavior, level in keys:
+            profile.current.lookup(behavior, level)
+    return run
+
+
+@benchmark("audio.play_sound")
+def bench_play_sound():
+    try:
+        import pygame
+    except ImportError:
+        raise Skip("pygame not installed")
+    _use_sim_gpio()
+    from services.audio_service import AudioService
+    from services.led_service import LedService
+
+    audio = AudioService(assets_path=os.path.join(ROOT, "assets", "audios"), led_service=LedService(),
+                         profile_path=os.path.join(ROOT, "src", "configs", "alert_profile.json"))
+    priorities = [3, 1]
+    state = {"i": 0}
+
+    def run():
+        # Alternate so every call preempts: load + play + LED effect + follow-up queue
+        state["i"] ^= 1
+        audio.current_priority = float('inf')
+        pygame.mixer.music.stop()
+        audio.play_sound("sleepy_eye", 3, priorities[state["i"]])
+    return run
+
+
+@benchmark("led.apply_frame")
+def bench_led_frame():
+    _use_sim_gpio()
+    from services.led_service import LedService
+    # The engine thread stays parked on a static effect; frames are driven directly
+    led = LedService()
+    frames = led.build_effect("chase", led.sorted_pins).frames
+
+    state = {"i": 0}
+
+    def run():
+        state["i"] = (state["i"] + 1) % len(frames)
+        led._apply_frame(frames[state["i"]])
+    return run
+
+
+@benchmark("led.set_effect")
+def bench_led_set_effect():
+    _use_sim_gpio()
+    from services.led_service import LedService
+    led = LedService()
+    effects = [led.build_effect("solid", [32]), led.build_effect("blink", [33])]
+    state = {"i": 0}
+
+    def run():
+        state["i"] ^= 1
+        led.set_effect(effects[state["i"]])
+    return run
+
+
+@benchmark("firebase.histories_snapshot_50")
+def bench_histories_snapshot():
+    from services.alert_dispatcher import AlertDispatcher
+    from services.doc_cache import DocCache
+    from services.firebase_service import FirebaseService
+
+    service = FirebaseService(cred_path=None, db=object(), audio_service=NullAudio(),
+                              cache=DocCache(os.path.join(tempfile.gettempdir(), "ck-bench-cache.json")))
+    service.dispatcher = AlertDispatcher(NullAudio())
+    service.dispatcher.DEDUP_WINDOW = 0.0
+    start = datetime.datetime.now(datetime.timezone.utc)
+    service.listen_start_time = start - datetime.timedelta(seconds=1)
+    state = {"n": 0}
+
+    def run():
+        # 50 fresh ADDED changes per snapshot (new ids so nothing is deduplicated)
+        base = state["n"]
+        state["n"] += 50
+        changes = [
+            FakeChange(FakeHistoryDoc(f"doc-{base + i}",
+                                      {"behavior": "phone", "priority": 2, "level": 1},
+                                      start))
+            for i in range(50)
+        ]
+        service._on_histories_snapshot(None, changes, None)
+    return run
+
+
+@benchmark("escalation.evaluate")
+def bench_escalation():
+    from services.alert_profile import AlertProfile
+    from services.escalation import EscalationEngine
+    profile = AlertProfile(os.path.join(ROOT, "src", "configs", "alert_profile.json"))
+    engine = EscalationEngine(profile)
+    behaviors = ["sleepy_eye", "phone", "yawn", "look_away"]
+    state = {"i": 0}
+
+    def run():
+        # 1000 alerts/s across four behaviors: windows stay full and every step is crossed
+        state["i"] += 1
+        engine.evaluate(behaviors[state["i"] & 3], 1, None, now=state["i"] * 0.001)
+    return run
+
+
+@benchmark("escalation.evaluate_sparse")
+def bench_escalation_sparse():
+    from services.alert_profile import AlertProfile
+    from services.escalation import EscalationEngine
+    profile = AlertProfile(os.path.join(ROOT, "src", "configs", "alert_profile.json"))
+    engine = EscalationEngine(profile)
+    state = {"i": 0}
+
+    def run():
+        # One alert every 37 s: most calls expire several buckets first
+        state["i"] += 1
+        engine.evaluate("sleepy_eye", 1, None, now=state["i"] * 37.0)
+    return run
+
+
+@benchmark("ingest.decode_binary")
+def bench_ingest_decode():
+    from services.ingest_service import decode_message, encode_binary
+    data = encode_binary("sleepy_eye", 2, 1, "6f1c4c1e-7d8f-4f4e-9a51-2a6f1f1d2b3c")
+
+    def run():
+        decode_message(data)
+    return run
+
+
+@benchmark("ingest.decode_json")
+def bench_ingest_decode_json():
+    from services.ingest_service import decode_message, encode_json
+    data = encode_json("sleepy_eye", 2, 1, "6f1c4c1e-7d8f-4f4e-9a51-2a6f1f1d2b3c").strip()
+
+    def run():
+        decode_message(data)
+    return run
+
+
+@benchmark("nmea.parse_gga")
+def bench_nmea_parse():
+    try:
+        import pynmea2
+    except ImportError:
+        raise Skip("pynmea2 not installed")
+    line = "$GNGGA,092725.00,1603.81246,N,10812.60012,E,1,08,1.01,12.3,M,-2.7,M,,*6B"
+
+    def run():
+        msg = pynmea2.parse(line)
+        if msg.gps_qual > 0:
+            return msg.latitude, msg.longitude
+    return run
+
+
+@benchmark("sos.build_payload")
+def bench_sos_payload():
+    _use_sim_gpio()
+    from services.sos_service import SosService
+    sos = SosService()
+
+    def run():
+        json.dumps(sos.build_payload(16.0635, 108.2100, "USB_GPS"))
+    return run
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _reference():
+    """Fixed pure-Python work timed next to every benchmark, to factor out the box's current speed."""
+    d = {}
+    for i in range(50):
+        d[str(i)] = i * 2
+    return sum(d.values())
+
+
+def time_callable(fn, rounds, min_round_time):
+    """
+    Calibrates the inner loop so each round lasts at least min_round_time; returns per-call
+    seconds, the iteration count and the fastest _reference() call seen between rounds.
+    """
+    iterations = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_round_time or iterations >= 1 << 20:
+            break
+        iterations *= 2
+
+    samples = []
+    reference = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        samples.append((time.perf_counter() - t0) / iterations)
+        t0 = time.perf_counter()
+        for _ in range(REFERENCE_ITERATIONS):
+            _reference()
+        reference.append((time.perf_counter() - t0) / REFERENCE_ITERATIONS)
+    return samples, iterations, min(reference)
+
+
+def run_benchmarks(pattern, rounds, min_round_time):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if not fnmatch.fnmatch(name, pattern):
+            continue
+        stdout = sys.stdout
+        sys.stdout = _Quiet()
+        try:
+            fn = setup()
+            samples, iterations, reference = time_callable(fn, rounds, min_round_time)
+        except Skip as e:
+            sys.stdout = stdout
+            print(f"  {name:<34} SKIPPED ({e})")
+            continue
+        finally:
+            sys.stdout = stdout
+
+        results[name] = {
+            "min_us": min(samples) * 1e6,
+            "median_us": statistics.median(samples) * 1e6,
+            "mean_us": statistics.mean(samples) * 1e6,
+            "stdev_us": (statistics.stdev(samples) if len(samples) > 1 else 0.0) * 1e6,
+            "ref_us": reference * 1e6,
+            "rounds": rounds,
+            "iterations": iterations,
+        }
+        r = results[name]
+        print(f"  {name:<34} median {r['median_us']:10.2f} us  min {r['min_us']:10.2f} us  "
+              f"stdev {r['stdev_us']:8.2f} us  ({iterations} x {rounds})")
+    return results
+
+
+def _baseline_path(name):
+    if os.path.sep in name or name.endswith(".json"):
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_results(results, name):
+    path = _baseline_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "meta": {
+                "created": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "node": platform.node(),
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Saved {len(results)} results to {path}")
+
+
+def load_results(name):
+    with open(_baseline_path(name)) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold):
+    """
+    Prints a comparison table of the fastest round (less sensitive to other load on the box
+    than the median). The change is scaled by the reference timed alongside each benchmark,
+    so a box running slower overall (CPU governor, thermal throttling) doesn't read as a
+    regression. Returns the names that regressed by more than threshold.
+    """
+    base_results = baseline["results"]
+    meta = baseline.get("meta", {})
+    if (meta.get("machine"), meta.get("python")) != (platform.machine(), platform.python_version()):
+        print(f"  Note: baseline taken on {meta.get('machine')} / python {meta.get('python')} "
+              f"({meta.get('created')}); timings are only comparable on the same hardware.")
+    regressions = []
+    print(f"  {'benchmark (min)':<34} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, result in current.items():
+        base = base_results.get(name)
+        if not base:
+            print(f"  {name:<34} {'-':>12} {result['min_us']:10.2f}us {'new':>9}")
+            continue
+        change = result["min_us"] / base["min_us"] - 1.0
+        if result.get("ref_us") and base.get("ref_us"):
+            change = (1.0 + change) * base["ref_us"] / result["ref_us"] - 1.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  improved"
+        print(f"  {name:<34} {base['min_us']:10.2f}us {result['min_us']:10.2f}us {change * 100:8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Device client hot-path benchmarks")
+    sub = parser.add_subparsers(dest="command")
+
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--filter", default="*", help="glob on benchmark names")
+    run_parser.add_argument("--rounds", type=int, default=7)
+    run_parser.add_argument("--min-round-time", type=float, default=0.05)
+    run_parser.add_argument("--save", help="store results as tests/benchmarks/<name>.json")
+    run_parser.add_argument("--compare", default=DEFAULT_BASELINE,
+                            help="baseline name/path to compare against (default: %(default)s)")
+    run_parser.add_argument("--no-compare", action="store_true", help="don't compare against a baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown (0.15 = 15%%)")
+
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    sub.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    if args.command == "compare":
+        regressions = compare(load_results(args.baseline), load_results(args.current)["results"], args.threshold)
+    elif args.command == "run":
+        print(f"Running benchmarks (python {platform.python_version()}, {platform.machine()})")
+        results = run_benchmarks(args.filter, args.rounds, args.min_round_time)
+        if args.save:
+            save_results(results, args.save)
+        regressions = []
+        if not args.no_compare and not args.save:
+            if os.path.exists(_baseline_path(args.compare)):
+                regressions = compare(load_results(args.compare), results, args.threshold)
+            else:
+                print(f"No baseline at {_baseline_path(args.compare)}; save one with --save {args.compare}")
+    else:
+        parser.print_help()
+        return
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Per-frame cost and end-to-end event latency of a detector plugin.
+
+Serves JPEG frames as an MJPEG stream shaped like the RTSP process's /mjpeg (X-Capture-Time
+per part) at --fps, runs DetectorService on it with the chosen plugin and a real
+AlertDispatcher (null audio sink), and reports:
+  frame cost       plugin.process() time per processed frame
+  event latency    capture time -> dispatch finished, per event
+  queue wait       frame received -> detector started on it
+  skipped/dropped  frames the scheduler let go (rate limit, overflow, stale)
+
+Frames come from --images (a directory of JPEGs, e.g. saved from /snapshot.jpg), else
+placeholder bytes (fine for the stub plugin). --url measures a live stream instead.
+
+Examples (from the project root):
+    python tests/detector_bench.py --plugin stub --options '{"cost_ms": 80, "events": [{"every": 10, "behavior": "yawn"}]}'
+    python3 tests/detector_bench.py --plugin cpu_reference --images data/frames --fps 15 --seconds 30
+    python3 tests/detector_bench.py --plugin cpu_reference --url http://127.0.0.1:8090/mjpeg
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.alert_dispatcher import AlertDispatcher
+from services.detector import DetectorService, load_plugin
+
+
+class NullAudio:
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        return "played"
+
+
+def serve_frames(frames, fps):
+    """MJPEG server cycling through frames at fps. Returns (server, url)."""
+    interval = 1.0 / fps
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+            self.end_headers()
+            next_tick = time.monotonic()
+            i = 0
+            try:
+                while True:
+                    data = frames[i % len(frames)]
+                    i += 1
+                    self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                     + f"Content-Length: {len(data)}\r\nX-Capture-Time: {time.time():.3f}\r\n\r\n".encode()
+                                     + data + b"\r\n")
+                    next_tick += interval
+                    delay = next_tick - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mjpeg", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/mjpeg"
+
+
+def load_frames(directory):
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.jp*g"))):
+        with open(path, "rb") as f:
+            frames.append(f.read())
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detector plugin frame cost and event latency")
+    parser.add_argument("--plugin", default="stub")
+    parser.add_argument("--options", default="{}", help="plugin options as JSON")
+    parser.add_argument("--images", help="directory of JPEG frames to stream")
+    parser.add_argument("--url", help="live MJPEG stream instead of the built-in server")
+    parser.add_argument("--fps", type=float, default=30.0, help="stream rate of the built-in server")
+    parser.add_argument("--max-fps", type=float, default=5.0, help="detector rate (DETECTOR_MAX_FPS)")
+    parser.add_argument("--queue-size", type=int, default=1)
+    parser.add_argument("--max-age", type=float, default=0.5)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        frames = load_frames(args.images) if args.images else [b"\xff\xd8placeholder\xff\xd9" * 1000]
+        if not frames:
+            print(f"[DetectorBench] No JPEGs in {args.images}.")
+            sys.exit(2)
+        server, url = serve_frames(frames, args.fps)
+
+    dispatcher = AlertDispatcher(NullAudio())
+    detector = DetectorService(load_plugin(args.plugin, json.loads(args.options)), dispatcher.dispatch, url=url,
+                               max_fps=args.max_fps, queue_size=args.queue_size, max_age=args.max_age)
+    detector.start()
+    time.sleep(args.seconds)
+    detector.stop()
+    if server:
+        server.shutdown()
+    stats = detector.stats()
+
+    print("[DetectorBench] ---------------- Report ----------------")
+    print(f"  plugin {args.plugin}, stream {url if args.url else f'{args.fps:g} fps'}, detector max {args.max_fps:g} fps, "
+          f"{args.seconds:g} s")
+    print(f"  frames: received {stats.get('received', 0)}, processed {stats.get('processed', 0)}, "
+          f"skipped {stats.get('skipped', 0)}, overflow {stats.get('dropped_overflow', 0)}, "
+          f"stale {stats.get('dropped_stale', 0)}, errors {stats.get('errors', 0)}")
+    print(f"  events: {stats.get('events', 0)}")
+    print(f"  {'':<14} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name in ("frame_cost", "event_latency", "queue_wait"):
+        if name + "_p50_ms" in stats:
+            print(f"  {name:<14} {stats[name + '_p50_ms']:8.2f} {stats[name + '_p95_ms']:8.2f} {stats[name + '_max_ms']:8.2f}")
+        else:
+            print(f"  {name:<14} {'-':>8} {'-':>8} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
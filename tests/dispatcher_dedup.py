@@ -0,0 +1,80 @@
+"""
+Cross-source duplicate suppression in AlertDispatcher.
+
+The same alert can reach the device over local ingest and over Firestore. Plays each
+scenario in both orders (local first, Firestore first) and checks it is played once, and
+that distinct alerts are still played. Ids mirror what the real paths pass: local ingest
+sends the sender's eventId or nothing, Firestore sends eventId or falls back to the doc id.
+
+Run from the project root:
+    python tests/dispatcher_dedup.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.alert_dispatcher import AlertDispatcher
+
+
+class RecordingAudio:
+    def __init__(self):
+        self.played = []
+
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        self.played.append((behavior, level, event_id))
+        return "played"
+
+
+# (name, [(source, event_id, behavior, level, delay before), ...], expected plays)
+SCENARIOS = [
+    ("shared eventId", [("local", "evt-1", "phone", 1, 0.0), ("firestore", "evt-1", "phone", 1, 0.2)], 1),
+    ("local without id, Firestore doc id", [("local", None, "phone", 1, 0.0), ("firestore", "doc-abc", "phone", 1, 0.2)], 1),
+    ("local uuid, Firestore doc without eventId", [("local", "uuid-1", "phone", 1, 0.0), ("firestore", "doc-def", "phone", 1, 0.2)], 1),
+    ("Firestore replay of a played doc", [("firestore", "doc-ghi", "phone", 1, 0.0), ("local", None, "phone", 1, 0.2),
+                                         ("firestore", "doc-ghi", "phone", 1, 0.2)], 1),
+    ("level as string vs int", [("local", None, "phone", 2, 0.0), ("firestore", "doc-pqr", "phone", "2", 0.2)], 1),
+    ("same source, two events", [("local", "uuid-2", "phone", 1, 0.0), ("local", "uuid-3", "phone", 1, 0.2)], 2),
+    ("different behavior", [("local", None, "phone", 1, 0.0), ("firestore", "doc-jkl", "yawn", 1, 0.2)], 2),
+    ("outside the fallback window", [("local", None, "phone", 1, 0.0),
+                                     ("firestore", "doc-mno", "phone", 1, AlertDispatcher.FALLBACK_WINDOW + 0.2)], 2),
+]
+
+
+def run(steps):
+    audio = RecordingAudio()
+    dispatcher = AlertDispatcher(audio)
+    clock = [1000.0]
+    real_monotonic = time.monotonic
+    time.monotonic = lambda: clock[0]
+    try:
+        for source, event_id, behavior, level, delay in steps:
+            clock[0] += delay
+            dispatcher.dispatch(behavior, level, 2, event_id=event_id, source=source)
+    finally:
+        time.monotonic = real_monotonic
+    return len(audio.played)
+
+
+def main():
+    ok = True
+    for name, steps, expected in SCENARIOS:
+        orders = [steps]
+        # Two-source scenarios also run Firestore-first (delays stay with their position)
+        if len({step[0] for step in steps}) == 2 and len(steps) == 2:
+            first, second = steps
+            orders.append([second[:4] + (first[4],), first[:4] + (second[4],)])
+        for steps_in_order in orders:
+            played = run(steps_in_order)
+            label = f"{name} ({steps_in_order[0][0]} first)"
+            status = "ok" if played == expected else "FAIL"
+            if played != expected:
+                ok = False
+            print(f"[DedupTest] {label:<60} played {played}, expected {expected}: {status}")
+    print("[DedupTest] PASS" if ok else "[DedupTest] FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
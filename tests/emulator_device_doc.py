@@ -0,0 +1,125 @@
+"""
+Device document bootstrap against the Firestore emulator.
+
+A listener on a document that does not exist yet calls back with an empty snapshot list;
+FirebaseService must still create devices/{id} from it. Checks a fresh device id (doc
+created with the defaults) and an existing doc missing fields (defaults merged, existing
+fields kept), then that the cached greeting is not claimed when it could not play offline.
+
+Requires the Firebase CLI (`npm i -g firebase-tools`) and google-cloud-firestore.
+Run from the project root:
+    python tests/emulator_device_doc.py
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.doc_cache import DocCache
+from services.firebase_service import FirebaseService, greet_from_cache
+from simulate_dead_zone import EMULATOR_HOST, PROJECT_ID, start_emulator, stop_emulator, wait_for
+
+
+class OfflineAudio:
+    """Stands in for AudioService with an empty audio bank: offline TTS never plays."""
+
+    def __init__(self):
+        self.spoken = []
+
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        pass
+
+    def speak(self, text, priority=0, lang='vi', offline=False):
+        if offline:
+            return False
+        self.spoken.append(text)
+        return True
+
+
+def start_service(db, device_id, data_dir, audio=None):
+    service = FirebaseService(cred_path=None, device_id=device_id, audio_service=audio, db=db,
+                              cache=DocCache(os.path.join(data_dir, f"{device_id}.json")))
+    service.initialize_device()
+    service.start_listening()
+    return service
+
+
+def main():
+    os.environ["FIRESTORE_EMULATOR_HOST"] = EMULATOR_HOST
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore
+
+    data_dir = tempfile.mkdtemp(prefix="ck-emulator-")
+    emulator = start_emulator(data_dir)
+    db = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+    ok = True
+    try:
+        # Fresh device id: the first snapshot is empty and must create the doc
+        fresh_id = f"jetson-fresh-{uuid.uuid4().hex[:8]}"
+        service = start_service(db, fresh_id, data_dir)
+        doc_ref = db.collection("devices").document(fresh_id)
+        if wait_for(lambda: doc_ref.get().exists, 15):
+            data = doc_ref.get().to_dict()
+            if data.get("deviceId") != fresh_id or data.get("status") != "deactivate" or "linkedUserId" not in data:
+                print(f"[Sim] FAIL: fresh device doc has wrong defaults: {data}")
+                ok = False
+            else:
+                print(f"[Sim] Fresh device doc created: {data}")
+        else:
+            print("[Sim] FAIL: devices/{id} was never created for a fresh device id")
+            ok = False
+        service.stop_listening()
+
+        # Existing doc missing fields: defaults merged, existing fields kept
+        partial_id = f"jetson-partial-{uuid.uuid4().hex[:8]}"
+        partial_ref = db.collection("devices").document(partial_id)
+        partial_ref.set({"status": "activate"})
+        service = start_service(db, partial_id, data_dir)
+        if wait_for(lambda: "deviceId" in (partial_ref.get().to_dict() or {}), 15):
+            data = partial_ref.get().to_dict()
+            if data.get("status") != "activate":
+                print(f"[Sim] FAIL: existing status overwritten: {data}")
+                ok = False
+            else:
+                print(f"[Sim] Partial device doc completed: {data}")
+        else:
+            print("[Sim] FAIL: defaults never merged into the existing device doc")
+            ok = False
+        service.stop_listening()
+
+        # Cached greeting that cannot play offline is not claimed, so the live snapshot greets
+        user_id = f"user-{uuid.uuid4().hex[:8]}"
+        linked_id = f"jetson-linked-{uuid.uuid4().hex[:8]}"
+        db.collection("users").document(user_id).set({"fullName": "Cache Tester"})
+        db.collection("devices").document(linked_id).set({"deviceId": linked_id, "linkedUserId": user_id,
+                                                          "status": "activate"})
+        cache = DocCache(os.path.join(data_dir, f"{linked_id}.json"))
+        cache.put(f"devices/{linked_id}", {"linkedUserId": user_id})
+        cache.put(f"users/{user_id}", {"fullName": "Cache Tester"})
+        audio = OfflineAudio()
+        greeted = greet_from_cache(cache, audio, device_id=linked_id)
+        if greeted is not None:
+            print(f"[Sim] FAIL: greet_from_cache returned {greeted} without playing")
+            ok = False
+        service = FirebaseService(cred_path=None, device_id=linked_id, audio_service=audio, db=db, cache=cache)
+        service.greeted_user_id = greeted
+        service.start_listening()
+        if wait_for(lambda: audio.spoken, 15):
+            print(f"[Sim] Live greeting played: {audio.spoken[0]}")
+        else:
+            print("[Sim] FAIL: driver never greeted")
+            ok = False
+        service.stop_listening()
+        time.sleep(1)
+    finally:
+        stop_emulator(emulator)
+
+    print("[Sim] PASS" if ok else "[Sim] FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Fake u-blox receiver on a pseudo-terminal, for testing services/gps_config.py and
+SosService without hardware.
+
+It emits NMEA (GGA, GLL, GSA, GSV x3, RMC, VTG) once per navigation period and answers
+UBX CFG-MSG / CFG-RATE / CFG-PRT with ACK-ACK, applying them. It reports "no fix" until
+the time-to-first-fix has passed. That is --cold-ttff, or --hot-ttff once MGA-INI time
+and position have been injected.
+
+Examples (from the project root):
+    # Serve a fake receiver; point SosService.GPS_PORT at the printed /dev/pts/N
+    python tests/fake_ublox.py --lat 16.0544 --lon 108.2022
+
+    # Configure it with UbxConfigurator, then compare cold vs hot TTFF and serial load
+    python tests/fake_ublox.py --self-test
+"""
+import argparse
+import datetime
+import os
+import select
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.gps_config import (ACK_ACK, CFG_MSG, CFG_PRT, CFG_RATE, MGA_INI, NMEA_CLASS, NMEA_IDS,
+                                 UbxConfigurator, UbxParser, save_state, ubx_message)
+
+SENTENCE_NAMES = {value: name for name, value in NMEA_IDS.items()}
+
+
+def nmea(body):
+    checksum = 0
+    for char in body.encode("ascii"):
+        checksum ^= char
+    return f"${body}*{checksum:02X}\r\n".encode("ascii")
+
+
+def _dm(value, positive, negative, degree_digits):
+    hemisphere = positive if value >= 0 else negative
+    value = abs(value)
+    degrees = int(value)
+    return f"{degrees:0{degree_digits}d}{(value - degrees) * 60:07.4f}", hemisphere
+
+
+class FakeUblox:
+    def __init__(self, lat, lon, cold_ttff=30.0, hot_ttff=2.0):
+        self.lat = lat
+        self.lon = lon
+        self.cold_ttff = cold_ttff
+        self.hot_ttff = hot_ttff
+        self.enabled = {name: True for name in ("GGA", "GLL", "GSA", "GSV", "RMC", "VTG")}
+        self.period = 1.0
+        self.baudrate = 9600
+        self.time_injected = False
+        self.position_injected = False
+        self.started = time.monotonic()
+        self.bytes_out = 0
+        self.parser = UbxParser()
+        self.running = True
+
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.path = os.ttyname(slave)
+        self.slave = slave  # Kept open so the pty stays alive between client opens
+
+    @property
+    def ttff(self):
+        return self.hot_ttff if (self.time_injected and self.position_injected) else self.cold_ttff
+
+    def has_fix(self):
+        return time.monotonic() - self.started >= self.ttff
+
+    def epoch(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        stamp = now.strftime("%H%M%S.") + f"{now.microsecond // 10000:02d}"
+        fix = self.has_fix()
+        lat, ns = _dm(self.lat, "N", "S", 2)
+        lon, ew = _dm(self.lon, "E", "W", 3)
+        if not fix:
+            lat = ns = lon = ew = ""
+        out = []
+        if self.enabled["RMC"]:
+            out.append(nmea(f"GNRMC,{stamp},{'A' if fix else 'V'},{lat},{ns},{lon},{ew},0.0,,"
+                            f"{now.strftime('%d%m%y')},,,{'A' if fix else 'N'}"))
+        if self.enabled["VTG"]:
+            out.append(nmea("GNVTG,,T,,M,0.0,N,0.0,K,N"))
+        if self.enabled["GGA"]:
+            out.append(nmea(f"GNGGA,{stamp},{lat},{ns},{lon},{ew},{1 if fix else 0},{8 if fix else 0},"
+                            f"{'1.0' if fix else '99.99'},{'12.0' if fix else ''},M,{'-5.0' if fix else ''},M,,"))
+        if self.enabled["GSA"]:
+            out.append(nmea(f"GNGSA,A,{3 if fix else 1},,,,,,,,,,,,,99.99,99.99,99.99"))
+        if self.enabled["GSV"]:
+            for i in range(1, 4):
+                out.append(nmea(f"GPGSV,3,{i},12,01,45,120,30,02,30,200,28,03,60,045,35,04,10,300,20"))
+        if self.enabled["GLL"]:
+            out.append(nmea(f"GNGLL,{lat},{ns},{lon},{ew},{stamp},{'A' if fix else 'V'},{'A' if fix else 'N'}"))
+        return b"".join(out)
+
+    def handle(self, kind, payload):
+        reply = True
+        if kind == CFG_MSG and len(payload) >= 3 and payload[0] == NMEA_CLASS:
+            name = SENTENCE_NAMES.get(payload[1])
+            if name in self.enabled:
+                self.enabled[name] = payload[2] > 0
+        elif kind == CFG_RATE:
+            self.period = struct.unpack_from("<H", payload)[0] / 1000.0
+        elif kind == CFG_PRT:
+            self.baudrate = struct.unpack_from("<I", payload, 8)[0]
+        elif kind == MGA_INI:
+            if payload[0] == 0x10:
+                self.time_injected = True
+            elif payload[0] == 0x01:
+                self.position_injected = True
+            reply = False  # MGA-ACK is off by default
+        else:
+            reply = kind[0] == 0x06
+        if reply:
+            os.write(self.master, ubx_message(ACK_ACK, bytes(kind)))
+
+    def serve(self):
+        next_epoch = time.monotonic()
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], max(0.0, next_epoch - time.monotonic()))
+            if readable:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:
+                    data = b""
+                for kind, payload in self.parser.feed(data):
+                    self.handle(kind, payload)
+            if time.monotonic() >= next_epoch:
+                data = self.epoch()
+                self.bytes_out += len(data)
+                try:
+                    os.write(self.master, data)
+                except OSError:
+                    pass
+                next_epoch += self.period
+
+    def restart(self):
+        """Power cycle: RAM configuration and injected aiding are lost."""
+        self.enabled = {name: True for name in self.enabled}
+        self.period = 1.0
+        self.time_injected = self.position_injected = False
+        self.started = time.monotonic()
+
+
+def measure_ttff(fake, timeout):
+    """Seconds from receiver power-on to the first GGA with a fix."""
+    import serial
+    with serial.Serial(fake.path, 9600, timeout=0.5) as ser:
+        while time.monotonic() - fake.started < timeout:
+            line = ser.readline()
+            if line.startswith(b"$GNGGA") and line.split(b",")[6] not in (b"", b"0"):
+                return time.monotonic() - fake.started
+    return None
+
+
+def self_test(args):
+    try:
+        import serial
+    except ImportError:
+        print("[FakeUblox] --self-test needs pyserial.")
+        sys.exit(2)
+
+    fake = FakeUblox(args.lat, args.lon, args.cold_ttff, args.hot_ttff)
+    threading.Thread(target=fake.serve, daemon=True).start()
+    state_path = os.path.join(tempfile.mkdtemp(), "gps_state.json")
+    print(f"[FakeUblox] Receiver on {fake.path}")
+
+    time.sleep(2.0)
+    rate_before = fake.bytes_out / (time.monotonic() - fake.started)
+
+    with serial.Serial(fake.path, 9600, timeout=0.2) as ser:
+        results = UbxConfigurator(state_path=state_path).configure(ser, is_usb=True)
+    cold = measure_ttff(fake, args.cold_ttff + 5)
+    bytes_mark, time_mark = fake.bytes_out, time.monotonic()
+    time.sleep(3.0)
+    rate_after = (fake.bytes_out - bytes_mark) / (time.monotonic() - time_mark)
+
+    # Next boot: last position saved, receiver power cycled, hot start injected
+    save_state(args.lat, args.lon, 12.0, path=state_path)
+    fake.restart()
+    with serial.Serial(fake.path, 9600, timeout=0.2) as ser:
+        UbxConfigurator(state_path=state_path).configure(ser, is_usb=True)
+    hot = measure_ttff(fake, args.cold_ttff + 5)
+
+    print("[FakeUblox] ---------------- Result ----------------")
+    print(f"  acknowledged : {sum(1 for ok in results.values() if ok)}/{len(results)} {results}")
+    print(f"  serial load  : {rate_before:.0f} B/s -> {rate_after:.0f} B/s")
+    print(f"  TTFF cold    : {cold:.1f}s" if cold is not None else "  TTFF cold    : no fix")
+    print(f"  TTFF hot     : {hot:.1f}s" if hot is not None else "  TTFF hot     : no fix")
+    ok = all(results.values()) and hot is not None and (cold is None or hot < cold) and rate_after < rate_before
+    print("[FakeUblox] PASS" if ok else "[FakeUblox] FAIL")
+    sys.exit(0 if ok else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake u-blox receiver on a pty")
+    parser.add_argument("--lat", type=float, default=16.0544)
+    parser.add_argument("--lon", type=float, default=108.2022)
+    parser.add_argument("--cold-ttff", type=float, default=30.0)
+    parser.add_argument("--hot-ttff", type=float, default=2.0)
+    parser.add_argument("--self-test", action="store_true")
+    args = parser.parse_args()
+
+    if args.self_test:
+        if args.cold_ttff == 30.0:
+            args.cold_ttff = 8.0  # Keep the self-test short
+        self_test(args)
+        return
+
+    fake = FakeUblox(args.lat, args.lon, args.cold_ttff, args.hot_ttff)
+    print(f"[FakeUblox] Receiver on {fake.path} (Ctrl+C to stop)")
+    try:
+        fake.serve()
+    except KeyboardInterrupt:
+        print(f"\n[FakeUblox] {fake.bytes_out} bytes sent.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Network fault-injection harness for the SOS and Firestore paths.
+
+Every scenario puts a FaultProxy (tests/fault_proxy.py) between the device-side client and a
+local stand-in, then reports:
+
+  sos        SosService with its real timeouts and outbox against stand-ins for the alert API
+             and IP geolocation: button presses every --interval seconds, delivery time
+             (press -> first receipt at the API) p50/p95/max, undelivered and duplicate SOS
+             (the API got it, the client timed out and resent)
+  firestore  FirebaseService listening through the proxy to the Firestore emulator while the
+             "phone app" writes alerts directly: delivery latency, and backlog recovery time
+             (end of the last outage window -> last alert written during it played)
+
+Scenarios are latency/bandwidth/drop/outage profiles (SCENARIOS below, or --scenarios FILE
+with the same shape). GPS is left out so every SOS goes through IP geolocation.
+
+Examples (from the project root; firestore needs the emulator, see simulate_dead_zone.py):
+    python tests/fault_injection.py --only baseline,dead_zone_reset --presses 6
+    python tests/fault_injection.py --paths sos --api-timeout 5 --geo-timeout 2 --retry-interval 5
+    python tests/fault_injection.py --paths firestore --start-emulator
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fault_proxy import FaultProfile, FaultProxy
+
+SCENARIOS = {
+    "baseline": {},
+    "cellular_3g": {"latency": 0.15, "jitter": 0.08, "bandwidth": 48000},
+    "edge_2g": {"latency": 0.4, "jitter": 0.2, "bandwidth": 10000, "drop": 0.02},
+    "lossy": {"latency": 0.1, "drop": 0.1},
+    "dead_zone_blackhole": {"latency": 0.1, "outages": [[2, 32]], "outage_mode": "blackhole"},
+    "dead_zone_reset": {"latency": 0.1, "outages": [[2, 22]], "outage_mode": "reset"},
+}
+
+DEVICE_ID = "jetson-nano-faults"
+USER_ID = "test_user_faults"
+EMULATOR_HOST = "127.0.0.1:8080"
+PROJECT_ID = "demo-ck"
+
+out = sys.__stdout__
+
+
+def log(text):
+    print(f"[Faults] {text}", file=out, flush=True)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def distribution(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "max": None}
+    return {"p50": statistics.median(samples), "p95": percentile(samples, 0.95), "max": max(samples)}
+
+
+# ---------- Stand-ins ----------
+
+class StandIn:
+    """Alert API (POST, records first receipt per deviceId) and ip-api (GET) in one HTTP server."""
+
+    def __init__(self, snapshot_bytes=0):
+        self.received = {}     # deviceId -> monotonic time of first receipt
+        self.duplicates = 0
+        self.geo_requests = 0
+        self.snapshot = os.urandom(snapshot_bytes) if snapshot_bytes else None
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/snapshot.jpg") and stand_in.snapshot:
+                    self._reply(200, stand_in.snapshot, "image/jpeg")
+                    return
+                with stand_in.lock:
+                    stand_in.geo_requests += 1
+                self._reply(200, json.dumps({"status": "success", "lat": 21.0285, "lon": 105.8542}).encode())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                now = time.monotonic()
+                try:
+                    device_id = json.loads(body)["deviceId"]
+                except (ValueError, KeyError):
+                    self._reply(400, b'{"error": "bad payload"}')
+                    return
+                with stand_in.lock:
+                    if device_id in stand_in.received:
+                        stand_in.duplicates += 1
+                    else:
+                        stand_in.received[device_id] = now
+                self._reply(201, b'{"ok": true}')
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="StandIn", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ---------- SOS ----------
+
+def run_sos(name, profile, args):
+    from services.sos_service import SosService
+    from services.track_store import TrackRing
+
+    stand_in = StandIn(args.snapshot_kb * 1024)
+    proxy = FaultProxy("127.0.0.1", stand_in.port, profile).start()
+
+    sos = SosService(device_id=DEVICE_ID)
+    sos.MAIN_API_URL = f"http://{proxy.url_host}/api/alerts/create"
+    sos.IP_GEO_URL = f"http://{proxy.url_host}/json/"
+    sos.SNAPSHOT_URL = f"http://127.0.0.1:{stand_in.port}/snapshot.jpg"  # Local, not over the link
+    sos.ATTACH_SNAPSHOT = bool(args.snapshot_kb)
+    sos.GPS_WAIT_FOR_FIX = 0.0
+    sos.track = TrackRing(path=os.path.join(tempfile.mkdtemp(prefix="ck-faults-"), "track.bin"))  # Not the device's
+    if args.api_timeout is not None:
+        sos.API_TIMEOUT = args.api_timeout
+    if args.geo_timeout is not None:
+        sos.IP_GEO_TIMEOUT = args.geo_timeout
+    sos.OUTBOX_RETRY_INTERVAL = args.retry_interval
+    sos.running = True  # Enables outbox retries without the GPIO / GPS threads
+
+    presses = {}  # press id -> monotonic press time
+    handling = []
+    for i in range(args.presses):
+        press_id = f"{DEVICE_ID}-{name}-{i}"
+        presses[press_id] = time.monotonic()
+        sos.device_id = press_id
+        t0 = time.monotonic()
+        sos._handle_button_press()
+        handling.append(time.monotonic() - t0)
+        pause = args.interval - (time.monotonic() - t0)
+        if pause > 0:
+            time.sleep(pause)
+
+    deadline = time.monotonic() + args.settle
+    while time.monotonic() < deadline and len(stand_in.received) < len(presses):
+        time.sleep(0.2)
+    time.sleep(1.0)  # Let the last replies reach the client so the outbox depth is final
+
+    sos.running = False
+    for timer in (sos.retry_timer, sos.led_timer):
+        if timer:
+            timer.cancel()
+    proxy.stop()
+    stand_in.stop()
+
+    delays = [stand_in.received[p] - t for p, t in presses.items() if p in stand_in.received]
+    return dict(distribution(delays), scenario=name, presses=len(presses), delivered=len(delays),
+                duplicates=stand_in.duplicates, handling_max=max(handling) if handling else None,
+                outbox=len(sos.outbox), proxy=proxy.stats())
+
+
+# ---------- Firestore ----------
+
+class RecordingAudio:
+    """Stands in for AudioService: first play time per event id (the history document id)."""
+
+    def __init__(self):
+        self.played = {}
+
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        self.played.setdefault(event_id, time.monotonic())
+        return "played"
+
+    def speak(self, text, priority=0, lang='vi'):
+        pass
+
+
+def run_firestore(name, profile, args):
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore
+    from services.alert_dispatcher import AlertDispatcher
+    from services.connectivity import ConnectivityManager
+    from services.doc_cache import DocCache
+    from services.firebase_service import FirebaseService
+
+    host, port = args.emulator.rsplit(":", 1)
+    proxy = FaultProxy(host, int(port), profile)
+
+    # The "phone app" writes straight to the emulator; only the device goes through the proxy
+    os.environ["FIRESTORE_EMULATOR_HOST"] = args.emulator
+    writer = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+    writer.collection("users").document(USER_ID).set({"fullName": "Fault Tester"})
+    writer.collection("devices").document(DEVICE_ID).set({"deviceId": DEVICE_ID, "linkedUserId": USER_ID,
+                                                           "status": "activate"})
+    os.environ["FIRESTORE_EMULATOR_HOST"] = proxy.url_host
+    device_db = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+
+    audio = RecordingAudio()
+    service = FirebaseService(cred_path=None, device_id=DEVICE_ID, audio_service=audio, db=device_db,
+                              cache=DocCache(os.path.join(tempfile.mkdtemp(prefix="ck-faults-"), "cache.json")))
+    service.dispatcher = AlertDispatcher(audio)
+    service.connectivity = ConnectivityManager(probe=service._probe_device_listener, check_interval=1.0,
+                                               probe_interval=3.0, backoff_max=8.0)
+    written = {}  # document id -> monotonic write time
+
+    proxy.start()  # Outage windows count from here
+    service.start_listening()
+    histories = writer.collection("users").document(USER_ID).collection("histories")
+    try:
+        end = max([window[1] for window in profile.outages] + [args.alert_seconds])
+        next_alert = time.monotonic() + 2.0  # Let the listeners attach
+        while proxy.elapsed() < end:
+            if time.monotonic() >= next_alert:
+                _, ref = histories.add({"behavior": "phone", "priority": 2, "level": 1,
+                                        "timestamp": datetime.datetime.now(datetime.timezone.utc),
+                                        "serverTime": firestore.SERVER_TIMESTAMP})
+                written[ref.id] = time.monotonic()
+                next_alert += args.alert_interval
+            time.sleep(0.05)
+        outage_end = proxy.started + max([window[1] for window in profile.outages], default=0.0)
+
+        deadline = time.monotonic() + args.settle
+        while time.monotonic() < deadline and not set(written) <= set(audio.played):
+            time.sleep(0.2)
+        time.sleep(1.0)  # Catch late replays
+    finally:
+        service.stop_listening()
+        proxy.stop()
+
+    played = audio.played
+    delays = [played[doc_id] - t for doc_id, t in written.items() if doc_id in played]
+    backlog = [doc_id for doc_id, t in written.items() if profile.outages and t < outage_end]
+    recovery = None
+    if backlog and all(doc_id in played for doc_id in backlog):
+        recovery = max(0.0, max(played[doc_id] for doc_id in backlog) - outage_end)
+    return dict(distribution(delays), scenario=name, alerts=len(written), delivered=len(delays),
+                replays=service.dispatcher.counts[("firestore", "duplicate")], backlog=len(backlog), recovery=recovery,
+                connectivity=service.connectivity.stats(), proxy=proxy.stats())
+
+
+# ---------- Report ----------
+
+def fmt(value, scale=1.0, width=8):
+    return f"{value * scale:{width}.2f}" if value is not None else f"{'-':>{width}}"
+
+
+def print_report(sos_results, firestore_results, scenarios):
+    log("---------------- Report ----------------")
+    for name, raw in scenarios.items():
+        log(f"{name:<20} {FaultProfile.from_dict(raw).describe()}")
+    if sos_results:
+        log("SOS delivery (press -> API receipt), seconds")
+        log(f"  {'scenario':<20} {'sent':>4} {'ok':>4} {'dup':>4} {'p50':>8} {'p95':>8} {'max':>8} "
+            f"{'press max':>9} {'outbox':>6}")
+        for r in sos_results:
+            log(f"  {r['scenario']:<20} {r['presses']:>4} {r['delivered']:>4} {r['duplicates']:>4} {fmt(r['p50'])} "
+                f"{fmt(r['p95'])} {fmt(r['max'])} {fmt(r['handling_max'], width=9)} {r['outbox']:>6}")
+    if firestore_results:
+        log("Firestore alerts (write -> played), seconds")
+        log(f"  {'scenario':<20} {'sent':>4} {'ok':>4} {'dup':>4} {'p50':>8} {'p95':>8} {'max':>8} "
+            f"{'backlog':>7} {'recovery':>8}")
+        for r in firestore_results:
+            log(f"  {r['scenario']:<20} {r['alerts']:>4} {r['delivered']:>4} {r['replays']:>4} {fmt(r['p50'])} "
+                f"{fmt(r['p95'])} {fmt(r['max'])} {r['backlog']:>7} {fmt(r['recovery'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SOS / Firestore behaviour under injected network faults")
+    parser.add_argument("--paths", default="sos,firestore", help="sos, firestore or both")
+    parser.add_argument("--scenarios", help="JSON file {name: profile} (default: built-in SCENARIOS)")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--presses", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=4.0, help="seconds between SOS presses")
+    parser.add_argument("--api-timeout", type=float, help="override SosService.API_TIMEOUT")
+    parser.add_argument("--geo-timeout", type=float, help="override SosService.IP_GEO_TIMEOUT")
+    parser.add_argument("--retry-interval", type=float, default=30.0, help="SosService.OUTBOX_RETRY_INTERVAL")
+    parser.add_argument("--snapshot-kb", type=int, default=0, help="attach a camera snapshot of this size")
+    parser.add_argument("--settle", type=float, default=90.0, help="max wait for stragglers after a scenario")
+    parser.add_argument("--emulator", default=EMULATOR_HOST)
+    parser.add_argument("--start-emulator", action="store_true")
+    parser.add_argument("--alert-seconds", type=float, default=20.0, help="firestore: write alerts for this long")
+    parser.add_argument("--alert-interval", type=float, default=2.0)
+    parser.add_argument("--verbose", action="store_true", help="show the services' own logs")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenarios:
+        with open(args.scenarios) as f:
+            scenarios = json.load(f)
+    if args.only:
+        scenarios = {name: scenarios[name] for name in args.only.split(",")}
+    paths = args.paths.split(",")
+
+    if "sos" in paths:
+        try:
+            import requests  # noqa: F401
+        except ImportError:
+            log("requests is not installed; skipping the SOS path.")
+            paths.remove("sos")
+    if "firestore" in paths:
+        try:
+            import google.cloud.firestore  # noqa: F401
+        except ImportError:
+            log("google-cloud-firestore is not installed; skipping the Firestore path.")
+            paths.remove("firestore")
+    if not paths:
+        sys.exit(2)
+
+    emulator = None
+    if "firestore" in paths and args.start_emulator:
+        from simulate_dead_zone import start_emulator
+        emulator = start_emulator(tempfile.mkdtemp(prefix="ck-emulator-"))
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    sos_results, firestore_results = [], []
+    try:
+        for name, raw in scenarios.items():
+            profile = FaultProfile.from_dict(raw)
+            if "sos" in paths:
+                log(f"SOS       {name}: {profile.describe()}")
+                with quiet:
+                    sos_results.append(run_sos(name, profile, args))
+            if "firestore" in paths:
+                log(f"Firestore {name}: {profile.describe()}")
+                with quiet:
+                    firestore_results.append(run_firestore(name, FaultProfile.from_dict(raw), args))
+    finally:
+        if emulator:
+            from simulate_dead_zone import stop_emulator
+            stop_emulator(emulator)
+    print_report(sos_results, firestore_results, scenarios)
+
+
+if __name__ == "__main__":
+    main()
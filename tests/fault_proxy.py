@@ -0,0 +1,274 @@
+"""
+TCP fault-injection proxy: sits between a client and a local stand-in (alert API, IP
+geolocation, Firestore emulator) and applies a FaultProfile to everything passing through.
+
+  latency / jitter  one-way delay added to every chunk, per direction (ordering is kept)
+  bandwidth         bytes per second, per direction
+  drop              probability that a segment is "lost": TCP hides the loss, so the chunk
+                    arrives one retransmission timeout (rto, doubling per repeat) later
+  outages           (start, end) windows in seconds from FaultProxy.start(). "blackhole"
+                    holds all traffic and new connections until the window ends (a dead
+                    zone: the client only sees its own timeouts); "reset" resets every open
+                    connection and refuses new ones (the modem dropping the PDP context)
+
+Used by tests/fault_injection.py; can also run on its own in front of anything:
+    python tests/fault_proxy.py --listen 8081 --upstream 127.0.0.1:8080 --latency 0.3 --drop 0.05
+    python tests/fault_proxy.py --listen 8081 --upstream 127.0.0.1:8080 --outage 10:40 --mode reset
+"""
+import argparse
+import collections
+import random
+import socket
+import struct
+import threading
+import time
+
+CHUNK = 1460  # One segment per read, so drop applies per segment
+
+
+class FaultProfile:
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=None, drop=0.0, rto=0.2, outages=(),
+                 outage_mode="blackhole"):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.drop = drop
+        self.rto = rto
+        self.outages = [tuple(window) for window in outages]
+        self.outage_mode = outage_mode
+
+    @classmethod
+    def from_dict(cls, raw):
+        return cls(**raw)
+
+    def describe(self):
+        parts = []
+        if self.latency or self.jitter:
+            jitter = f"±{self.jitter * 1000:.0f}" if self.jitter else ""
+            parts.append(f"{self.latency * 1000:.0f}{jitter} ms")
+        if self.bandwidth:
+            parts.append(f"{self.bandwidth / 1000:.0f} kB/s")
+        if self.drop:
+            parts.append(f"drop {self.drop * 100:.0f}%")
+        for start, end in self.outages:
+            parts.append(f"{self.outage_mode} {start:g}-{end:g} s")
+        return ", ".join(parts) or "clean"
+
+
+class _Pipe:
+    """One direction of a connection: a reader thread queues chunks, a writer thread delivers them."""
+
+    def __init__(self, proxy, source, sink, name):
+        self.proxy = proxy
+        self.source = source
+        self.sink = sink
+        self.name = name
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.last_due = 0.0
+        self.next_send = 0.0
+
+    def start(self):
+        threading.Thread(target=self._read, name=f"FaultProxy-{self.name}-r", daemon=True).start()
+        threading.Thread(target=self._write, name=f"FaultProxy-{self.name}-w", daemon=True).start()
+
+    def _read(self):
+        while True:
+            try:
+                data = self.source.recv(CHUNK)
+            except OSError:
+                data = b""
+            profile = self.proxy.profile
+            now = time.monotonic()
+            due = now + profile.latency + (random.uniform(-profile.jitter, profile.jitter) if profile.jitter else 0.0)
+            rto = profile.rto
+            while data and profile.drop and random.random() < profile.drop:
+                due += rto
+                rto *= 2
+                self.proxy.count("dropped")
+            due = max(due, now, self.last_due)  # Jitter never reorders
+            self.last_due = due
+            with self.cond:
+                self.queue.append((due, data))
+                self.cond.notify()
+            if not data:
+                return
+
+    def _write(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                due, data = self.queue.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.proxy.hold_while_blackholed()
+            if not data:
+                self._shutdown()
+                return
+            profile = self.proxy.profile
+            if profile.bandwidth:
+                now = time.monotonic()
+                if self.next_send > now:
+                    time.sleep(self.next_send - now)
+                self.next_send = max(now, self.next_send) + len(data) / float(profile.bandwidth)
+            try:
+                self.sink.sendall(data)
+            except OSError:
+                self._shutdown()
+                return
+            self.proxy.count("bytes_" + self.name, len(data))
+
+    def _shutdown(self):
+        try:
+            self.sink.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class FaultProxy:
+    """Listens on listen_port (0 picks a free one) and forwards to (upstream_host, upstream_port)."""
+
+    def __init__(self, upstream_host, upstream_port, profile=None, listen_host="127.0.0.1", listen_port=0):
+        self.upstream = (upstream_host, upstream_port)
+        self.profile = profile or FaultProfile()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((listen_host, listen_port))
+        self.address = self.server.getsockname()
+        self.started = None
+        self.running = False
+        self.connections = []
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    @property
+    def url_host(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def start(self):
+        self.started = time.monotonic()
+        self.running = True
+        self.server.listen(64)
+        threading.Thread(target=self._accept_loop, name="FaultProxy-accept", daemon=True).start()
+        threading.Thread(target=self._outage_loop, name="FaultProxy-outage", daemon=True).start()
+        return self
+
+    def set_profile(self, profile):
+        """Swaps the profile; outage windows restart from now."""
+        self.profile = profile
+        self.started = time.monotonic()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def in_outage(self):
+        t = self.elapsed()
+        return any(start <= t < end for start, end in self.profile.outages)
+
+    def hold_while_blackholed(self):
+        while self.running and self.profile.outage_mode == "blackhole" and self.in_outage():
+            time.sleep(0.05)
+
+    def _reset(self, sock):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))  # RST on close
+            sock.close()
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.count("connections")
+            threading.Thread(target=self._connect, args=(client,), name="FaultProxy-conn", daemon=True).start()
+
+    def _connect(self, client):
+        if self.in_outage():
+            if self.profile.outage_mode == "reset":
+                self.count("refused")
+                self._reset(client)
+                return
+            self.hold_while_blackholed()
+        try:
+            upstream = socket.create_connection(self.upstream, timeout=5)
+            upstream.settimeout(None)
+        except OSError:
+            self.count("upstream_errors")
+            self._reset(client)
+            return
+        for sock in (client, upstream):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.lock:
+            self.connections.append((client, upstream))
+        _Pipe(self, client, upstream, "up").start()
+        _Pipe(self, upstream, client, "down").start()
+
+    def _outage_loop(self):
+        """In "reset" mode, resets every open connection when a window starts."""
+        was_out = False
+        while self.running:
+            out = self.in_outage()
+            if out and not was_out and self.profile.outage_mode == "reset":
+                with self.lock:
+                    connections, self.connections = self.connections, []
+                for client, upstream in connections:
+                    self._reset(client)
+                    self._reset(upstream)
+                    self.count("resets")
+            was_out = out
+            time.sleep(0.05)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def stop(self):
+        self.running = False
+        try:
+            self.server.close()
+        except OSError:
+            pass
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for client, upstream in connections:
+            self._reset(client)
+            self._reset(upstream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP fault-injection proxy")
+    parser.add_argument("--listen", type=int, required=True, help="local port")
+    parser.add_argument("--upstream", required=True, help="host:port")
+    parser.add_argument("--latency", type=float, default=0.0, help="one-way delay, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes/s per direction")
+    parser.add_argument("--drop", type=float, default=0.0, help="segment loss probability")
+    parser.add_argument("--outage", action="append", default=[], help="start:end seconds, repeatable")
+    parser.add_argument("--mode", choices=("blackhole", "reset"), default="blackhole")
+    args = parser.parse_args()
+
+    host, port = args.upstream.rsplit(":", 1)
+    outages = [tuple(float(x) for x in window.split(":")) for window in args.outage]
+    profile = FaultProfile(args.latency, args.jitter, args.bandwidth, args.drop, outages=outages,
+                           outage_mode=args.mode)
+    proxy = FaultProxy(host, int(port), profile, listen_port=args.listen).start()
+    print(f"[FaultProxy] {proxy.url_host} -> {args.upstream} ({profile.describe()})")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"[FaultProxy] t={proxy.elapsed():.0f}s {'OUTAGE ' if proxy.in_outage() else ''}{proxy.stats()}")
+    except KeyboardInterrupt:
+        proxy.stop()
+
+
+if __name__ == "__main__":
+    main()
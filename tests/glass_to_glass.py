@@ -0,0 +1,192 @@
+"""
+Glass-to-glass latency for the RTSP stream.
+
+For each variant, starts src/jetson_usb_rtsp_simple.py with BENCH=1. In that mode it sends
+synthetic frames with the frame number and wall-clock ms drawn as black/white blocks. This
+script pulls rtsp://localhost:<port>/cam, decodes it, reads the stamp back and reports
+per-frame latency, jitter and drops as a comparison table.
+
+Latency is measured from the frame being handed to the encoder until it is decoded here.
+Camera exposure/USB transfer and display vsync are not included, so add those on top.
+The server and client must run on the same machine (same clock).
+
+Examples (from the project root, with the system GStreamer python):
+    python3 tests/glass_to_glass.py --duration 15 \\
+        --variants "fps=30,bitrate=4000,keyint=30" "fps=30,bitrate=2000,keyint=60" "fps=15,bitrate=2000,keyint=15"
+
+    # Measure a server you started yourself: BENCH=1 python3 src/jetson_usb_rtsp_simple.py
+    python3 tests/glass_to_glass.py --url rtsp://localhost:8554/cam
+
+The stamp needs frames at least 512 px wide; narrower variants are rejected.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from jetson_usb_rtsp_simple import STAMP_MIN_WIDTH, read_stamp
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(__file__), "..", "src", "jetson_usb_rtsp_simple.py")
+VARIANT_KEYS = {"fps": "FPS", "bitrate": "BITRATE", "keyint": "KEY_INT_MAX", "width": "WIDTH", "height": "HEIGHT"}
+
+
+def parse_variant(text):
+    """"fps=30,bitrate=4000,keyint=30" -> env dict for the server."""
+    env = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        if key.strip() not in VARIANT_KEYS:
+            raise ValueError(f"unknown variant key {key!r} (use {', '.join(VARIANT_KEYS)})")
+        env[VARIANT_KEYS[key.strip()]] = value.strip()
+    if "WIDTH" in env and int(env["WIDTH"]) < STAMP_MIN_WIDTH:
+        raise ValueError(f"width {env['WIDTH']} is below {STAMP_MIN_WIDTH}, the frame stamp would not fit")
+    return env
+
+
+class LatencyClient:
+    def __init__(self, url, decoder):
+        self.url = url
+        self.latencies = []   # ms
+        self.frames = 0
+        self.drops = 0
+        self.bad_stamps = 0
+        self.last_frame = None
+        self.first_time = None
+        self.pipeline = Gst.parse_launch(
+            f'rtspsrc location={url} latency=0 ! rtph264depay ! h264parse ! {decoder} ! '
+            'videoconvert ! video/x-raw,format=GRAY8 ! '
+            'appsink name=sink emit-signals=true sync=false max-buffers=4 drop=false'
+        )
+        self.pipeline.get_by_name('sink').connect('new-sample', self._on_sample)
+
+    def _on_sample(self, sink):
+        now_ms = int(time.time() * 1000) & 0xFFFFFFFF
+        sample = sink.emit('pull-sample')
+        width = sample.get_caps().get_structure(0).get_value('width')
+        if width < STAMP_MIN_WIDTH:
+            self.bad_stamps += 1  # No room for the stamp
+            return Gst.FlowReturn.OK
+        buf = sample.get_buffer()
+        ok, info = buf.map(Gst.MapFlags.READ)
+        if not ok:
+            return Gst.FlowReturn.OK
+        try:
+            frame_no, stamp_ms = read_stamp(info.data, width)
+        finally:
+            buf.unmap(info)
+
+        latency = (now_ms - stamp_ms) & 0xFFFFFFFF
+        if latency > 60000:
+            self.bad_stamps += 1  # Stamp blocks smeared by the encoder (bitrate too low?)
+            return Gst.FlowReturn.OK
+        if self.first_time is None:
+            self.first_time = time.monotonic()
+        self.frames += 1
+        self.latencies.append(latency)
+        if self.last_frame is not None and frame_no > self.last_frame + 1:
+            self.drops += frame_no - self.last_frame - 1
+        self.last_frame = frame_no
+        return Gst.FlowReturn.OK
+
+    def run(self, duration):
+        loop = GLib.MainLoop()
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message::error', lambda bus, msg: (print(f"[G2G] {msg.parse_error()[0].message}"), loop.quit()))
+        self.pipeline.set_state(Gst.State.PLAYING)
+        GLib.timeout_add(int(duration * 1000), loop.quit)
+        loop.run()
+        self.pipeline.set_state(Gst.State.NULL)
+
+    def report(self):
+        values = sorted(self.latencies)
+        if not values:
+            return {"frames": 0, "bad_stamps": self.bad_stamps}
+        # Jitter: mean absolute difference between consecutive frame latencies (RFC 3550 style)
+        diffs = [abs(b - a) for a, b in zip(self.latencies, self.latencies[1:])]
+        elapsed = time.monotonic() - self.first_time
+        return {
+            "frames": self.frames,
+            "fps": self.frames / elapsed if elapsed else 0.0,
+            "p50_ms": values[len(values) // 2],
+            "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max_ms": values[-1],
+            "jitter_ms": sum(diffs) / len(diffs) if diffs else 0.0,
+            "drops": self.drops,
+            "drop_pct": 100.0 * self.drops / (self.frames + self.drops),
+            "bad_stamps": self.bad_stamps,
+        }
+
+
+def run_variant(name, env, args, port):
+    server_env = dict(os.environ, BENCH="1", PORT=str(port), MJPEG_PORT="0", RTSP_STATS_PATH="", **env)
+    print(f"[G2G] {name}: starting bench server on port {port}...")
+    server = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=server_env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    try:
+        time.sleep(args.warmup)
+        client = LatencyClient(f"rtsp://127.0.0.1:{port}/cam", args.decoder)
+        client.run(args.duration)
+        return client.report()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def print_table(results):
+    columns = ("frames", "fps", "p50_ms", "p95_ms", "max_ms", "jitter_ms", "drops", "drop_pct", "bad_stamps")
+    width = max(len(name) for name in results) + 2
+    print("variant".ljust(width) + "".join(c.rjust(11) for c in columns))
+    for name, report in results.items():
+        cells = []
+        for column in columns:
+            value = report.get(column)
+            cells.append(("-" if value is None else f"{value:.1f}" if isinstance(value, float) else str(value)).rjust(11))
+        print(name.ljust(width) + "".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RTSP glass-to-glass latency benchmark")
+    parser.add_argument("--variants", nargs="+", default=["fps=30,bitrate=4000,keyint=30"],
+                        help='server parameter sets, e.g. "fps=30,bitrate=4000,keyint=30,width=1280,height=720"')
+    parser.add_argument("--url", help="measure an already running BENCH=1 server instead of starting variants")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds measured per variant")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to let each server start")
+    parser.add_argument("--decoder", default="avdec_h264", help="e.g. nvv4l2decoder on Jetson")
+    parser.add_argument("--base-port", type=int, default=8654)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    try:
+        variants = [(variant, parse_variant(variant)) for variant in args.variants]
+    except ValueError as e:
+        parser.error(str(e))
+
+    Gst.init(None)
+    results = {}
+    if args.url:
+        client = LatencyClient(args.url, args.decoder)
+        client.run(args.duration)
+        results[args.url] = client.report()
+    else:
+        for i, (variant, env) in enumerate(variants):
+            results[variant] = run_variant(variant, env, args, args.base_port + i)
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Load / scenario generator for the alert pipeline (grown out of simulate_user.py).
+
+Runs N simulated devices in this process, each with the real FirebaseService ->
+AlertDispatcher path (target "emulator") or the real IngestService -> AlertDispatcher
+path (target "ingest"), and drives them with configurable event rates, behavior mixes,
+bursts and link/unlink churn. Audio is replaced by a recorder so every dispatched alert
+is counted. Prints a report and exits non-zero when the regression gates fail.
+
+Examples (from the project root):
+    # Local ingest path, 20 devices, 5 events/s each for 30 s
+    python tests/load_generator.py --target ingest --devices 20 --rate 5 --duration 30
+
+    # Firestore emulator (firebase emulators:start --only firestore), with bursts and churn
+    FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python tests/load_generator.py --target emulator \\
+        --devices 5 --rate 2 --burst-size 10 --burst-every 10 --churn-every 15 --max-p95-ms 1500
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.alert_dispatcher import AlertDispatcher
+from services.ingest_service import IngestService, encode_binary
+
+PROJECT_ID = "demo-ck"
+DEFAULT_MIX = "sleepy_eye:3,yawn:2,phone:3,look_away:2"
+
+
+class RecordingAudio:
+    """Stands in for AudioService: counts what would have been played."""
+
+    def __init__(self):
+        self.played = 0
+        self.lock = threading.Lock()
+
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        with self.lock:
+            self.played += 1
+
+    def speak(self, text, priority=0, lang='vi'):
+        pass
+
+
+def parse_mix(text):
+    behaviors, weights = [], []
+    for item in text.split(","):
+        name, _, weight = item.partition(":")
+        behaviors.append(name.strip())
+        weights.append(float(weight or 1))
+    return behaviors, weights
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+class SimDevice:
+    """One simulated device: the receiving pipeline plus its own event sender thread."""
+
+    def __init__(self, index, args, db=None):
+        self.index = index
+        self.args = args
+        self.db = db
+        self.device_id = f"sim-device-{index:03d}"
+        self.user_id = f"sim-user-{index:03d}"
+        self.audio = RecordingAudio()
+        self.dispatcher = AlertDispatcher(self.audio)
+        self.behaviors, self.weights = parse_mix(args.mix)
+
+        self.sent = 0
+        self.sent_unlinked = 0
+        self.send_errors = 0
+        self.linked = True
+        self.service = None
+        self.ingest = None
+        self.sock = None
+
+    # ---------- Receiving side ----------
+
+    def start(self):
+        if self.args.target == "ingest":
+            port = self.args.base_port + self.index
+            self.ingest = IngestService(self.dispatcher, udp_port=port, unix_path=None)
+            self.ingest.start()
+            self.addr = ("127.0.0.1", port)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            from services.doc_cache import DocCache
+            from services.firebase_service import FirebaseService
+
+            self.db.collection("users").document(self.user_id).set({"fullName": f"Sim {self.index}"})
+            self.link(True)
+            self.service = FirebaseService(
+                cred_path=None, device_id=self.device_id, audio_service=self.audio, db=self.db,
+                cache=DocCache(os.path.join(tempfile.gettempdir(), f"ck-load-{self.device_id}.json")),
+            )
+            self.service.dispatcher = self.dispatcher
+            self.service.start_listening()
+
+    def stop(self):
+        if self.ingest:
+            self.ingest.stop()
+        if self.service:
+            self.service.stop_listening()
+
+    def link(self, linked):
+        self.linked = linked
+        self.db.collection("devices").document(self.device_id).set({
+            "deviceId": self.device_id,
+            "linkedUserId": self.user_id if linked else None,
+            "status": "activate" if linked else "deactivate",
+            "linkedAt": datetime.datetime.now().isoformat() if linked else None,
+        }, merge=True)
+
+    # ---------- Sending side ----------
+
+    def send_one(self):
+        behavior = random.choices(self.behaviors, self.weights)[0]
+        level = random.randint(1, 3) if behavior == "sleepy_eye" else 1
+        priority = {"sleepy_eye": 1, "phone": 2, "look_away": 2}.get(behavior, 3)
+        event_id = str(uuid.uuid4())
+        try:
+            if self.args.target == "ingest":
+                self.sock.sendto(encode_binary(behavior, level, priority, event_id), self.addr)
+            else:
+                from google.cloud import firestore
+                self.db.collection("users").document(self.user_id).collection("histories").document(event_id).set({
+                    "behavior": behavior,
+                    "priority": priority,
+                    "level": level,
+                    "eventId": event_id,
+                    "timestamp": datetime.datetime.now(datetime.timezone.utc),
+                    "serverTime": firestore.SERVER_TIMESTAMP,
+                })
+            if self.linked:
+                self.sent += 1
+            else:
+                self.sent_unlinked += 1
+        except Exception as e:
+            self.send_errors += 1
+            if self.send_errors <= 3:
+                print(f"[Load] {self.device_id} send error: {e}")
+
+    def run(self, stop_at):
+        args = self.args
+        next_burst = time.time() + args.burst_every if args.burst_size else None
+        next_churn = time.time() + args.churn_every if args.churn_every and self.db else None
+        while time.time() < stop_at:
+            # Poisson arrivals at args.rate events/s
+            time.sleep(random.expovariate(args.rate) if args.rate > 0 else 1.0)
+            if args.rate > 0:
+                self.send_one()
+
+            now = time.time()
+            if next_burst and now >= next_burst:
+                for _ in range(args.burst_size):
+                    self.send_one()
+                next_burst = now + args.burst_every
+            if next_churn and now >= next_churn:
+                # Unlink for a couple of seconds, then relink (alerts in between are expected to drop)
+                self.link(False)
+                time.sleep(args.churn_pause)
+                self.link(True)
+                time.sleep(1.0)  # let the device resubscribe before counting sends as "linked"
+                next_churn = time.time() + args.churn_every
+
+
+def build_report(devices, elapsed):
+    sent = sum(d.sent for d in devices)
+    played = sum(d.audio.played for d in devices)
+    latencies = []
+    duplicates = 0
+    for d in devices:
+        for source, samples in d.dispatcher.latencies.items():
+            if ":" not in source:
+                latencies.extend(samples)
+        duplicates += sum(v for (src, kind), v in d.dispatcher.counts.items() if kind == "duplicate")
+    latencies.sort()
+
+    return {
+        "devices": len(devices),
+        "elapsed_s": round(elapsed, 2),
+        "sent": sent,
+        "sent_while_unlinked": sum(d.sent_unlinked for d in devices),
+        "send_errors": sum(d.send_errors for d in devices),
+        "played": played,
+        "duplicates_dropped": duplicates,
+        "dropped": max(0, sent - played),
+        "delivery_ratio": (played / sent) if sent else 1.0,
+        "throughput_eps": played / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": (percentile(latencies, 0.50) or 0) * 1000,
+            "p95": (percentile(latencies, 0.95) or 0) * 1000,
+            "p99": (percentile(latencies, 0.99) or 0) * 1000,
+            "max": (latencies[-1] if latencies else 0) * 1000,
+            "samples": len(latencies),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert pipeline load generator")
+    parser.add_argument("--target", choices=("ingest", "emulator"), default="ingest")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=2.0, help="events per second per device")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="behavior:weight,...")
+    parser.add_argument("--burst-size", type=int, default=0)
+    parser.add_argument("--burst-every", type=float, default=10.0)
+    parser.add_argument("--churn-every", type=float, default=0.0, help="unlink/relink period (emulator only)")
+    parser.add_argument("--churn-pause", type=float, default=2.0)
+    parser.add_argument("--base-port", type=int, default=16000)
+    parser.add_argument("--drain", type=float, default=5.0, help="seconds to wait for in-flight alerts")
+    parser.add_argument("--report", help="write the JSON report to this file")
+    # Regression gates
+    parser.add_argument("--min-delivery", type=float, default=0.99)
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--min-throughput", type=float, default=None, help="played events/s, all devices")
+    args = parser.parse_args()
+
+    db = None
+    if args.target == "emulator":
+        if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            print("[Load] Set FIRESTORE_EMULATOR_HOST (never run load against the real project).")
+            sys.exit(2)
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore
+        db = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+
+    print(f"[Load] Starting {args.devices} simulated devices ({args.target})...")
+    devices = [SimDevice(i, args, db) for i in range(args.devices)]
+    for device in devices:
+        device.start()
+    time.sleep(3 if db else 0.2)  # listeners attach
+
+    start = time.time()
+    stop_at = start + args.duration
+    threads = [threading.Thread(target=d.run, args=(stop_at,), daemon=True) for d in devices]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"[Load] Load finished, draining for {args.drain}s...")
+    time.sleep(args.drain)
+    elapsed = time.time() - start - args.drain
+
+    report = build_report(devices, elapsed)
+    for device in devices:
+        device.stop()
+
+    print("[Load] ---------------- Report ----------------")
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if report["delivery_ratio"] < args.min_delivery:
+        failures.append(f"delivery {report['delivery_ratio']:.3f} < {args.min_delivery}")
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        failures.append(f"p95 {report['latency_ms']['p95']:.1f}ms > {args.max_p95_ms}ms")
+    if args.min_throughput is not None and report["throughput_eps"] < args.min_throughput:
+        failures.append(f"throughput {report['throughput_eps']:.1f}/s < {args.min_throughput}/s")
+
+    if failures:
+        print("[Load] GATE FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("[Load] Gates passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Alert jitter under encoding load, with and without CPU placement.
+
+An alert probe thread wakes every --period seconds and runs the local alert path
+(decode_message -> AlertDispatcher with a null audio sink). Its lateness (scheduled time to
+dispatch finished) is measured twice: once with default scheduling, once with
+PlacementManager applying the RTSP / SOS roles from DEFAULT_PLACEMENT (or --config).
+
+Load is the real software encoder (gst-launch-1.0 videotestsrc ! x264enc ! fakesink) with
+--load gst, else one busy process per CPU standing in for x264 threads.
+
+Examples (from the project root, on the Nano; run as root so nice/real-time can be raised):
+    sudo python3 tests/placement_jitter.py --load gst --seconds 20
+    python tests/placement_jitter.py --seconds 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.alert_dispatcher import AlertDispatcher
+from services.ingest_service import decode_message, encode_binary
+from services.placement import DEFAULT_PLACEMENT, PlacementManager
+
+GST_PIPELINE = ("videotestsrc is-live=true ! video/x-raw,width=1280,height=720,framerate=30/1 ! "
+                "x264enc tune=zerolatency speed-preset=ultrafast ! fakesink")
+
+
+class NullAudio:
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        return "played"
+
+
+def burn():
+    x = 0
+    while True:
+        x = (x * 1103515245 + 12345) & 0x7FFFFFFF
+
+
+def start_load(kind):
+    if kind == "gst":
+        if not shutil.which("gst-launch-1.0"):
+            print("[PlacementJitter] gst-launch-1.0 not found.")
+            sys.exit(2)
+        return [subprocess.Popen(["gst-launch-1.0", "-q"] + GST_PIPELINE.split(),
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    processes = []
+    for _ in range(os.cpu_count() or 1):
+        process = multiprocessing.Process(target=burn, daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_load(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        if hasattr(process, "wait"):
+            process.wait()
+        else:
+            process.join()
+
+
+def probe(seconds, period, results):
+    dispatcher = AlertDispatcher(NullAudio())
+    dispatcher.DEDUP_WINDOW = 0.0
+    lateness = []
+    deadline = time.monotonic() + period
+    end = time.monotonic() + seconds
+    n = 0
+    while deadline < end:
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        message = decode_message(encode_binary("sleepy_eye", 2, 1, None))
+        dispatcher.dispatch(message["behavior"], message["level"], message["priority"], f"probe-{n}", "local")
+        lateness.append(time.monotonic() - deadline)
+        n += 1
+        deadline += period
+    results.extend(lateness)
+
+
+def run_phase(args, placed):
+    load = start_load(args.load)
+    time.sleep(1.0)  # Let the load settle
+    lateness = []
+    thread = threading.Thread(target=probe, args=(args.seconds, args.period, lateness), name="SosMonitor")
+    manager = None
+    thread.start()
+    if placed:
+        manager = PlacementManager(args.placement)
+        for process in load:
+            manager.register_process("rtsp", process.pid)
+        manager.apply()
+    thread.join()
+    report = manager.report() if manager else None
+    stop_load(load)
+
+    ordered = sorted(lateness)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+    return {
+        "phase": "placed" if placed else "default",
+        "samples": len(ordered),
+        "p50_ms": pick(0.5),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000,
+        "over_5ms": sum(1 for x in ordered if x > 0.005),
+        "errors": report["errors"] if report else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert jitter with and without CPU placement")
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--period", type=float, default=0.01)
+    parser.add_argument("--load", choices=("burn", "gst"), default="burn")
+    parser.add_argument("--config", help="JSON file with a placement config (default: DEFAULT_PLACEMENT)")
+    args = parser.parse_args()
+    args.placement = DEFAULT_PLACEMENT
+    if args.config:
+        with open(args.config) as f:
+            args.placement = json.load(f)
+
+    results = [run_phase(args, placed=False), run_phase(args, placed=True)]
+    print("[PlacementJitter] ---------------- Report ----------------")
+    print(f"  CPUs {os.cpu_count()}, load {args.load}, period {args.period * 1000:.0f} ms")
+    print(f"  {'phase':<8} {'samples':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'>5 ms':>6}")
+    for r in results:
+        print(f"  {r['phase']:<8} {r['samples']:>7} {r['p50_ms']:8.2f} {r['p99_ms']:8.2f} {r['max_ms']:8.2f} "
+              f"{r['over_5ms']:>6}")
+        for role, error in r["errors"].items():
+            print(f"    {role}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Dead-zone simulation for FirebaseService against the Firestore emulator.
+
+Starts the Firebase emulator, links a simulated user, sends alerts, stops the emulator
+(exporting its data) for OUTAGE_SECONDS, restarts it from the export and sends more alerts.
+Checks that every alert is played exactly once and prints the connectivity metrics.
+
+Requires the Firebase CLI (`npm i -g firebase-tools`) and google-cloud-firestore.
+Run from the project root:
+    python tests/simulate_dead_zone.py
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.connectivity import ConnectivityManager
+from services.doc_cache import DocCache
+from services.firebase_service import FirebaseService
+
+# Config
+EMULATOR_HOST = "127.0.0.1:8080"
+PROJECT_ID = "demo-ck"
+DEVICE_ID = "jetson-nano-deadzone"
+USER_ID = "test_user_deadzone"
+OUTAGE_SECONDS = 20
+ALERTS_BEFORE = 3
+ALERTS_AFTER = 5
+
+
+class RecordingAudio:
+    """Stands in for AudioService: records what would have been played."""
+
+    def __init__(self):
+        self.played = []
+
+    def play_sound(self, behavior, level, priority=None, event_id=None):
+        self.played.append((behavior, level, priority, time.time()))
+
+    def speak(self, text, priority=0, lang='vi'):
+        pass
+
+
+def start_emulator(data_dir):
+    cmd = ["firebase", "emulators:start", "--only", "firestore", "--project", PROJECT_ID,
+           "--import", data_dir, "--export-on-exit", data_dir]
+    print(f"[Sim] Starting emulator: {' '.join(cmd)}")
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    time.sleep(8)  # The emulator JVM takes a few seconds to listen
+    return proc
+
+
+def stop_emulator(proc):
+    print("[Sim] Stopping emulator (exporting data)...")
+    os.killpg(proc.pid, signal.SIGINT)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+
+
+def add_alerts(db, count, tag):
+    from google.cloud import firestore
+    histories = db.collection("users").document(USER_ID).collection("histories")
+    for i in range(count):
+        histories.add({
+            "behavior": "phone",
+            "priority": 2,
+            "level": 1,
+            "tag": f"{tag}-{i}",
+            "timestamp": datetime.datetime.now(datetime.timezone.utc),
+            "serverTime": firestore.SERVER_TIMESTAMP,
+        })
+
+
+def wait_for(predicate, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    os.environ["FIRESTORE_EMULATOR_HOST"] = EMULATOR_HOST
+    from google.auth.credentials import AnonymousCredentials
+    from google.cloud import firestore
+
+    data_dir = tempfile.mkdtemp(prefix="ck-emulator-")
+    emulator = start_emulator(data_dir)
+
+    db = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+    db.collection("users").document(USER_ID).set({"fullName": "Dead Zone Tester"})
+    db.collection("devices").document(DEVICE_ID).set({
+        "deviceId": DEVICE_ID,
+        "linkedUserId": USER_ID,
+        "status": "activate",
+    })
+
+    audio = RecordingAudio()
+    service = FirebaseService(
+        cred_path=None, device_id=DEVICE_ID, audio_service=audio, db=db,
+        cache=DocCache(os.path.join(data_dir, "cache.json")),
+    )
+    service.connectivity = ConnectivityManager(
+        probe=service._probe_device_listener, check_interval=1.0, probe_interval=3.0, backoff_max=8.0,
+    )
+    service.start_listening()
+
+    ok = True
+    try:
+        wait_for(lambda: service.linked_user_id == USER_ID, 10)
+        time.sleep(1)
+        add_alerts(db, ALERTS_BEFORE, "before")
+        if not wait_for(lambda: len(audio.played) >= ALERTS_BEFORE, 10):
+            print(f"[Sim] FAIL: only {len(audio.played)}/{ALERTS_BEFORE} alerts before outage")
+            ok = False
+
+        stop_emulator(emulator)
+        print(f"[Sim] Emulator down for {OUTAGE_SECONDS}s...")
+        time.sleep(OUTAGE_SECONDS)
+        print(f"[Sim] During outage: {service.connectivity.stats()}")
+
+        emulator = start_emulator(data_dir)
+        restart_time = time.time()
+        add_alerts(db, ALERTS_AFTER, "after")
+
+        expected = ALERTS_BEFORE + ALERTS_AFTER
+        if wait_for(lambda: len(audio.played) >= expected, 60):
+            print(f"[Sim] All alerts delivered {time.time() - restart_time:.1f}s after emulator restart")
+        else:
+            print(f"[Sim] FAIL: {len(audio.played)}/{expected} alerts after recovery")
+            ok = False
+
+        time.sleep(3)
+        if len(audio.played) > expected:
+            print(f"[Sim] FAIL: {len(audio.played) - expected} alerts replayed")
+            ok = False
+    finally:
+        service.stop_listening()
+        stop_emulator(emulator)
+
+    stats = service.connectivity.stats()
+    print("[Sim] ---------- Connectivity metrics ----------")
+    for key, value in stats.items():
+        print(f"[Sim] {key}: {value}")
+    print("[Sim] PASS" if ok else "[Sim] FAILED")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
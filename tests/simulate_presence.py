@@ -0,0 +1,151 @@
+"""
+Drives PresenceService through a scripted day-in-the-life on a simulated clock and reports
+how many heartbeat writes it made compared with a naive set() every min_interval.
+
+The default target is an in-memory stand-in document. With --emulator the same writes go to
+presence/<device> on the Firestore emulator, and the stored document is checked against
+the stand-in.
+
+Examples (from the project root):
+    python tests/simulate_presence.py
+    FIRESTORE_EMULATOR_HOST=127.0.0.1:8080 python tests/simulate_presence.py --emulator
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from services.presence_service import PresenceService, fix_state
+
+PROJECT_ID = "demo-ck"
+
+
+class RecordingDoc:
+    """Stand-in for a DocumentReference: merges set() calls and logs them with the sim time."""
+
+    def __init__(self, clock, forward=None):
+        self.clock = clock
+        self.forward = forward
+        self.data = {}
+        self.log = []
+
+    def set(self, data, merge=False):
+        if self.forward is not None:
+            self.forward.set(data, merge=merge)
+        if not merge:
+            self.data = {}
+        self.data.update(data)
+        self.log.append((self.clock(), sorted(data)))
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scripted_state(t):
+    """Device state at sim time t (seconds)."""
+    rtsp = "exited" if 1800 <= t < 1830 else "running"
+    if t < 40:
+        gps = "none"
+    elif 3600 <= t < 3720:
+        gps = fix_state(3 if int(t / 20) % 2 else 30)  # Flapping fix under a bridge
+    elif 5000 <= t < 5400:
+        gps = "stale"
+    else:
+        gps = "fresh"
+    return {
+        "online": True,
+        "linkedUserId": None if t < 120 else "sim-user",
+        "rtsp": rtsp,
+        "gps": gps,
+        "sosOutbox": 1 if 4000 <= t < 4090 else 0,
+        "acksPending": int(t / 7) % 3,
+        "uptimeSeconds": int(t),
+        "alertsPlayed": int(t / 90),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presence heartbeat simulation")
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--min-interval", type=float, default=30.0)
+    parser.add_argument("--max-interval", type=float, default=300.0)
+    parser.add_argument("--check-interval", type=float, default=5.0)
+    parser.add_argument("--emulator", action="store_true", help="also write to the Firestore emulator")
+    parser.add_argument("--device", default="sim-presence")
+    args = parser.parse_args()
+
+    clock = SimClock()
+    remote = None
+    if args.emulator:
+        if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            print("[Presence] Set FIRESTORE_EMULATOR_HOST (never run this against the real project).")
+            sys.exit(2)
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore
+        db = firestore.Client(project=PROJECT_ID, credentials=AnonymousCredentials())
+        remote = db.collection("presence").document(args.device)
+        remote.delete()
+
+    doc = RecordingDoc(clock, forward=remote)
+    presence = PresenceService(doc, lambda: scripted_state(clock.now), min_interval=args.min_interval,
+                               max_interval=args.max_interval, check_interval=args.check_interval,
+                               volatile=("uptimeSeconds", "alertsPlayed", "acksPending"), clock=clock)
+
+    duration = args.hours * 3600
+    changes = []  # sim times where a stable field changed
+    previous = None
+    while clock.now <= duration:
+        stable = {k: v for k, v in scripted_state(clock.now).items() if k not in presence.volatile}
+        if stable != previous:
+            changes.append(clock.now)
+            previous = stable
+        presence.tick()
+        clock.now += args.check_interval
+
+    write_times = [t for t, _ in doc.log]
+    gaps = [b - a for a, b in zip(write_times, write_times[1:])]
+    # Delay from each state change to the first write at or after it
+    delays = [min(w for w in write_times if w >= c) - c for c in changes if any(w >= c for w in write_times)]
+    naive = int(duration / args.min_interval) + 1
+    report = {
+        "sim_hours": args.hours,
+        "writes": len(doc.log),
+        "naive_writes": naive,
+        "saving_pct": 100.0 * (1 - len(doc.log) / naive),
+        "avg_fields_per_write": sum(len(fields) for _, fields in doc.log) / max(1, len(doc.log)),
+        "max_gap_s": max(gaps) if gaps else None,
+        "state_changes": len(changes),
+        "max_change_to_write_s": max(delays) if delays else None,
+    }
+    print("[Presence] ---------------- Report ----------------")
+    for key, value in report.items():
+        print(f"  {key:22s}: {value:.1f}" if isinstance(value, float) else f"  {key:22s}: {value}")
+
+    failures = []
+    if report["max_gap_s"] is not None and report["max_gap_s"] > args.max_interval + args.check_interval:
+        failures.append(f"heartbeat gap {report['max_gap_s']}s > max interval")
+    if report["max_change_to_write_s"] is not None and \
+            report["max_change_to_write_s"] > args.min_interval + args.check_interval:
+        failures.append(f"change reported after {report['max_change_to_write_s']}s")
+    if remote is not None:
+        stored = remote.get().to_dict() or {}
+        mismatched = [k for k, v in doc.data.items() if k != "lastSeen" and stored.get(k) != v]
+        if mismatched:
+            failures.append(f"emulator document differs in {mismatched}")
+        else:
+            print(f"[Presence] Emulator document matches the stand-in ({len(stored)} fields).")
+
+    if failures:
+        print("[Presence] FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("[Presence] OK")
+
+
+if __name__ == "__main__":
+    main()
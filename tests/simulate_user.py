@@ -51,7 +51,8 @@ def main():
         "behavior": "yawn",
         "priority": 3,
         "level": 1,
-        "timestamp": datetime.datetime.now()
+        "timestamp": datetime.datetime.now(),
+        "serverTime": firestore.SERVER_TIMESTAMP,
     })
     print("[Sim] Waiting 5 seconds...")
     time.sleep(5)
@@ -62,7 +63,8 @@ def main():
         "behavior": "phone",
         "priority": 2,
         "level": 1,
-        "timestamp": datetime.datetime.now()
+        "timestamp": datetime.datetime.now(),
+        "serverTime": firestore.SERVER_TIMESTAMP,
     })
     print("[Sim] Waiting 5 seconds...")
     time.sleep(5)
@@ -73,7 +75,8 @@ def main():
         "behavior": "sleepy_eye",
         "priority": 1,
         "level": 3,
-        "timestamp": datetime.datetime.now()
+        "timestamp": datetime.datetime.now(),
+        "serverTime": firestore.SERVER_TIMESTAMP,
     })
     print("[Sim] Waiting 5 seconds...")
     time.sleep(5)
@@ -84,7 +87,8 @@ def main():
         "behavior": "look_away",
         "priority": 2,
         "level": 1,
-        "timestamp": datetime.datetime.now()
+        "timestamp": datetime.datetime.now(),
+        "serverTime": firestore.SERVER_TIMESTAMP,
     })
     
     print("[Sim] Simulation steps completed.")